@@ -1,7 +1,23 @@
+import importlib
 import importlib.metadata
 
-from .assistant import Assistant
-from .typer import TyperAssistant, register_assistant
+from .register import register_assistant
 
-__version__ = importlib.metadata.version(__name__)
-__all__ = ("TyperAssistant", "Assistant", "register_assistant")
+# Everything but register_assistant is imported on first use, so that registering an assistant on a CLI doesn't cost
+# every command of that CLI the time it takes to import openai.
+_lazy = {
+    "Assistant": ".assistant",
+    "TyperAssistant": ".typer",
+    "AsyncAssistant": ".aio",
+    "AsyncTyperAssistant": ".aio",
+}
+
+__all__ = ("TyperAssistant", "Assistant", "AsyncAssistant", "AsyncTyperAssistant", "register_assistant")
+
+
+def __getattr__(name: str):
+    if name in _lazy:
+        return getattr(importlib.import_module(_lazy[name], __name__), name)
+    if name == "__version__":
+        return importlib.metadata.version(__name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
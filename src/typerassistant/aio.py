@@ -0,0 +1,423 @@
+"""Asyncio-native assistants, built on AsyncOpenAI.
+
+These mirror Assistant and TyperAssistant, sharing their function specs and function calling machinery, but every
+API request is awaited so that many asks can share a single event loop.
+"""
+from __future__ import annotations
+
+import asyncio
+import sys
+from collections.abc import AsyncIterator, Hashable
+from dataclasses import KW_ONLY, dataclass, field
+from typing import Iterable, Literal, Optional, Type, TypeVar
+
+import openai
+import typer
+from openai import AsyncOpenAI
+from openai.types.beta.thread import Thread
+from openai.types.beta.threads import RequiredActionFunctionToolCall, Run
+from openai.types.beta.threads.run_submit_tool_outputs_params import ToolOutput
+from openai.types.beta.threads.thread_message import ThreadMessage
+
+from .assistant import (
+    ACTIVE_RUN_STATUSES,
+    CANCEL_TIMEOUT,
+    RUN_TIMEOUT,
+    BaseAssistant,
+    RemoteAssistant,
+    RunEvent,
+    message_cursor,
+    newest_reply,
+)
+from .clients import async_client
+from .polling import Deadline
+from .resilience import CircuitOpenError
+from .spec import FunctionSpec
+from .typer import app_fingerprint, cached_typerfunc
+
+AsyncAssistantT = TypeVar("AsyncAssistantT", bound="AsyncAssistant")
+
+
+@dataclass
+class AsyncAssistant(BaseAssistant):
+    """An assistant managed remotely via OpenAI's assistant API, using asyncio.
+
+    See Assistant for details; the methods here are the awaitable equivalents.
+    """
+
+    _: KW_ONLY
+    client: AsyncOpenAI = field(default_factory=async_client)
+
+    @classmethod
+    async def from_id(
+        cls: Type[AsyncAssistantT], assistant_id: str, client: Optional[AsyncOpenAI] = None
+    ) -> AsyncAssistantT:
+        """Retrieve the assistant with the given ID from OpenAI.
+
+        This method will skip all assistant creation steps and simply use the remote definition."""
+        if client is None:
+            client = async_client()
+        assistant = await client.beta.assistants.retrieve(assistant_id)
+        return cls(
+            client=client,
+            name=assistant.name or "Unnamed Assistant",
+            instructions=assistant.instructions or cls.instructions,
+            _assistant=assistant,
+        )
+
+    async def get_assistant(self) -> RemoteAssistant:
+        """Returns the remote assistant, making it if needed. This is the async counterpart to Assistant.assistant."""
+        if self._assistant is None:
+            with self.span("make_assistant"):
+                self._assistant = await self.make_assistant(self.replace)
+        return self._assistant
+
+    async def ask(
+        self,
+        query: str,
+        thread: Optional[Thread] = None,
+        use_commands: bool = True,
+        confirm_commands: bool = True,
+        instructions: Optional[str] = None,
+        timeout: Optional[float] = RUN_TIMEOUT,
+    ) -> str:
+        """Ask the assistant a question, returning the response.
+
+        If a thread is not provided, a new one will be made. See Assistant.ask() for more details, including when the
+        response cache is used.
+        """
+        with self.span("ask"):
+            key = None
+            if self.uses_response_cache(thread, use_commands):
+                assert self.response_cache is not None
+                key = self.response_key((await self.get_assistant()).id, query, instructions)
+                if (cached := self.response_cache.get(key)) is not None:
+                    return cached
+            async for event in self.ask_stream(
+                query,
+                thread=thread,
+                use_commands=use_commands,
+                confirm_commands=confirm_commands,
+                instructions=instructions,
+                timeout=timeout,
+            ):
+                if event.event == "text":
+                    if key is not None:
+                        self.response_cache.set(key, event.data)
+                    return event.data
+        raise RuntimeError("Run completed without a response")
+
+    async def ask_stream(
+        self,
+        query: str,
+        thread: Optional[Thread] = None,
+        use_commands: bool = True,
+        confirm_commands: bool = True,
+        instructions: Optional[str] = None,
+        timeout: Optional[float] = RUN_TIMEOUT,
+    ) -> AsyncIterator[RunEvent]:
+        """Ask the assistant a question, yielding RunEvents as the run progresses.
+
+        See Assistant.ask_stream() for more details.
+        """
+        if thread is None:
+            with self.span("thread.create"):
+                thread = await self.thread()
+        with self.span("message.create"):
+            message = await self.add_message(query, thread)
+        run = None
+        async for event in self.run_events(thread, use_commands, confirm_commands, instructions, timeout, query):
+            run = event.run
+            yield event
+        assert run is not None
+        with self.span("messages.list"):
+            reply = await self.reply(thread, run, after=message.id)
+        yield RunEvent("text", run, self.message_text(reply))
+
+    async def thread(self, thread_id: Optional[str] = None) -> Thread:
+        """Retrieves the thread, or creates one if none exists."""
+        if thread_id is None:
+            return await self.resilience.acall("threads.create", self.client.beta.threads.create)
+        return await self.resilience.acall("threads.retrieve", self.client.beta.threads.retrieve, thread_id)
+
+    async def add_message(self, content: str, thread: Thread) -> ThreadMessage:
+        """Adds a message to the current thread, returning the message."""
+        return await self.resilience.acall(
+            "messages.create",
+            self.client.beta.threads.messages.create,
+            thread_id=thread.id,
+            role="user",
+            content=content,
+        )
+
+    async def messages(
+        self,
+        thread: Thread,
+        order: Literal["asc", "desc"] = "desc",
+        limit: Optional[int] = None,
+        after: Optional[str] = None,
+        before: Optional[str] = None,
+    ) -> AsyncIterator[ThreadMessage]:
+        """Yields the messages of the thread, newest first unless order is "asc". See Assistant.messages()."""
+        cursor = message_cursor(order, limit, after, before)
+        async for message in await self.resilience.acall(
+            "messages.list", self.client.beta.threads.messages.list, thread_id=thread.id, **cursor
+        ):
+            yield message
+
+    async def reply(self, thread: Thread, run: Run, after: Optional[str] = None) -> ThreadMessage:
+        """Returns the newest message that run added to the thread. See Assistant.reply()."""
+        messages = [message async for message in self.messages(thread, order="asc", after=after)]
+        return newest_reply(messages, thread, run)
+
+    async def run_thread(
+        self,
+        thread: Thread,
+        use_commands: bool,
+        confirm_commands: bool,
+        instructions: Optional[str] = None,
+        timeout: Optional[float] = RUN_TIMEOUT,
+    ):
+        """Runs the current thread, returning when it completes or raising TimeoutError after `timeout` seconds.
+
+        See Assistant.run_thread() for more details.
+        """
+        async for _ in self.run_events(thread, use_commands, confirm_commands, instructions, timeout):
+            pass
+
+    async def run_events(
+        self,
+        thread: Thread,
+        use_commands: bool,
+        confirm_commands: bool,
+        instructions: Optional[str] = None,
+        timeout: Optional[float] = RUN_TIMEOUT,
+        query: Optional[str] = None,
+    ) -> AsyncIterator[RunEvent]:
+        """Runs the current thread like run_thread(), yielding a RunEvent as each step of the run happens.
+
+        See Assistant.run_events() for the meaning of query, when the run is cancelled, and the spans reported to an
+        observer. Cancelling the task running this also cancels the run.
+        """
+        kwargs = self.run_kwargs(use_commands, instructions, query)
+        deadline = Deadline(timeout)
+        assistant = await self.get_assistant()
+        run_span = self.start_span("run")
+        status_span = None
+        error = None
+        run: Optional[Run] = None
+        try:
+            with self.span("run.create", run_span):
+                run = await self.resilience.acall(
+                    "runs.create",
+                    self.client.beta.threads.runs.create,
+                    deadline=deadline,
+                    thread_id=thread.id,
+                    assistant_id=assistant.id,
+                    **kwargs,
+                )
+            status_span = self.start_span("run.status", run_span, status=run.status)
+            yield RunEvent("status", run)
+
+            intervals = self.polling.intervals()
+            while True:
+                match run.status:
+                    case "queued" | "in_progress":
+                        if deadline.expired():
+                            raise TimeoutError(f"Run {run.id} did not complete within {timeout} seconds")
+                        with self.span("run.sleep", run_span):
+                            await asyncio.sleep(deadline.clamp(next(intervals)))
+                        previous = run.status
+                        with self.span("run.retrieve", run_span):
+                            run = await self.resilience.acall(
+                                "runs.retrieve",
+                                self.client.beta.threads.runs.retrieve,
+                                deadline=deadline,
+                                thread_id=thread.id,
+                                run_id=run.id,
+                            )
+                        if run.status != previous:
+                            self.end_span(status_span)
+                            status_span = self.start_span("run.status", run_span, status=run.status)
+                            yield RunEvent("status", run)
+                        continue
+                    case "completed":
+                        return
+                    case "requires_action":
+                        if not use_commands:
+                            raise RuntimeError("Run requires action but commands are disabled")
+                        assert run.required_action is not None
+                        calls = run.required_action.submit_tool_outputs.tool_calls
+                        yield RunEvent("tool_calls", run, calls)
+                        with self.span("tool_calls", run_span, count=len(calls)):
+                            results = await self.tool_calls(calls, confirm_commands, thread)
+                        yield RunEvent("tool_outputs", run, results)
+                        with self.span("run.submit_tool_outputs", run_span):
+                            run = await self.resilience.acall(
+                                "runs.submit_tool_outputs",
+                                self.client.beta.threads.runs.submit_tool_outputs,
+                                deadline=deadline,
+                                thread_id=thread.id,
+                                run_id=run.id,
+                                tool_outputs=results,
+                            )
+                        self.end_span(status_span)
+                        status_span = self.start_span("run.status", run_span, status=run.status)
+                        yield RunEvent("status", run)
+                        # The model has new work to do, so start polling eagerly again.
+                        intervals = self.polling.intervals()
+                    case "cancelling" | "cancelled" | "failed" | "expired":
+                        raise RuntimeError(f"Run failed with status {run.status}")
+                    case _:
+                        raise RuntimeError(f"Unexpected status {run.status}")
+        except BaseException as e:
+            if not isinstance(e, GeneratorExit):
+                error = e
+            if run is not None and run.status in ACTIVE_RUN_STATUSES:
+                with self.span("run.cancel", run_span):
+                    await self.cancel_run(thread, run)
+            raise
+        finally:
+            self.end_span(status_span, error)
+            self.end_span(run_span, error)
+
+    async def cancel_run(self, thread: Thread, run: Run, timeout: Optional[float] = CANCEL_TIMEOUT) -> Run:
+        """Cancels the run, waiting up to `timeout` seconds for it to stop. See Assistant.cancel_run()."""
+        try:
+            deadline = Deadline(timeout)
+            run = await self.resilience.acall(
+                "runs.cancel",
+                self.client.beta.threads.runs.cancel,
+                deadline=deadline,
+                thread_id=thread.id,
+                run_id=run.id,
+            )
+            intervals = self.polling.intervals()
+            while run.status in (*ACTIVE_RUN_STATUSES, "cancelling") and not deadline.expired():
+                await asyncio.sleep(deadline.clamp(next(intervals)))
+                run = await self.resilience.acall(
+                    "runs.retrieve",
+                    self.client.beta.threads.runs.retrieve,
+                    deadline=deadline,
+                    thread_id=thread.id,
+                    run_id=run.id,
+                )
+        except (openai.OpenAIError, CircuitOpenError):
+            pass
+        return run
+
+    async def tool_calls(
+        self, calls: list[RequiredActionFunctionToolCall], confirm_commands: bool, thread: Optional[Thread] = None
+    ) -> list[ToolOutput]:
+        """Translate a ToolCall API response in to a list of FunctionCalls and do them.
+
+        Commands are ordinary blocking python functions, so they (and the confirmation prompt) run in a worker thread
+        to keep the event loop free for other asks. See Assistant.tool_calls() for more details.
+        """
+        function_calls = self.function_calls(calls)
+        if confirm_commands:
+            await asyncio.to_thread(self.confirm_function_calls, function_calls)
+        thread_id = thread.id if thread is not None else None
+        return await asyncio.to_thread(self.run_function_calls, function_calls, thread_id)
+
+    async def make_assistant(self, replace: bool) -> RemoteAssistant:
+        """Get or create an assistant in the OpenAI API reflecting the current state of this object.
+
+        See Assistant.make_assistant() for more details.
+        """
+        key = None
+        if self.registry is not None:
+            key = self.registry.key(self.name, self.client)
+            if not replace and (registered := await self._registered_assistant(key)) is not None:
+                return await self._updated(registered)
+
+        found = None
+        async for assistant in await self.resilience.acall("assistants.list", self.client.beta.assistants.list):
+            if assistant.name == self.name:
+                if replace:
+                    await self.resilience.acall("assistants.delete", self.client.beta.assistants.delete, assistant.id)
+                else:
+                    found = assistant
+                    break
+        if found is None:
+            found = await self.resilience.acall(
+                "assistants.create", self.client.beta.assistants.create, **self.definition()
+            )
+        else:
+            found = await self._updated(found)
+
+        if self.registry is not None and key is not None:
+            self.registry.set(key, found.id)
+        return found
+
+    async def _updated(self, remote: RemoteAssistant) -> RemoteAssistant:
+        """Returns remote, updating it first if it has drifted from this assistant's definition."""
+        if not self.drifted(remote):
+            return remote
+        return await self.resilience.acall(
+            "assistants.update", self.client.beta.assistants.update, remote.id, **self.update_kwargs(remote)
+        )
+
+    async def _registered_assistant(self, key: str) -> Optional[RemoteAssistant]:
+        """Returns the assistant recorded in self.registry under key, if it still exists."""
+        assert self.registry is not None
+        assistant_id = self.registry.get(key)
+        if assistant_id is None:
+            return None
+        try:
+            assistant = await self.resilience.acall(
+                "assistants.retrieve", self.client.beta.assistants.retrieve, assistant_id
+            )
+        except openai.NotFoundError:
+            assistant = None
+        if assistant is None or assistant.name != self.name:
+            self.registry.forget(key)
+            return None
+        return assistant
+
+    async def delete_assistant(self):
+        """Delete the assistant from OpenAI."""
+        assistant = await self.get_assistant()
+        await self.resilience.acall("assistants.delete", self.client.beta.assistants.delete, assistant.id)
+        if self.registry is not None:
+            self.registry.forget(self.registry.key(self.name, self.client))
+
+
+@dataclass
+class AsyncTyperAssistant(AsyncAssistant):
+    """An AsyncAssistant generated from a Typer app."""
+
+    app: typer.Typer
+    _: KW_ONLY
+    instructions: str = "The agent is an interface to a python Typer CLI. The tools available correspond to typer commands. Please help the user with their queries, executing CLI functions as needed. Be concise, but don't shorten the function names even if they look like file paths."
+    name: str = field(init=False)
+
+    def __post_init__(self):
+        # As with TyperAssistant, we always infer the name
+        self.name = self.app.info.name or sys.argv[0]
+
+    @classmethod
+    async def from_id(
+        cls: Type[AsyncAssistantT], assistant_id: str, client: Optional[AsyncOpenAI] = None
+    ) -> AsyncAssistantT:
+        """from_id is disabled for AsyncTyperAssistant, use from_id_with_app instead."""
+        raise NotImplementedError("from_id is disabled for AsyncTyperAssistant, use from_id_with_app instead.")
+
+    @classmethod
+    async def from_id_with_app(
+        cls, assistant_id: str, app: typer.Typer, client: Optional[AsyncOpenAI] = None
+    ) -> AsyncTyperAssistant:
+        if client is None:
+            client = async_client()
+        assistant = await client.beta.assistants.retrieve(assistant_id)
+        return AsyncTyperAssistant(
+            app=app, client=client, instructions=assistant.instructions or cls.instructions, _assistant=assistant
+        )
+
+    def functions(self) -> Iterable[FunctionSpec]:
+        """Generate FunctionSpecs from the Typer app."""
+        yield from super().functions()
+        yield from cached_typerfunc(self.app)
+
+    def catalogue_version(self) -> Hashable:
+        return app_fingerprint(self.app)
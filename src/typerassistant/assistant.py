@@ -1,30 +1,57 @@
+import hashlib
 import json
+import threading
 import time
-from collections.abc import Iterable
-from contextlib import redirect_stdout
+from collections import OrderedDict
+from collections.abc import Hashable, Iterable, Iterator
+from concurrent.futures import CancelledError, ThreadPoolExecutor, as_completed
+from contextlib import AbstractContextManager, nullcontext
+from contextvars import ContextVar, copy_context
 from dataclasses import KW_ONLY, dataclass, field
-from io import StringIO
 from textwrap import shorten
-from typing import Optional, Type, TypeVar
+from typing import Any, Literal, Optional, Type, TypeVar
 
+import openai
 from openai import OpenAI
 from openai.types.beta.assistant import Assistant as RemoteAssistant
 from openai.types.beta.thread import Thread
-from openai.types.beta.threads import RequiredActionFunctionToolCall
+from openai.types.beta.threads import RequiredActionFunctionToolCall, Run
 from openai.types.beta.threads.run_submit_tool_outputs_params import ToolOutput
 from openai.types.beta.threads.thread_message import ThreadMessage
 from rich import print
 from rich.panel import Panel
 from rich.prompt import Confirm
 
-from .spec import FunctionCall, FunctionSpec
+from . import observe
+from .cache import ResponseCache
+from .capture import OutputLimit, capture_stdout
+from .clients import shared_client
+from .observe import Observer, Span
+from .polling import Deadline, PollingStrategy
+from .ratelimit import TokenBucket
+from .registry import AssistantRegistry
+from .resilience import CircuitOpenError, Resilience, limit_requests
+from .spec import FunctionCall, FunctionCatalogue, FunctionSpec
+from .workers import WorkerPool
 
-# The number of times to poll for a run to complete before giving up
-MAX_RUN_ITERATIONS = 20
+# The default number of seconds an ask may wait on its run before giving up. Time spent running commands (and waiting
+# on the user to confirm them) counts against this.
+RUN_TIMEOUT = 300
 
+# When an ask fails or is interrupted, its run is cancelled, so that it stops spending tokens and frees its thread for
+# the next run. This is how many seconds to wait for the cancellation to take effect.
+CANCEL_TIMEOUT = 10
 
-# The number of seconds to sleep between run iterations
-RUN_ITERATION_SLEEP = 3
+# The statuses of a run which hasn't finished yet, and so should be cancelled if the ask is abandoned.
+ACTIVE_RUN_STATUSES = ("queued", "in_progress", "requires_action")
+
+
+# The number of threads whose cacheable command outputs are remembered at once. See BaseAssistant.run_function_calls().
+MEMO_THREADS = 64
+
+
+# The assistant metadata key holding the hash of the definition an assistant was made from
+DEFINITION_HASH_KEY = "typerassistant_definition_hash"
 
 
 # The best usage guide for function calling seems to be:
@@ -32,21 +59,326 @@ RUN_ITERATION_SLEEP = 3
 
 AssistantT = TypeVar("AssistantT", bound="Assistant")
 
+# Stands in for a span when there is no observer, so that unobserved assistants don't time anything.
+_NO_SPAN = nullcontext()
+
+# Set in each ask of Assistant.ask_many(), and set when the batch is abandoned, to stop the ask and cancel its run.
+_stop: ContextVar[Optional[threading.Event]] = ContextVar("stop", default=None)
+
 
 @dataclass
-class Assistant:
-    """An assistant managed remotely via OpenAI's assistant API.
+class RunEvent:
+    """Something that happened during a run. See Assistant.run_events() and Assistant.ask_stream().
+
+    The event is one of:
+      * "status": the run changed status; see run.status.
+      * "tool_calls": the run requires action; data is the list of RequiredActionFunctionToolCalls.
+      * "tool_outputs": the tool calls were done; data is the list of ToolOutputs about to be submitted.
+      * "text": the run completed; data is the text of the assistant's response.
+    """
 
-    This class implements the basic lifecycle of an assistant, from CRUD to running a thread. It is intended to be
-    subclassed to extend functionality.
+    event: Literal["status", "tool_calls", "tool_outputs", "text"]
+    run: Run
+    data: Any = None
+
+
+@dataclass
+class AskResult:
+    """The outcome of one query of Assistant.ask_many(). Exactly one of response and error is set."""
+
+    index: int
+    query: str
+    response: Optional[str] = None
+    error: Optional[Exception] = None
+
+
+def definition_hash(definition: dict) -> str:
+    """Returns a stable hash of the instructions, model and tools of an assistant definition."""
+    content = {key: definition[key] for key in ("instructions", "model", "tools")}
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+
+def message_cursor(order: str, limit: Optional[int], after: Optional[str], before: Optional[str]) -> dict[str, Any]:
+    """Returns the keyword arguments to messages.list for a page of messages, leaving out those not given."""
+    cursor: dict[str, Any] = {"order": order}
+    for key, value in (("limit", limit), ("after", after), ("before", before)):
+        if value is not None:
+            cursor[key] = value
+    return cursor
+
+
+def newest_reply(messages: Iterable[ThreadMessage], thread: Thread, run: Run) -> ThreadMessage:
+    """Returns the last of messages (in ascending order) which the assistant wrote during run."""
+    reply = None
+    for message in messages:
+        if message.role == "assistant" and message.run_id == run.id:
+            reply = message
+    if reply is None:
+        raise RuntimeError(f"Run {run.id} added no messages to thread {thread.id}")
+    return reply
+
+
+def _memo_key(call: FunctionCall) -> tuple[str, str]:
+    return call.function.name, json.dumps(call.parameters, sort_keys=True, default=str)
+
+
+@dataclass
+class BaseAssistant:
+    """The client-independent parts of an assistant: its definition, its functions, and running function calls.
+
+    Assistant and AsyncAssistant share this so that the synchronous and asynchronous APIs stay in step.
     """
 
     name: str
     _: KW_ONLY
     instructions: str = "The agent is a helpful assistant. Its behavior and capabilities can be extended via the 'typerassistant' python package's API."
-    client: OpenAI = field(default_factory=OpenAI)
     replace: bool = False
+    model: str = "gpt-4-1106-preview"
+    polling: PollingStrategy = field(default_factory=PollingStrategy)
+    # The number of commands that may run at once when the assistant asks for several in one step. Commands run one at
+    # a time by default; only raise this if your commands are safe to run concurrently.
+    tool_workers: int = 1
+    # The budget for each command's captured output. Commands can override it, see typer.assistant_settings().
+    output_limit: Optional[OutputLimit] = field(default_factory=OutputLimit)
+    # Remembers remote assistant IDs locally, to avoid listing every assistant in make_assistant.
+    registry: Optional[AssistantRegistry] = None
+    # Runs commands in separate worker processes instead of in this one. See WorkerPool.
+    worker_pool: Optional[WorkerPool] = None
+    # Receives timing spans for each phase of an ask. See the observe module.
+    observer: Optional[Observer] = None
+    # Reuses responses to repeated asks that don't use commands. See uses_response_cache().
+    response_cache: Optional[ResponseCache] = None
+    # If set, each run is offered only this many of the functions most relevant to the query, instead of all of them.
+    # This keeps runs of large CLIs fast and cheap. See retrieval.ToolIndex.
+    tool_limit: Optional[int] = None
+    # Retries transient API failures, and stops making requests while the API keeps failing. See the resilience module.
+    # A client given to the assistant should be made with max_retries=0, so that its own retries don't multiply these.
+    resilience: Resilience = field(default_factory=Resilience)
     _assistant: Optional[RemoteAssistant] = None
+    _catalogue: Optional[tuple[Hashable, FunctionCatalogue]] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+    # Outputs of cacheable commands, by thread ID and then by call, with the time they were made
+    _memo: OrderedDict[str, dict[tuple[str, str], tuple[str, float]]] = field(
+        default_factory=OrderedDict, init=False, repr=False, compare=False
+    )
+    _memo_lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False, compare=False)
+
+    def functions(self) -> Iterable[FunctionSpec]:
+        """Returns an iterable of FunctionSpecs describing the function calling tools of this assistant."""
+        # The base assistant just returns an empty list but almost any real use case will extend this
+        yield from []
+
+    def catalogue(self) -> FunctionCatalogue:
+        """Returns the functions() of this assistant, indexed by name.
+
+        The catalogue is rebuilt whenever catalogue_version() changes, or on every call if it returns None.
+        """
+        version = self.catalogue_version()
+        if version is None or self._catalogue is None or self._catalogue[0] != version:
+            self._catalogue = (version, FunctionCatalogue(list(self.functions())))
+        return self._catalogue[1]
+
+    def catalogue_version(self) -> Optional[Hashable]:
+        """Returns a value which changes whenever functions() would change, or None if that can't be known."""
+        return None
+
+    def definition(self) -> dict:
+        """Returns the remote definition of this assistant, as keyword arguments to assistants.create."""
+        definition = {
+            "name": self.name,
+            "instructions": self.instructions,
+            "tools": self.catalogue().tools,
+            "model": self.model,
+        }
+        definition["metadata"] = {DEFINITION_HASH_KEY: definition_hash(definition)}
+        return definition
+
+    def drifted(self, remote: RemoteAssistant) -> bool:
+        """Returns True if the remote assistant was made from a different definition than this one."""
+        metadata = remote.metadata if isinstance(remote.metadata, dict) else {}
+        return metadata.get(DEFINITION_HASH_KEY) != self.definition()["metadata"][DEFINITION_HASH_KEY]
+
+    def update_kwargs(self, remote: RemoteAssistant) -> dict:
+        """Returns the keyword arguments to assistants.update that bring remote up to date with this assistant."""
+        definition = self.definition()
+        metadata = remote.metadata if isinstance(remote.metadata, dict) else {}
+        definition["metadata"] = {**metadata, **definition["metadata"]}
+        return definition
+
+    def uses_response_cache(self, thread: Optional[Thread], use_commands: bool) -> bool:
+        """Returns True if the response to an ask may come from, and go in, self.response_cache.
+
+        Only asks in a new thread with commands disabled are cached: a cached response would skip any commands, which
+        may have side effects, and an existing thread carries context that the cache key doesn't.
+        """
+        return self.response_cache is not None and thread is None and not use_commands
+
+    def response_key(self, assistant_id: str, query: str, instructions: Optional[str]) -> str:
+        """Returns the response cache key for a query to the remote assistant with the given ID."""
+        assert self.response_cache is not None
+        effective = instructions if instructions is not None else self.instructions
+        return self.response_cache.key(assistant_id, self.model, effective, query)
+
+    def run_kwargs(self, use_commands: bool, instructions: Optional[str], query: Optional[str] = None) -> dict:
+        """Returns the per-run overrides for runs.create.
+
+        If self.tool_limit is set and the query is known, the run's tools are the tool_limit functions most relevant to
+        the query. The run's tools replace the assistant's for that run, so it can only call those tool_limit functions.
+        """
+        kwargs: dict[str, Any] = {}
+        if not use_commands:
+            kwargs["tools"] = []
+        elif self.tool_limit is not None and query is not None:
+            catalogue = self.catalogue()
+            if self.tool_limit < len(catalogue):
+                kwargs["tools"] = [func.tool() for func in catalogue.search(query, self.tool_limit)]
+        if instructions is not None:
+            kwargs["instructions"] = instructions
+        return kwargs
+
+    def span(self, name: str, parent: Optional[Span] = None, **attributes) -> AbstractContextManager[Optional[Span]]:
+        """Times the body of a with statement as a span reported to self.observer, if there is one."""
+        if self.observer is None:
+            return _NO_SPAN
+        return observe.span(self.observer, name, parent, **attributes)
+
+    def start_span(self, name: str, parent: Optional[Span] = None, **attributes) -> Optional[Span]:
+        """Starts a span reported to self.observer, if there is one. Use this rather than span() across a yield."""
+        if self.observer is None:
+            return None
+        return observe.start_span(self.observer, name, parent, **attributes)
+
+    def end_span(self, span: Optional[Span], error: Optional[BaseException] = None):
+        if self.observer is not None and span is not None:
+            observe.end_span(self.observer, span, error)
+
+    def function_calls(self, calls: list[RequiredActionFunctionToolCall]) -> list[FunctionCall]:
+        """Translate a ToolCall API response in to a list of FunctionCalls."""
+        catalogue = self.catalogue()
+
+        # Build function call list
+        # Here we use "function" to distinguish the openai call description from our
+        # internal function call description.
+        function_calls: list[FunctionCall] = []
+        for call in calls:
+            match call.type:
+                case "function":
+                    name = call.function.name
+                    args = json.loads(call.function.arguments)
+                case _:
+                    raise ValueError(f"Unexpected call type {call.type}")
+
+            function = catalogue.resolve(name)
+            function_calls.append(FunctionCall(call_id=call.id, function=function, parameters=args))
+        return function_calls
+
+    def confirm_function_calls(self, function_calls: list[FunctionCall]):
+        """Show the user the pending function calls, raising RuntimeError if they refuse them."""
+        for i, call in enumerate(function_calls, 1):
+            argtxt = str(call.parameters).strip("{}")
+            command_title = shorten(f"{call.function.name}({argtxt})", 50)
+            print(Panel(command_title, border_style="dim", title=f"Command {i}", title_align="left"))
+        if not Confirm.ask("Allow the assistant to run these commands?"):
+            raise RuntimeError("Aborted by user")
+
+    def run_function_calls(
+        self, function_calls: list[FunctionCall], thread_id: Optional[str] = None
+    ) -> list[ToolOutput]:
+        """Do each function call, returning their outputs in the same order as the calls.
+
+        Up to self.tool_workers calls are run at once, each in its own thread.
+
+        If thread_id is given, the outputs of cacheable functions (see FunctionSpec.cacheable) are remembered, and a
+        later call to the same function with the same parameters in the same thread reuses the output instead of
+        running the function again. Identical calls to a cacheable function in the same batch are run only once.
+        """
+        memoized = [self.memoized(thread_id, call) for call in function_calls]
+        # The calls to run, by key, where identical cacheable calls share a key
+        keys = [_memo_key(call) if call.function.cacheable else i for i, call in enumerate(function_calls)]
+        to_run: dict[Any, FunctionCall] = {}
+        for key, call, output in zip(keys, function_calls, memoized):
+            if output is None:
+                to_run.setdefault(key, call)
+        pending = list(to_run.values())
+        if self.tool_workers > 1 and len(pending) > 1:
+            # Each call runs in a copy of this context, so that its span is a child of the current one.
+            contexts = [copy_context() for _ in pending]
+            with ThreadPoolExecutor(max_workers=min(self.tool_workers, len(pending))) as pool:
+                ran = list(pool.map(lambda context, call: context.run(self.run_function_call, call), contexts, pending))
+        else:
+            ran = [self.run_function_call(call) for call in pending]
+        for call, output in zip(pending, ran):
+            self.memoize(thread_id, call, output)
+        fresh = dict(zip(to_run, ran))
+        outputs = [output if output is not None else fresh[key] for key, output in zip(keys, memoized)]
+
+        results = []
+        for call, output in zip(function_calls, outputs):
+            result = ToolOutput(tool_call_id=call.call_id, output=output)
+            results.append(result)
+
+            argtxt = str(call.parameters).strip("{}")
+            command_title = shorten(f"{call.function.name}({argtxt})", 50)
+            print(Panel(output, border_style="dim", title=command_title, title_align="left"))
+
+        return results
+
+    def memoized(self, thread_id: Optional[str], call: FunctionCall) -> Optional[str]:
+        """Returns the remembered output of an earlier, identical call in the thread, if there is one."""
+        if thread_id is None or not call.function.cacheable:
+            return None
+        with self._memo_lock:
+            entry = self._memo.get(thread_id, {}).get(_memo_key(call))
+        if entry is None:
+            return None
+        output, made = entry
+        ttl = call.function.cache_ttl
+        if ttl is not None and time.monotonic() - made > ttl:
+            return None
+        return output
+
+    def memoize(self, thread_id: Optional[str], call: FunctionCall, output: str):
+        """Remembers the output of a call in the thread, if its function is cacheable."""
+        if thread_id is None or not call.function.cacheable:
+            return
+        with self._memo_lock:
+            self._memo.setdefault(thread_id, {})[_memo_key(call)] = (output, time.monotonic())
+            self._memo.move_to_end(thread_id)
+            while len(self._memo) > MEMO_THREADS:
+                self._memo.popitem(last=False)
+
+    def run_function_call(self, call: FunctionCall) -> str:
+        """Do a single function call, returning its stdout."""
+        limit = call.function.output_limit or self.output_limit
+        with self.span("tool_call", function=call.function.name):
+            if self.worker_pool is not None:
+                return self.worker_pool.run(call, limit)
+            with capture_stdout(limit) as buf:
+                call.function.action(**call.parameters)
+            return buf.getvalue().rstrip()
+
+    @staticmethod
+    def message_text(message: ThreadMessage) -> str:
+        """Returns the text of a reply from the assistant."""
+        content = message.content
+        assert len(content) == 1
+        assert content[0].type == "text"
+        assert len(content[0].text.annotations) == 0
+        return content[0].text.value
+
+
+@dataclass
+class Assistant(BaseAssistant):
+    """An assistant managed remotely via OpenAI's assistant API.
+
+    This class implements the basic lifecycle of an assistant, from CRUD to running a thread. It is intended to be
+    subclassed to extend functionality.
+    """
+
+    _: KW_ONLY
+    # By default, every assistant shares one connection-pooled client. See the clients module.
+    client: OpenAI = field(default_factory=shared_client)
 
     @classmethod
     def from_id(cls: Type[AssistantT], assistant_id: str, client: Optional[OpenAI] = None) -> AssistantT:
@@ -54,7 +386,7 @@ class Assistant:
 
         This method will skip all assistant creation steps and simply use the remote definition."""
         if client is None:
-            client = OpenAI()
+            client = shared_client()
         assistant = client.beta.assistants.retrieve(assistant_id)
         return cls(
             client=client,
@@ -65,8 +397,13 @@ class Assistant:
 
     @property
     def assistant(self) -> RemoteAssistant:
+        return self.get_assistant()
+
+    def get_assistant(self) -> RemoteAssistant:
+        """Returns the remote assistant, making it if needed. The assistant property is the same."""
         if self._assistant is None:
-            self._assistant = self.make_assistant(self.replace)
+            with self.span("make_assistant"):
+                self._assistant = self.make_assistant(self.replace)
         return self._assistant
 
     def ask(
@@ -76,165 +413,405 @@ class Assistant:
         use_commands: bool = True,
         confirm_commands: bool = True,
         instructions: Optional[str] = None,
+        timeout: Optional[float] = RUN_TIMEOUT,
     ) -> str:
         """Ask the assistant a question, returning the response.
 
         This may block for the lifecycle of several API requests as well as waiting on remotely managed threads, in fact
         blocking for several minutes and then succeeding is not uncommon. The caller should make arrangements for
-        multithreading, etc. should it be needed.
+        multithreading, etc. should it be needed, or use AsyncAssistant instead.
+
+        If a thread is not provided, a new one will be made. If the run has not finished after `timeout` seconds, a
+        TimeoutError is raised. A timeout of None waits forever.
+
+        If self.response_cache is set and commands are disabled, an identical earlier query in a new thread may be
+        answered from the cache without a run. See uses_response_cache().
+        """
+        with self.span("ask"):
+            key = None
+            if self.uses_response_cache(thread, use_commands):
+                assert self.response_cache is not None
+                key = self.response_key(self.assistant.id, query, instructions)
+                if (cached := self.response_cache.get(key)) is not None:
+                    return cached
+            for event in self.ask_stream(
+                query,
+                thread=thread,
+                use_commands=use_commands,
+                confirm_commands=confirm_commands,
+                instructions=instructions,
+                timeout=timeout,
+            ):
+                if event.event == "text":
+                    if key is not None:
+                        self.response_cache.set(key, event.data)
+                    return event.data
+        raise RuntimeError("Run completed without a response")
+
+    def ask_stream(
+        self,
+        query: str,
+        thread: Optional[Thread] = None,
+        use_commands: bool = True,
+        confirm_commands: bool = True,
+        instructions: Optional[str] = None,
+        timeout: Optional[float] = RUN_TIMEOUT,
+    ) -> Iterator[RunEvent]:
+        """Ask the assistant a question, yielding RunEvents as the run progresses.
 
-        If a thread is not provided, a new one will be made.
+        Status changes and tool calls are yielded as soon as they are seen, and the last event is a "text" event whose
+        data is the response. See ask() for more details.
         """
         if thread is None:
-            thread = self.thread()
-        self.add_message(query, thread)
-        self.run_thread(thread, use_commands=use_commands, confirm_commands=confirm_commands, instructions=instructions)
-        messages = list(self.messages(thread))
-        content = messages[0].content
-        assert len(content) == 1
-        assert content[0].type == "text"
-        assert len(content[0].text.annotations) == 0
-        return content[0].text.value
+            with self.span("thread.create"):
+                thread = self.thread()
+        with self.span("message.create"):
+            message = self.add_message(query, thread)
+        run = None
+        for event in self.run_events(thread, use_commands, confirm_commands, instructions, timeout, query):
+            run = event.run
+            yield event
+        assert run is not None
+        with self.span("messages.list"):
+            reply = self.reply(thread, run, after=message.id)
+        yield RunEvent("text", run, self.message_text(reply))
+
+    def ask_many(
+        self,
+        queries: Iterable[str],
+        concurrency: int = 4,
+        requests_per_minute: Optional[float] = None,
+        use_commands: bool = True,
+        confirm_commands: bool = False,
+        instructions: Optional[str] = None,
+        timeout: Optional[float] = RUN_TIMEOUT,
+    ) -> Iterator[AskResult]:
+        """Ask many questions at once, each in a new thread, yielding the results as they complete.
 
-    def functions(self) -> Iterable[FunctionSpec]:
-        """Returns an iterable of FunctionSpecs describing the function calling tools of this assistant."""
-        # The base assistant just returns an empty list but almost any real use case will extend this
-        yield from []
+        Up to `concurrency` asks run at the same time, each in its own python thread. If requests_per_minute is set, the
+        asks between them make API requests (including each poll of a run) no faster than that. An ask that fails
+        doesn't stop the others: its AskResult carries the error instead of a response.
+
+        If the generator is closed before every result is yielded, asks which haven't started are dropped, and the runs
+        of those still going are cancelled.
+
+        Confirming commands from several threads at once is confusing at best, so it is disabled by default.
+        """
+        queries = list(queries)
+        bucket = TokenBucket(requests_per_minute) if requests_per_minute is not None else None
+        stop = threading.Event()
+        # Find or make the remote assistant once, up front, rather than racing to do it in each ask.
+        self.get_assistant()
+
+        def ask(index: int, query: str) -> AskResult:
+            stop_token = _stop.set(stop)
+            try:
+                with limit_requests(bucket):
+                    response = self.ask(
+                        query,
+                        use_commands=use_commands,
+                        confirm_commands=confirm_commands,
+                        instructions=instructions,
+                        timeout=timeout,
+                    )
+            except Exception as e:
+                return AskResult(index=index, query=query, error=e)
+            finally:
+                _stop.reset(stop_token)
+            return AskResult(index=index, query=query, response=response)
+
+        pool = ThreadPoolExecutor(max_workers=concurrency)
+        try:
+            futures = [pool.submit(ask, index, query) for index, query in enumerate(queries)]
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            stop.set()
+            pool.shutdown(wait=False, cancel_futures=True)
 
     def thread(self, thread_id: Optional[str] = None) -> Thread:
         """Retrieves the thread, or creates one if none exists."""
         if thread_id is None:
-            return self.client.beta.threads.create()
-        return self.client.beta.threads.retrieve(thread_id)
+            return self.resilience.call("threads.create", self.client.beta.threads.create)
+        return self.resilience.call("threads.retrieve", self.client.beta.threads.retrieve, thread_id)
+
+    def session_thread(self, thread_id: Optional[str]) -> Thread:
+        """Retrieves the thread of a continued conversation, or creates a new one if it is unknown or was deleted."""
+        if thread_id is not None:
+            try:
+                return self.thread(thread_id)
+            except openai.NotFoundError:
+                pass
+        return self.thread()
 
     def add_message(self, content: str, thread: Thread) -> ThreadMessage:
         """Adds a message to the current thread, returning the message."""
-        return self.client.beta.threads.messages.create(thread_id=thread.id, role="user", content=content)
+        return self.resilience.call(
+            "messages.create",
+            self.client.beta.threads.messages.create,
+            thread_id=thread.id,
+            role="user",
+            content=content,
+        )
+
+    def messages(
+        self,
+        thread: Thread,
+        order: Literal["asc", "desc"] = "desc",
+        limit: Optional[int] = None,
+        after: Optional[str] = None,
+        before: Optional[str] = None,
+    ) -> Iterator[ThreadMessage]:
+        """Yields the messages of the thread, newest first unless order is "asc".
+
+        Messages are fetched a page at a time as they are iterated, up to `limit` per page. after and before are message
+        IDs to start after or end before, in the given order.
+        """
+        yield from self.resilience.call(
+            "messages.list",
+            self.client.beta.threads.messages.list,
+            thread_id=thread.id,
+            **message_cursor(order, limit, after, before),
+        )
+
+    def reply(self, thread: Thread, run: Run, after: Optional[str] = None) -> ThreadMessage:
+        """Returns the newest message that run added to the thread.
 
-    def messages(self, thread: Thread) -> list[ThreadMessage]:
-        return list(self.client.beta.threads.messages.list(thread_id=thread.id))
+        Only messages after the message with ID `after` (usually the query that started the run) are fetched, so this
+        doesn't page through the history of long-lived threads.
+        """
+        return newest_reply(self.messages(thread, order="asc", after=after), thread, run)
 
     def run_thread(
-        self, thread: Thread, use_commands: bool, confirm_commands: bool, instructions: Optional[str] = None
+        self,
+        thread: Thread,
+        use_commands: bool,
+        confirm_commands: bool,
+        instructions: Optional[str] = None,
+        timeout: Optional[float] = RUN_TIMEOUT,
     ):
-        """Runs the current thread, blocking until it completes.
+        """Runs the current thread, blocking until it completes or `timeout` seconds have passed.
 
-        See ask() for more details.
+        The run is polled according to self.polling, which backs off from a short initial interval so that quick runs
+        return quickly. See ask() for more details.
         """
-        kwargs = {}
-        if not use_commands:
-            kwargs["tools"] = []
-        if instructions is not None:
-            kwargs["instructions"] = instructions
+        for _ in self.run_events(thread, use_commands, confirm_commands, instructions, timeout):
+            pass
 
-        run = self.client.beta.threads.runs.create(thread_id=thread.id, assistant_id=self.assistant.id, **kwargs)
-
-        iterations = 0
-        while iterations < MAX_RUN_ITERATIONS:
-            iterations += 1
-            time.sleep(RUN_ITERATION_SLEEP)  # Sleep right away, openai is never done immediately
-
-            match run.status:
-                case "queued" | "in_progress":
-                    run = self.client.beta.threads.runs.retrieve(thread_id=thread.id, run_id=run.id)
-                    continue
-                case "completed":
-                    return
-                case "requires_action":
-                    if not use_commands:
-                        raise RuntimeError("Run requires action but commands are disabled")
-                    iterations = 0
-                    assert run.required_action is not None
-                    calls = run.required_action.submit_tool_outputs.tool_calls
-                    results = self.tool_calls(calls, confirm_commands)
-                    run = self.client.beta.threads.runs.submit_tool_outputs(
-                        thread_id=thread.id,
-                        run_id=run.id,
-                        tool_outputs=results,
-                    )
-                case "cancelling" | "cancelled" | "failed" | "expired":
-                    raise RuntimeError(f"Run failed with status {run.status}")
-                case _:
-                    raise RuntimeError(f"Unexpected status {run.status}")
-
-    def tool_calls(self, calls: list[RequiredActionFunctionToolCall], confirm_commands: bool) -> list[ToolOutput]:
-        """Translate a ToolCall API response in to  a list of FunctionCalls and do them."""
-        function_specs = {func.name: func for func in self.functions()}
+    def run_events(
+        self,
+        thread: Thread,
+        use_commands: bool,
+        confirm_commands: bool,
+        instructions: Optional[str] = None,
+        timeout: Optional[float] = RUN_TIMEOUT,
+        query: Optional[str] = None,
+    ) -> Iterator[RunEvent]:
+        """Runs the current thread like run_thread(), yielding a RunEvent as each step of the run happens.
 
-        # Build function call list
-        # Here we use "function" to distinguish the openai call description from our
-        # internal function call description.
-        function_calls: list[FunctionCall] = []
-        for call in calls:
-            match call.type:
-                case "function":
-                    name = call.function.name
-                    args = json.loads(call.function.arguments)
-                case _:
-                    raise ValueError(f"Unexpected call type {call.type}")
+        query is the message the run answers, used to pick the run's tools if self.tool_limit is set.
 
-            if name not in function_specs:
-                # Long story short, sometimes the LLM thinks typer arg0 is a file and thus insists on pulling it out of
-                # the function name. This is a workaround kludge, and could cause problems.
-                for func in function_specs.values():
-                    if func.name.endswith(name):
-                        function = func
-                        break
-                else:
-                    raise ValueError(f"Unknown function {name}")
-            else:
-                function = function_specs[name]
-            function_calls.append(FunctionCall(call_id=call.id, function=function, parameters=args))
+        If the run times out, or anything else interrupts it (including KeyboardInterrupt and a refused confirmation),
+        the remote run is cancelled with cancel_run() before the exception is raised.
 
+        If there is an observer, the whole run is a "run" span, with a "run.status" span for each status the run passes
+        through, so that time spent queued can be told apart from time the model spent working.
+        """
+        kwargs = self.run_kwargs(use_commands, instructions, query)
+        deadline = Deadline(timeout)
+        assistant = self.assistant
+        # These spans stay open across yields, so they are started and ended explicitly rather than with span().
+        run_span = self.start_span("run")
+        status_span = None
+        error = None
+        run: Optional[Run] = None
+        stop = _stop.get()
+        try:
+            with self.span("run.create", run_span):
+                run = self.resilience.call(
+                    "runs.create",
+                    self.client.beta.threads.runs.create,
+                    deadline=deadline,
+                    thread_id=thread.id,
+                    assistant_id=assistant.id,
+                    **kwargs,
+                )
+            status_span = self.start_span("run.status", run_span, status=run.status)
+            yield RunEvent("status", run)
+
+            intervals = self.polling.intervals()
+            while True:
+                match run.status:
+                    case "queued" | "in_progress":
+                        if deadline.expired():
+                            raise TimeoutError(f"Run {run.id} did not complete within {timeout} seconds")
+                        with self.span("run.sleep", run_span):
+                            interval = deadline.clamp(next(intervals))
+                            if stop is None:
+                                time.sleep(interval)
+                            elif stop.wait(interval):
+                                raise CancelledError(f"Run {run.id} was abandoned")
+                        previous = run.status
+                        with self.span("run.retrieve", run_span):
+                            run = self.resilience.call(
+                                "runs.retrieve",
+                                self.client.beta.threads.runs.retrieve,
+                                deadline=deadline,
+                                thread_id=thread.id,
+                                run_id=run.id,
+                            )
+                        if run.status != previous:
+                            self.end_span(status_span)
+                            status_span = self.start_span("run.status", run_span, status=run.status)
+                            yield RunEvent("status", run)
+                        continue
+                    case "completed":
+                        return
+                    case "requires_action":
+                        if not use_commands:
+                            raise RuntimeError("Run requires action but commands are disabled")
+                        assert run.required_action is not None
+                        calls = run.required_action.submit_tool_outputs.tool_calls
+                        yield RunEvent("tool_calls", run, calls)
+                        with self.span("tool_calls", run_span, count=len(calls)):
+                            results = self.tool_calls(calls, confirm_commands, thread)
+                        yield RunEvent("tool_outputs", run, results)
+                        with self.span("run.submit_tool_outputs", run_span):
+                            run = self.resilience.call(
+                                "runs.submit_tool_outputs",
+                                self.client.beta.threads.runs.submit_tool_outputs,
+                                deadline=deadline,
+                                thread_id=thread.id,
+                                run_id=run.id,
+                                tool_outputs=results,
+                            )
+                        self.end_span(status_span)
+                        status_span = self.start_span("run.status", run_span, status=run.status)
+                        yield RunEvent("status", run)
+                        # The model has new work to do, so start polling eagerly again.
+                        intervals = self.polling.intervals()
+                    case "cancelling" | "cancelled" | "failed" | "expired":
+                        raise RuntimeError(f"Run failed with status {run.status}")
+                    case _:
+                        raise RuntimeError(f"Unexpected status {run.status}")
+        except BaseException as e:
+            # GeneratorExit just means the caller stopped listening, which is only an error if the run was unfinished.
+            if not isinstance(e, GeneratorExit):
+                error = e
+            if run is not None and run.status in ACTIVE_RUN_STATUSES:
+                with self.span("run.cancel", run_span):
+                    self.cancel_run(thread, run)
+            raise
+        finally:
+            self.end_span(status_span, error)
+            self.end_span(run_span, error)
+
+    def cancel_run(self, thread: Thread, run: Run, timeout: Optional[float] = CANCEL_TIMEOUT) -> Run:
+        """Cancels the run, waiting up to `timeout` seconds for it to stop so that its thread is free again.
+
+        This is called while another exception is being raised, so API errors (including an open circuit breaker) are
+        ignored rather than raised in its place. Returns the run as last seen.
+        """
+        try:
+            deadline = Deadline(timeout)
+            run = self.resilience.call(
+                "runs.cancel",
+                self.client.beta.threads.runs.cancel,
+                deadline=deadline,
+                thread_id=thread.id,
+                run_id=run.id,
+            )
+            intervals = self.polling.intervals()
+            while run.status in (*ACTIVE_RUN_STATUSES, "cancelling") and not deadline.expired():
+                time.sleep(deadline.clamp(next(intervals)))
+                run = self.resilience.call(
+                    "runs.retrieve",
+                    self.client.beta.threads.runs.retrieve,
+                    deadline=deadline,
+                    thread_id=thread.id,
+                    run_id=run.id,
+                )
+        except (openai.OpenAIError, CircuitOpenError):
+            pass
+        return run
+
+    def tool_calls(
+        self, calls: list[RequiredActionFunctionToolCall], confirm_commands: bool, thread: Optional[Thread] = None
+    ) -> list[ToolOutput]:
+        """Translate a ToolCall API response in to  a list of FunctionCalls and do them.
+
+        If the thread the calls were made in is given, outputs of cacheable commands are reused within it.
+        """
+        function_calls = self.function_calls(calls)
         if confirm_commands:
-            for i, call in enumerate(function_calls, 1):
-                argtxt = str(call.parameters).strip("{}")
-                command_title = shorten(f"{call.function.name}({argtxt})", 50)
-                print(Panel(command_title, border_style="dim", title=f"Command {i}", title_align="left"))
-            if not Confirm.ask("Allow the assistant to run these commands?"):
-                raise RuntimeError("Aborted by user")
-
-        results = []
-        for call in function_calls:
-            with redirect_stdout(StringIO()) as buf:
-                call.function.action(**call.parameters)
-            output = buf.getvalue().rstrip()
-            result = ToolOutput(tool_call_id=call.call_id, output=output)
-            results.append(result)
-
-            argtxt = str(call.parameters).strip("{}")
-            command_title = shorten(f"{call.function.name}({argtxt})", 50)
-            print(Panel(output, border_style="dim", title=command_title, title_align="left"))
-
-        return results
+            self.confirm_function_calls(function_calls)
+        return self.run_function_calls(function_calls, thread.id if thread is not None else None)
 
     def make_assistant(self, replace: bool) -> RemoteAssistant:
         """Get or create an assistant in the OpenAI API reflecting the current state of this object.
 
         If an assistant with the given name already exists, it will be returned. Otherwise, a new assistant will be
-        created. (In the future, an update or drift-detection system may be implemented.)
+        created. A hash of the instructions, model and tools is stored in the assistant's metadata, and an existing
+        assistant whose hash differs from this one's is updated in place.
+
+        If self.registry is set, the ID of the assistant is remembered locally, and later calls only need to retrieve
+        that one assistant instead of listing them all.
 
         If replace is True, any existing assistant with the same name will be deleted first.
 
         If you want to load a remote assistant directly by ID without potentially creating a new one, use from_id()
         instead.
         """
+        key = None
+        if self.registry is not None:
+            key = self.registry.key(self.name, self.client)
+            if not replace and (registered := self._registered_assistant(key)) is not None:
+                return self._updated(registered)
+
         # We would prefer to query for assistants of the given name, but the API doesn't support that.
         # So for now we just scan them all.
-        assistants = list(self.client.beta.assistants.list())
-        for assistant in assistants:
+        found = None
+        for assistant in self.resilience.call("assistants.list", self.client.beta.assistants.list):
             if assistant.name == self.name:
                 if replace:
-                    self.client.beta.assistants.delete(assistant.id)
+                    self.resilience.call("assistants.delete", self.client.beta.assistants.delete, assistant.id)
                 else:
-                    return assistant
-        return self.client.beta.assistants.create(
-            name=self.name,
-            instructions=self.instructions,
-            tools=[tool.tool() for tool in self.functions()],
-            model="gpt-4-1106-preview",
+                    found = assistant
+                    break
+        if found is None:
+            found = self.resilience.call("assistants.create", self.client.beta.assistants.create, **self.definition())
+        else:
+            found = self._updated(found)
+
+        if self.registry is not None and key is not None:
+            self.registry.set(key, found.id)
+        return found
+
+    def _updated(self, remote: RemoteAssistant) -> RemoteAssistant:
+        """Returns remote, updating it first if it has drifted from this assistant's definition."""
+        if not self.drifted(remote):
+            return remote
+        return self.resilience.call(
+            "assistants.update", self.client.beta.assistants.update, remote.id, **self.update_kwargs(remote)
         )
 
+    def _registered_assistant(self, key: str) -> Optional[RemoteAssistant]:
+        """Returns the assistant recorded in self.registry under key, if it still exists."""
+        assert self.registry is not None
+        assistant_id = self.registry.get(key)
+        if assistant_id is None:
+            return None
+        try:
+            assistant = self.resilience.call("assistants.retrieve", self.client.beta.assistants.retrieve, assistant_id)
+        except openai.NotFoundError:
+            assistant = None
+        if assistant is None or assistant.name != self.name:
+            self.registry.forget(key)
+            return None
+        return assistant
+
     def delete_assistant(self):
         """Delete the assistant from OpenAI."""
-        self.client.beta.assistants.delete(self.assistant.id)
+        self.resilience.call("assistants.delete", self.client.beta.assistants.delete, self.assistant.id)
+        if self.registry is not None:
+            self.registry.forget(self.registry.key(self.name, self.client))
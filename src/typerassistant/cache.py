@@ -0,0 +1,103 @@
+"""Caches of responses to asks which don't use commands, so that repeating an identical prompt skips the run."""
+import hashlib
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from .store import JSONStore, default_store_dir
+
+
+class ResponseCache(ABC):
+    """Maps ask keys (see key()) to responses. Subclass this to keep responses elsewhere."""
+
+    @staticmethod
+    def key(assistant_id: str, model: str, instructions: str, query: str) -> str:
+        """Returns the key for a query to the given assistant, run with the given model and instructions."""
+        return hashlib.sha256(json.dumps([assistant_id, model, instructions, query]).encode()).hexdigest()
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        """Returns the response cached under key, or None if there isn't one."""
+
+    @abstractmethod
+    def set(self, key: str, response: str):
+        """Caches response under key."""
+
+
+@dataclass
+class MemoryCache(ResponseCache):
+    """A ResponseCache kept in memory for the life of the process.
+
+    Responses expire `ttl` seconds after they were cached (None never expires), and only the `max_entries` most
+    recently used responses are kept.
+    """
+
+    ttl: Optional[float] = 60 * 60
+    max_entries: int = 256
+
+    def __post_init__(self):
+        self.entries: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if _expired(entry[1], self.ttl):
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key: str, response: str):
+        with self.lock:
+            self.entries[key] = (response, time.time())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+@dataclass
+class DiskCache(ResponseCache):
+    """A ResponseCache kept on disk, so that responses are reused by later invocations of the app.
+
+    Responses expire `ttl` seconds after they were cached (None never expires), and only the `max_entries` most
+    recently used responses are kept.
+    """
+
+    path: Path = field(default_factory=lambda: default_store_dir() / "responses.json")
+    ttl: Optional[float] = 24 * 60 * 60
+    max_entries: int = 1000
+
+    def __post_init__(self):
+        self.store = JSONStore(self.path)
+
+    def get(self, key: str) -> Optional[str]:
+        data = self.store.load()
+        entry = data.get(key)
+        if entry is None or _expired(entry["cached"], self.ttl):
+            return None
+        entry["used"] = time.time()
+        self.store.save(data)
+        return entry["response"]
+
+    def set(self, key: str, response: str):
+        data = self.store.load()
+        now = time.time()
+        data[key] = {"response": response, "cached": now, "used": now}
+        live = sorted(
+            ((k, entry) for k, entry in data.items() if not _expired(entry["cached"], self.ttl)),
+            key=lambda item: item[1]["used"],
+        )
+        # Not live[-self.max_entries :], which keeps every entry when max_entries is 0
+        self.store.save(dict(live[max(len(live) - self.max_entries, 0) :]))
+
+
+def _expired(cached: float, ttl: Optional[float]) -> bool:
+    return ttl is not None and time.time() - cached > ttl
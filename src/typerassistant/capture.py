@@ -0,0 +1,162 @@
+"""Per-thread, bounded capture of stdout.
+
+contextlib.redirect_stdout replaces sys.stdout for the whole process, so two commands capturing output at the same
+time would steal each other's writes. Instead, capture_stdout() installs a single proxy as sys.stdout which routes each
+write to the buffer of the thread that made it, falling back to the real stdout for threads that aren't capturing.
+
+Captured output can be bounded by an OutputLimit, in which case only the beginning and end of the output are kept.
+"""
+import sys
+import threading
+from collections import deque
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from io import StringIO
+from typing import Any, Optional, TextIO, Union
+
+
+@dataclass(frozen=True)
+class OutputLimit:
+    """A budget for captured command output. None means unlimited."""
+
+    max_bytes: Optional[int] = 32 * 1024
+    max_lines: Optional[int] = 1000
+
+
+class BoundedBuffer:
+    """A write-only text buffer which keeps the head and tail of what is written to it, up to an OutputLimit.
+
+    Half of the budget goes to the first lines written and half to a ring buffer of the most recent lines. Anything in
+    between is dropped and replaced by a note saying how much was left out. Sizes are measured in UTF-8 bytes.
+    """
+
+    def __init__(self, limit: OutputLimit):
+        self.head_bytes = limit.max_bytes // 2 if limit.max_bytes is not None else None
+        self.head_lines = limit.max_lines // 2 if limit.max_lines is not None else None
+        self.tail_bytes = limit.max_bytes - self.head_bytes if limit.max_bytes is not None else None
+        self.tail_lines = limit.max_lines - self.head_lines if limit.max_lines is not None else None
+        self.head: list[str] = []
+        self.head_size = 0
+        self.head_full = False
+        self.tail: deque[tuple[str, int]] = deque()
+        self.tail_size = 0
+        self.pending = ""
+        self.dropped_bytes = 0
+        self.dropped_lines = 0
+
+    def write(self, text: str) -> int:
+        self.pending += text
+        *lines, self.pending = self.pending.split("\n")
+        for line in lines:
+            self._add(line + "\n")
+        if self.tail_bytes is not None and len(self.pending) > self.tail_bytes:
+            # A single enormous line; don't let it grow without bound.
+            self._add(self.pending)
+            self.pending = ""
+        return len(text)
+
+    def flush(self) -> None:
+        pass
+
+    def getvalue(self) -> str:
+        if self.pending:
+            self._add(self.pending)
+            self.pending = ""
+        parts = self.head[:]
+        if self.dropped_bytes:
+            parts.append(f"[... {self.dropped_lines} lines ({self.dropped_bytes} bytes) omitted ...]\n")
+        parts.extend(line for line, _ in self.tail)
+        return "".join(parts)
+
+    def _add(self, line: str):
+        size = len(line.encode())
+        if not self.head_full:
+            if _fits(len(self.head) + 1, self.head_size + size, self.head_lines, self.head_bytes):
+                self.head.append(line)
+                self.head_size += size
+                return
+            self.head_full = True
+
+        if self.tail_bytes is not None and size > self.tail_bytes:
+            # Too long to fit in the tail by itself, so keep only its end.
+            kept = line.encode()[-self.tail_bytes :].decode(errors="ignore")
+            self.dropped_bytes += size - len(kept.encode())
+            line, size = kept, len(kept.encode())
+
+        self.tail.append((line, size))
+        self.tail_size += size
+        while self.tail and not _fits(len(self.tail), self.tail_size, self.tail_lines, self.tail_bytes):
+            dropped, dropped_size = self.tail.popleft()
+            self.tail_size -= dropped_size
+            self.dropped_lines += dropped.endswith("\n")
+            self.dropped_bytes += dropped_size
+
+
+def _fits(lines: int, size: int, max_lines: Optional[int], max_bytes: Optional[int]) -> bool:
+    return (max_lines is None or lines <= max_lines) and (max_bytes is None or size <= max_bytes)
+
+
+class _ThreadLocalStdout:
+    """A stand-in for sys.stdout which writes to a per-thread target, if one is set."""
+
+    def __init__(self, default: TextIO):
+        self.default = default
+        self.local = threading.local()
+
+    @property
+    def target(self) -> TextIO:
+        return getattr(self.local, "target", None) or self.default
+
+    def write(self, text: str) -> int:
+        return self.target.write(text)
+
+    def flush(self) -> None:
+        self.target.flush()
+
+    def __getattr__(self, name: str) -> Any:
+        # Everything else (encoding, isatty, fileno, ...) comes from whichever stream this thread is writing to.
+        return getattr(self.target, name)
+
+
+_install_lock = threading.Lock()
+_proxy: Optional[_ThreadLocalStdout] = None
+_users = 0
+
+
+@contextmanager
+def _installed() -> Iterator[_ThreadLocalStdout]:
+    """Installs the stdout proxy for as long as any thread is capturing."""
+    global _proxy, _users
+    with _install_lock:
+        if _proxy is None:
+            _proxy = _ThreadLocalStdout(sys.stdout)
+            sys.stdout = _proxy  # type: ignore[assignment]
+        _users += 1
+        proxy = _proxy
+    try:
+        yield proxy
+    finally:
+        with _install_lock:
+            _users -= 1
+            if _users == 0:
+                if sys.stdout is _proxy:
+                    sys.stdout = _proxy.default
+                _proxy = None
+
+
+@contextmanager
+def capture_stdout(limit: Optional[OutputLimit] = None) -> Iterator[Union[StringIO, BoundedBuffer]]:
+    """Like contextlib.redirect_stdout(StringIO()), but only captures writes made by the current thread.
+
+    Output from threads started by the captured code is not captured. If limit is given, the output is captured in a
+    BoundedBuffer.
+    """
+    buf = StringIO() if limit is None else BoundedBuffer(limit)
+    with _installed() as proxy:
+        previous = getattr(proxy.local, "target", None)
+        proxy.local.target = buf
+        try:
+            yield buf
+        finally:
+            proxy.local.target = previous
@@ -0,0 +1,221 @@
+"""Recording the OpenAI API requests of real asks, and replaying them offline.
+
+A cassette is a JSON file of the requests an OpenAI client made and the responses it got. Record one from a real ask:
+
+    with recording(Path("ask.json")) as client:
+        TyperAssistant(app=app, client=client).ask("...")
+
+and then replay_client(Path("ask.json")) gives a client which answers the same requests from the file, without the
+network or an API key. The whole ask loop, including rounds of tool calls, then runs in milliseconds, which makes
+cassettes useful for tests and for profiling typerassistant itself.
+
+Request headers (which carry the API key) are never recorded. Nor are response headers, other than the content type and
+the Retry-After headers of rate limited responses.
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Optional
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+# The version of the cassette format, stored in each cassette
+CASSETTE_VERSION = 1
+
+# The response headers kept in a cassette
+RECORDED_HEADERS = ("content-type", "retry-after", "retry-after-ms")
+
+
+class Cassette:
+    """The requests and responses recorded at `path`, in the order they were made.
+
+    Each interaction is a dict of the "request" (its "method", "path" including the query, and "body"), the "response"
+    (its "status", "headers" and "body"), and the "elapsed" seconds it took. Bodies are stored as JSON if they are JSON,
+    and as text otherwise.
+    """
+
+    def __init__(self, path: Path, interactions: Optional[list[dict[str, Any]]] = None):
+        self.path = path
+        self.interactions = interactions if interactions is not None else []
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: Path) -> "Cassette":
+        data = json.loads(path.read_text())
+        if data.get("version") != CASSETTE_VERSION:
+            raise ValueError(f"{path} is not a version {CASSETTE_VERSION} cassette")
+        return cls(path, data["interactions"])
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.lock:
+            data = {"version": CASSETTE_VERSION, "interactions": self.interactions}
+        # Indented, so that changes to a cassette checked in to a repository can be reviewed.
+        self.path.write_text(json.dumps(data, indent=2) + "\n")
+
+    def record(self, request: httpx.Request, response: httpx.Response, elapsed: float) -> dict[str, Any]:
+        """Adds an interaction for a request and its (read) response, returning it."""
+        interaction = {
+            "request": {
+                "method": request.method,
+                "path": request.url.raw_path.decode(),
+                "body": _decode(request.content),
+            },
+            "response": {
+                "status": response.status_code,
+                "headers": {name: response.headers[name] for name in RECORDED_HEADERS if name in response.headers},
+                "body": _decode(response.content),
+            },
+            "elapsed": round(elapsed, 3),
+        }
+        with self.lock:
+            self.interactions.append(interaction)
+        return interaction
+
+
+def interaction_response(interaction: dict[str, Any], request: httpx.Request) -> httpx.Response:
+    """Returns the recorded response of an interaction, as the response to request."""
+    response = interaction["response"]
+    body = response["body"]
+    if body is None:
+        content = b""
+    else:
+        content = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+    return httpx.Response(response["status"], headers=response["headers"], content=content, request=request)
+
+
+class RecordingTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """An httpx transport which sends requests with `transport` (or `async_transport`), recording each to `cassette`."""
+
+    def __init__(
+        self,
+        cassette: Cassette,
+        transport: Optional[httpx.BaseTransport] = None,
+        async_transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.cassette = cassette
+        self.transport = transport or httpx.HTTPTransport()
+        self.async_transport = async_transport or httpx.AsyncHTTPTransport()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        start = time.perf_counter()
+        response = self.transport.handle_request(request)
+        try:
+            response.read()
+        finally:
+            response.close()
+        interaction = self.cassette.record(request, response, time.perf_counter() - start)
+        return interaction_response(interaction, request)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        start = time.perf_counter()
+        response = await self.async_transport.handle_async_request(request)
+        try:
+            await response.aread()
+        finally:
+            await response.aclose()
+        interaction = self.cassette.record(request, response, time.perf_counter() - start)
+        return interaction_response(interaction, request)
+
+    def close(self):
+        self.transport.close()
+
+    async def aclose(self):
+        await self.async_transport.aclose()
+
+
+class ReplayTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """An httpx transport which answers requests with the responses recorded in `cassette`.
+
+    Each request gets the first response not yet replayed which was recorded for the same method and path, so requests
+    to different endpoints may be made in a different order than they were recorded, eg. by concurrent asks. Responses
+    are delayed by `latency` seconds, or by the time each originally took if latency is None.
+
+    A request with no response left to replay gets a 400 response, which the openai client raises as a
+    BadRequestError instead of retrying.
+    """
+
+    def __init__(self, cassette: Cassette, latency: Optional[float] = 0.0):
+        self.cassette = cassette
+        self.latency = latency
+        self.pending: dict[tuple[str, str], deque[dict[str, Any]]] = {}
+        for interaction in cassette.interactions:
+            key = (interaction["request"]["method"], interaction["request"]["path"])
+            self.pending.setdefault(key, deque()).append(interaction)
+        self.lock = threading.Lock()
+
+    def unplayed(self) -> list[dict[str, Any]]:
+        """Returns the interactions which haven't been replayed yet."""
+        with self.lock:
+            return [interaction for queue in self.pending.values() for interaction in queue]
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        response, delay = self._replay(request)
+        if delay:
+            time.sleep(delay)
+        return response
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        response, delay = self._replay(request)
+        if delay:
+            await asyncio.sleep(delay)
+        return response
+
+    def _replay(self, request: httpx.Request) -> tuple[httpx.Response, float]:
+        key = (request.method, request.url.raw_path.decode())
+        with self.lock:
+            queue = self.pending.get(key)
+            interaction = queue.popleft() if queue else None
+        if interaction is None:
+            message = f"{self.cassette.path} has no response left for {key[0]} {key[1]}"
+            error = {"error": {"message": message, "type": "invalid_request_error", "code": "cassette_exhausted"}}
+            return httpx.Response(400, json=error, request=request), 0.0
+        delay = interaction["elapsed"] if self.latency is None else self.latency
+        return interaction_response(interaction, request), delay
+
+
+@contextmanager
+def recording(path: Path, **client_kwargs) -> Iterator[OpenAI]:
+    """Yields an OpenAI client, made with client_kwargs, which records every request it makes to a cassette at path.
+
+    The cassette is saved when the context exits, even if it exits with an exception.
+    """
+    cassette = Cassette(path)
+    # As with the shared client, the assistant does the retrying, and each of its retries is recorded.
+    client_kwargs.setdefault("max_retries", 0)
+    client = OpenAI(http_client=httpx.Client(transport=RecordingTransport(cassette)), **client_kwargs)
+    try:
+        yield client
+    finally:
+        client.close()
+        cassette.save()
+
+
+def replay_client(path: Path, latency: Optional[float] = 0.0, **client_kwargs) -> OpenAI:
+    """Returns an OpenAI client which replays the cassette at path. See ReplayTransport for the meaning of latency."""
+    # No API key is needed, or recorded
+    client_kwargs.setdefault("api_key", "replay")
+    client_kwargs.setdefault("max_retries", 0)
+    transport = ReplayTransport(Cassette.load(path), latency)
+    return OpenAI(http_client=httpx.Client(transport=transport), **client_kwargs)
+
+
+def async_replay_client(path: Path, latency: Optional[float] = 0.0, **client_kwargs) -> AsyncOpenAI:
+    """Like replay_client(), for an AsyncOpenAI client."""
+    client_kwargs.setdefault("api_key", "replay")
+    client_kwargs.setdefault("max_retries", 0)
+    transport = ReplayTransport(Cassette.load(path), latency)
+    return AsyncOpenAI(http_client=httpx.AsyncClient(transport=transport), **client_kwargs)
+
+
+def _decode(content: bytes) -> Any:
+    try:
+        return json.loads(content) if content else None
+    except ValueError:
+        return content.decode(errors="replace")
@@ -0,0 +1,89 @@
+"""A process-wide, connection-pooled OpenAI client, shared by every assistant that isn't given a client of its own.
+
+Each OpenAI() owns its own pool of HTTP connections, so making one per assistant (or per ask) pays for a new TCP and
+TLS handshake on the first request of each. The shared client keeps its connections alive between requests instead.
+"""
+import os
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+
+@dataclass(frozen=True)
+class ClientSettings:
+    """Connection pooling and timeouts for the shared client. None means unlimited.
+
+    Idle connections are kept for `keepalive_expiry` seconds, up to `max_keepalive_connections` of them. Requests time
+    out after `timeout` seconds, or `connect_timeout` seconds if no connection can be made.
+    """
+
+    max_connections: Optional[int] = 20
+    max_keepalive_connections: Optional[int] = 10
+    keepalive_expiry: Optional[float] = 60.0
+    timeout: Optional[float] = 600.0
+    connect_timeout: Optional[float] = 10.0
+    # Assistants retry failed requests themselves (see the resilience module), so the client doesn't by default, which
+    # would multiply the retries of each.
+    max_retries: int = 0
+
+    def http_client(self) -> httpx.Client:
+        return httpx.Client(
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+        )
+
+
+_lock = threading.Lock()
+_settings = ClientSettings()
+_client: Optional[OpenAI] = None
+
+
+def shared_client() -> OpenAI:
+    """Returns the process-wide OpenAI client, making it on first use.
+
+    Like OpenAI(), the client is configured from the OPENAI_API_KEY, OPENAI_ORG_ID and OPENAI_BASE_URL environment
+    variables.
+    """
+    global _client
+    with _lock:
+        if _client is None:
+            _client = OpenAI(http_client=_settings.http_client(), max_retries=_settings.max_retries)
+        return _client
+
+
+def async_client() -> AsyncOpenAI:
+    """Returns a new AsyncOpenAI client which, like the shared client, leaves retrying to the assistant.
+
+    Async clients aren't shared, as their connections belong to the event loop they were first used on.
+    """
+    return AsyncOpenAI(max_retries=_settings.max_retries)
+
+
+def configure_clients(settings: ClientSettings):
+    """Sets the settings of the shared client. A shared client made with the old settings is replaced on next use.
+
+    Assistants already holding the old client keep using it, so call this before making any assistants.
+    """
+    global _settings, _client
+    with _lock:
+        _settings = settings
+        _client = None
+
+
+def _forget_client():
+    # A forked child must not share its parent's connections, so it makes its own client on first use.
+    global _client, _lock
+    _lock = threading.Lock()
+    _client = None
+
+
+# There is no fork() on Windows
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_client)
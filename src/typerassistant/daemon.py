@@ -0,0 +1,355 @@
+"""A local daemon which keeps an app's assistant warm, so that each ask doesn't pay to start it up again.
+
+Every invocation of an app's ask command imports openai, makes a client, introspects the app and finds the remote
+assistant before it can do anything useful. With register_assistant(..., daemon=True), the first ask instead forks a
+daemon which does all of that once, and then answers asks over a Unix domain socket until it has been idle for a while.
+The ask command becomes a thin client which sends its query and prints the events streamed back. Commands the
+assistant calls run in the daemon, in the working directory, environment and umask of the ask that called them.
+
+The protocol is JSON lines: the client sends one request object, and the daemon replies with one object per event,
+ending with a "text" or "error" event. See AssistantDaemon.events().
+"""
+import fcntl
+import hashlib
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from textwrap import shorten
+from typing import TYPE_CHECKING, Any, Callable, Optional
+
+from .store import default_store_dir
+
+if TYPE_CHECKING:
+    import typer
+
+    from .assistant import RunEvent
+    from .sessions import SessionStore
+    from .typer import TyperAssistant
+
+
+# The environment variables which choose the OpenAI account, and API, that the default client uses
+CLIENT_VARIABLES = ("OPENAI_API_KEY", "OPENAI_ORG_ID", "OPENAI_BASE_URL")
+
+
+def socket_path(app_name: str, sources: Iterable[str] = ()) -> Path:
+    """Returns the default socket path of the daemon for app_name, as run by the current script.
+
+    The path changes whenever the script, typerassistant itself, or any of the source files in sources (see
+    app_sources()) is modified, so that an old daemon isn't used with new code. It also changes with the environment
+    variables in CLIENT_VARIABLES, as the daemon's client is made with those of the ask which started it, so that an
+    ask made with another account gets a daemon of its own.
+    """
+    script = os.path.abspath(sys.argv[0])
+    package = sorted(str(path) for path in Path(__file__).parent.glob("*.py"))
+    files = [script, *package, *sorted(set(sources))]
+    client = [os.environ.get(name) for name in CLIENT_VARIABLES]
+    digest = hashlib.sha256(json.dumps([app_name, [(file, _modified(file)) for file in files], client]).encode())
+    # Unix socket paths are limited to around 100 bytes, so the name is kept short.
+    return default_store_dir() / "daemons" / f"{digest.hexdigest()[:16]}.sock"
+
+
+def app_sources(app: "typer.Typer") -> set[str]:
+    """Returns the source files of the callbacks of app and all of its commands and groups."""
+    sources: set[str] = set()
+    stack = [app]
+    while stack:
+        typer_app = stack.pop()
+        callbacks = [command.callback for command in typer_app.registered_commands]
+        if typer_app.registered_callback is not None:
+            callbacks.append(typer_app.registered_callback.callback)
+        for callback in callbacks:
+            code = getattr(callback, "__code__", None)
+            if code is not None:
+                sources.add(code.co_filename)
+        stack.extend(group.typer_instance for group in typer_app.registered_groups if group.typer_instance)
+    return sources
+
+
+def _modified(path: str) -> int:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def caller_environment() -> dict[str, Any]:
+    """Returns the working directory, environment and umask of this process, to send with an ask request."""
+    # The umask can only be read by setting it.
+    umask = os.umask(0o077)
+    os.umask(umask)
+    return {"cwd": os.getcwd(), "env": dict(os.environ), "umask": umask}
+
+
+class AssistantDaemon:
+    """Serves asks to the assistant made by `assistant_factory` over a Unix socket at `path`.
+
+    The daemon stops once no ask has been running for `idle_timeout` seconds. Sessions are recorded in `sessions`, or
+    in a default SessionStore if it is not given.
+
+    Each ask runs in the working directory, environment and umask sent with it. As those belong to the whole process,
+    the daemon answers one ask at a time.
+    """
+
+    def __init__(
+        self,
+        assistant_factory: Callable[[], "TyperAssistant"],
+        path: Path,
+        idle_timeout: float = 600,
+        sessions: Optional["SessionStore"] = None,
+    ):
+        self.assistant_factory = assistant_factory
+        self.path = path
+        self.idle_timeout = idle_timeout
+        self.sessions = sessions
+        self.active = 0
+        self.last_active = time.monotonic()
+        self.lock = threading.Lock()
+        self.ask_lock = threading.Lock()
+
+    def warm(self) -> "TyperAssistant":
+        """Makes the assistant, and does everything an ask would otherwise do before starting a run."""
+        self.assistant = self.assistant_factory()
+        self.assistant.catalogue()
+        self.assistant.get_assistant()
+        return self.assistant
+
+    def serve(self, ready: Optional[Callable[[], None]] = None):
+        """Binds the socket and serves asks until the daemon has been idle for idle_timeout seconds.
+
+        warm() must be called first. ready is called once the socket is accepting connections.
+        """
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                with daemon.lock:
+                    daemon.active += 1
+                try:
+                    line = self.rfile.readline()
+                    # A daemon starting up connects without a request, to see if this one is listening.
+                    if not line:
+                        return
+                    request = json.loads(line)
+                    for message in daemon.events(request):
+                        self.wfile.write(json.dumps(message).encode() + b"\n")
+                        self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    with daemon.lock:
+                        daemon.active -= 1
+                        daemon.last_active = time.monotonic()
+
+        # Only the user may reach the socket, even in the moment between binding it and setting its mode.
+        self.path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        # Two asks may start a daemon at once. The lock lets only one of them bind the socket, and stops a daemon which
+        # is shutting down from removing the socket of the one replacing it.
+        with _locked(self.path):
+            if _listening(self.path):
+                # Another daemon started first, and answers the asks.
+                if ready is not None:
+                    ready()
+                return
+            self.path.unlink(missing_ok=True)
+            server = socketserver.ThreadingUnixStreamServer(str(self.path), Handler)
+            os.chmod(self.path, 0o600)
+            bound = os.stat(self.path).st_ino
+        with server:
+            server.daemon_threads = True
+            server.timeout = min(1.0, self.idle_timeout)
+            if ready is not None:
+                ready()
+            try:
+                while not self.idle():
+                    server.handle_request()
+            finally:
+                with _locked(self.path):
+                    if _inode(self.path) == bound:
+                        self.path.unlink()
+
+    def idle(self) -> bool:
+        with self.lock:
+            return self.active == 0 and time.monotonic() - self.last_active >= self.idle_timeout
+
+    def events(self, request: dict[str, Any]) -> Iterator[dict[str, Any]]:
+        """Answers an ask request, yielding a message for each event of the run.
+
+        The request has a "query", and optionally "use_commands" (default True), "session" (the name of a conversation
+        to continue), and the "cwd", "env" and "umask" to run commands with (see caller_environment()). Commands are
+        never confirmed, as the daemon has no terminal to ask on.
+        """
+        with self.ask_lock, _environment(request):
+            yield from self._events(request)
+
+    def _events(self, request: dict[str, Any]) -> Iterator[dict[str, Any]]:
+        try:
+            thread = None
+            if request.get("session") is not None:
+                from .sessions import SessionStore
+
+                store = self.sessions or SessionStore()
+                key = store.key(self.assistant.name, request["session"])
+                thread = self.assistant.session_thread(store.get(key))
+                store.set(key, thread.id)
+
+            calls: dict[str, str] = {}
+            for event in self.assistant.ask_stream(
+                request["query"],
+                thread=thread,
+                use_commands=request.get("use_commands", True),
+                confirm_commands=False,
+            ):
+                yield event_message(event, calls)
+        except Exception as e:
+            yield {"event": "error", "error": f"{type(e).__name__}: {e}"}
+
+
+@contextmanager
+def _environment(request: dict[str, Any]) -> Iterator[None]:
+    """Switches to the working directory, environment and umask of request, if given, until the context exits."""
+    cwd, env, umask = os.getcwd(), dict(os.environ), os.umask(0o077)
+    os.umask(umask)
+    try:
+        if request.get("cwd") is not None:
+            os.chdir(request["cwd"])
+        if request.get("env") is not None:
+            os.environ.clear()
+            os.environ.update(request["env"])
+        if request.get("umask") is not None:
+            os.umask(request["umask"])
+        yield
+    finally:
+        os.chdir(cwd)
+        os.environ.clear()
+        os.environ.update(env)
+        os.umask(umask)
+
+
+@contextmanager
+def _locked(path: Path) -> Iterator[None]:
+    """Holds an exclusive lock on the lock file beside the socket at path until the context exits."""
+    with open(path.with_suffix(".lock"), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def _listening(path: Path) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(str(path))
+        except OSError:
+            return False
+    return True
+
+
+def _inode(path: Path) -> Optional[int]:
+    try:
+        return os.stat(path).st_ino
+    except FileNotFoundError:
+        return None
+
+
+def event_message(event: "RunEvent", calls: dict[str, str]) -> dict[str, Any]:
+    """Returns the protocol message for a RunEvent. calls remembers the title of each tool call, by call ID."""
+    match event.event:
+        case "status":
+            return {"event": "status", "status": event.run.status}
+        case "tool_calls":
+            for call in event.data:
+                argtxt = str(json.loads(call.function.arguments)).strip("{}")
+                calls[call.id] = shorten(f"{call.function.name}({argtxt})", 50)
+            return {"event": "tool_calls", "names": [call.function.name for call in event.data]}
+        case "tool_outputs":
+            outputs = [{"title": calls.get(out["tool_call_id"], ""), "output": out["output"]} for out in event.data]
+            return {"event": "tool_outputs", "outputs": outputs}
+        case _:
+            return {"event": "text", "text": event.data}
+
+
+def start_daemon(daemon: AssistantDaemon):
+    """Starts the daemon in a detached process forked from this one, returning once it is ready to serve.
+
+    Raises RuntimeError if the daemon fails to start, eg. because the remote assistant can't be found or made.
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        # Detach from the terminal and the parent's process group, then fork again so that the daemon isn't the
+        # child of a process that will exit.
+        os.close(read_fd)
+        os.setsid()
+        if os.fork() != 0:
+            os._exit(0)
+        _run_daemon(daemon, write_fd)
+
+    os.close(write_fd)
+    os.waitpid(pid, 0)
+    with os.fdopen(read_fd, "rb") as ready:
+        status = ready.read().decode()
+    if status != "ok":
+        raise RuntimeError(f"The assistant daemon failed to start: {status or 'it exited unexpectedly'}")
+
+
+def _run_daemon(daemon: AssistantDaemon, ready_fd: int):
+    """The body of the daemon process. Never returns."""
+    code = 0
+    try:
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fd in (0, 1, 2):
+            os.dup2(devnull, fd)
+        os.close(devnull)
+        try:
+            daemon.warm()
+        except BaseException as e:
+            os.write(ready_fd, f"{type(e).__name__}: {e}".encode())
+            raise
+
+        def ready():
+            os.write(ready_fd, b"ok")
+            os.close(ready_fd)
+
+        daemon.serve(ready)
+    except BaseException:
+        code = 1
+    finally:
+        os._exit(code)
+
+
+def ask_daemon(path: Path, request: dict[str, Any]) -> Iterator[dict[str, Any]]:
+    """Sends an ask request to the daemon listening at path, yielding its messages.
+
+    Raises OSError (eg. FileNotFoundError or ConnectionRefusedError) if no daemon is listening.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(str(path))
+        sock.sendall(json.dumps(request).encode() + b"\n")
+        with sock.makefile("rb") as replies:
+            for line in replies:
+                yield json.loads(line)
+
+
+def daemon_events(daemon: AssistantDaemon, request: dict[str, Any]) -> Iterator[dict[str, Any]]:
+    """Like ask_daemon(), but starts the daemon first if it isn't already running."""
+    replies = ask_daemon(daemon.path, request)
+    first = _first(replies)
+    if first is None:
+        # No daemon, a stale socket left by one that died, or one that shut down just as we connected.
+        start_daemon(daemon)
+        replies = ask_daemon(daemon.path, request)
+        first = next(replies)
+    yield first
+    yield from replies
+
+
+def _first(replies: Iterator[dict[str, Any]]) -> Optional[dict[str, Any]]:
+    try:
+        return next(replies, None)
+    except (FileNotFoundError, ConnectionRefusedError, ConnectionResetError):
+        return None
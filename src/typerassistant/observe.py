@@ -0,0 +1,143 @@
+"""Timing spans for each phase of an assistant's work, reported to a pluggable Observer.
+
+Set Assistant.observer to receive a Span for each phase of ask(): finding the remote assistant, creating the thread
+and message, each status of the run (so time spent queued and time the model spent working can be told apart), each
+poll and the sleep before it, running commands, and submitting their outputs. Spans nest, so an observer can attribute
+time to the ask that caused it. When no observer is set, no spans are made at all.
+"""
+from __future__ import annotations
+
+import time
+from collections import defaultdict
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+_current: ContextVar[Optional[Span]] = ContextVar("typerassistant_span", default=None)
+
+
+@dataclass(eq=False)
+class Span:
+    """A timed phase of work. Times are from time.perf_counter(), in seconds."""
+
+    name: str
+    attributes: dict[str, Any] = field(default_factory=dict)
+    parent: Optional[Span] = None
+    start: float = field(default_factory=time.perf_counter)
+    end: Optional[float] = None
+    error: Optional[BaseException] = None
+
+    @property
+    def duration(self) -> Optional[float]:
+        return None if self.end is None else self.end - self.start
+
+
+class Observer:
+    """Receives spans as they start and end. Subclass this and override either or both methods."""
+
+    def span_started(self, span: Span) -> None:
+        pass
+
+    def span_ended(self, span: Span) -> None:
+        pass
+
+
+class CallbackObserver(Observer):
+    """An Observer that calls `callback` with each span as it ends."""
+
+    def __init__(self, callback: Callable[[Span], None]):
+        self.callback = callback
+
+    def span_ended(self, span: Span) -> None:
+        self.callback(span)
+
+
+class SpanRecorder(Observer):
+    """An Observer that keeps every ended span, for inspection after the fact."""
+
+    def __init__(self):
+        self.spans: list[Span] = []
+
+    def span_ended(self, span: Span) -> None:
+        self.spans.append(span)
+
+    def totals(self) -> dict[str, float]:
+        """Returns the total time spent in spans of each name."""
+        totals: dict[str, float] = defaultdict(float)
+        for span in self.spans:
+            totals[span.name] += span.duration or 0.0
+        return dict(totals)
+
+
+class OpenTelemetryObserver(Observer):
+    """An Observer that reports spans to OpenTelemetry. Requires the opentelemetry-api package.
+
+    Spans are made with `tracer`, or by default with a tracer from the global tracer provider.
+    """
+
+    def __init__(self, tracer: Any = None):
+        from opentelemetry import trace
+
+        self.trace = trace
+        self.tracer = tracer or trace.get_tracer("typerassistant")
+        self.otel_spans: dict[Span, Any] = {}
+
+    def span_started(self, span: Span) -> None:
+        context = None
+        if span.parent is not None and span.parent in self.otel_spans:
+            context = self.trace.set_span_in_context(self.otel_spans[span.parent])
+        self.otel_spans[span] = self.tracer.start_span(
+            f"typerassistant.{span.name}", context=context, attributes=_otel_attributes(span.attributes)
+        )
+
+    def span_ended(self, span: Span) -> None:
+        otel_span = self.otel_spans.pop(span, None)
+        if otel_span is None:
+            return
+        if span.error is not None:
+            otel_span.record_exception(span.error)
+            otel_span.set_status(self.trace.Status(self.trace.StatusCode.ERROR, str(span.error)))
+        otel_span.end()
+
+
+def _otel_attributes(attributes: dict[str, Any]) -> dict[str, Any]:
+    # OpenTelemetry only accepts primitive attribute values
+    return {
+        key: value if isinstance(value, (str, bool, int, float)) else str(value) for key, value in attributes.items()
+    }
+
+
+def start_span(observer: Observer, name: str, parent: Optional[Span] = None, **attributes) -> Span:
+    """Starts a span, as a child of parent or else of the current span. It must be ended with end_span().
+
+    Unlike span(), this doesn't make the new span current, so it is safe to use across a yield.
+    """
+    span = Span(name=name, attributes=attributes, parent=parent or _current.get())
+    observer.span_started(span)
+    return span
+
+
+def end_span(observer: Observer, span: Span, error: Optional[BaseException] = None):
+    span.end = time.perf_counter()
+    span.error = error
+    observer.span_ended(span)
+
+
+@contextmanager
+def span(observer: Observer, name: str, parent: Optional[Span] = None, **attributes) -> Iterator[Span]:
+    """Times the body of the with statement as a span, which is the parent of any spans started inside it.
+
+    The body must not yield (from a generator), as the span would stay current for the generator's caller.
+    """
+    current = start_span(observer, name, parent, **attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        _current.reset(token)
+        end_span(observer, current, e)
+        raise
+    _current.reset(token)
+    end_span(observer, current)
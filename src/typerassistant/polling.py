@@ -0,0 +1,53 @@
+import random
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass(frozen=True)
+class PollingStrategy:
+    """How often to check on a remote run while waiting for it to finish.
+
+    Polling starts at `initial` seconds and grows by `factor` on each poll, up to `maximum`. Each interval is then
+    randomly shortened by up to `jitter` (a fraction of the interval) so that many concurrent asks don't poll in
+    lockstep. A strategy of `PollingStrategy(initial=3, factor=1, jitter=0)` reproduces a fixed 3 second sleep.
+    """
+
+    initial: float = 0.25
+    factor: float = 1.6
+    maximum: float = 3.0
+    jitter: float = 0.2
+
+    def intervals(self) -> Iterator[float]:
+        """Yields an endless sequence of sleep intervals, in seconds."""
+        interval = self.initial
+        while True:
+            yield interval - random.uniform(0, self.jitter * interval)
+            interval = min(interval * self.factor, self.maximum)
+
+
+@dataclass
+class Deadline:
+    """A wall-clock deadline, measured on the monotonic clock. A timeout of None never expires."""
+
+    timeout: Optional[float]
+
+    def __post_init__(self):
+        self.start = time.monotonic()
+
+    def remaining(self) -> Optional[float]:
+        if self.timeout is None:
+            return None
+        return self.timeout - (time.monotonic() - self.start)
+
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def clamp(self, interval: float) -> float:
+        """Shortens interval so that sleeping for it does not overshoot the deadline."""
+        remaining = self.remaining()
+        if remaining is None:
+            return interval
+        return max(0.0, min(interval, remaining))
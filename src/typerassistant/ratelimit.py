@@ -0,0 +1,44 @@
+import asyncio
+import threading
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """A thread-safe token bucket, allowing `rate` acquisitions per `per` seconds on average.
+
+    Up to `capacity` tokens (by default, one) can be saved up while the bucket is idle and then spent in a burst.
+    """
+
+    def __init__(self, rate: float, per: float = 60.0, capacity: Optional[float] = None):
+        if rate <= 0 or per <= 0:
+            raise ValueError("rate and per must be positive")
+        # With room for less than a whole token, no token could ever be taken.
+        if capacity is not None and capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.interval = per / rate
+        self.capacity = capacity if capacity is not None else 1.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Takes a token, blocking until one is available."""
+        while (wait := self._take()) > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """Like acquire(), without blocking the event loop."""
+        while (wait := self._take()) > 0:
+            await asyncio.sleep(wait)
+
+    def _take(self) -> float:
+        """Takes a token and returns 0 if one is available, or else returns how long to wait for one."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) / self.interval)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) * self.interval
@@ -0,0 +1,131 @@
+"""register_assistant, kept apart from the rest of the package so that defining a CLI stays cheap.
+
+Importing this module does not import openai or build any clients. Everything the assistant needs is imported and
+created when the ask command actually runs, so other commands of the app (and --help) don't pay for it.
+"""
+from __future__ import annotations
+
+import sys
+from typing import TYPE_CHECKING, Callable, Optional
+
+import typer
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+    from .sessions import SessionStore
+    from .typer import TyperAssistant
+
+
+def register_assistant(
+    app: typer.Typer,
+    command_name: str = "ask",
+    client: Optional[OpenAI] = None,
+    client_factory: Optional[Callable[[], OpenAI]] = None,
+    use_registry: bool = True,
+    sessions: Optional[SessionStore] = None,
+    daemon: bool = False,
+    daemon_idle_timeout: float = 600,
+) -> None:
+    """Create a command for the typer application that queries an automatically generated assistant.
+
+    The client is only created (with client_factory, if given) when the command is run. The assistant retries failed
+    requests itself (see the resilience module), so a given client should be made with max_retries=0.
+
+    If use_registry is True, the assistant's ID is remembered on disk (see AssistantRegistry) so that each invocation
+    of the command doesn't need to list every remote assistant to find it.
+
+    The command's --stream option reports the progress of the run as it happens. The --session option continues a
+    named conversation from an earlier invocation. Sessions are recorded in `sessions`, or in a default SessionStore if
+    it is not given.
+
+    If daemon is True, asks are answered by a local daemon process which keeps the assistant warm between invocations,
+    started by the first ask and stopped after daemon_idle_timeout seconds without one. See the daemon module. Asks
+    which confirm commands or replace the assistant are still answered in-process.
+    """
+    if client is not None and client_factory is not None:
+        raise ValueError("Cannot specify both client and client_factory")
+
+    def _ask_command(
+        query: str,
+        use_commands: bool = True,
+        confirm_commands: bool = False,
+        replace_assistant: bool = False,
+        session: Optional[str] = None,
+        stream: bool = False,
+    ):
+        """Ask an assistant for help, optionally using other commands from this application."""
+        from .sessions import SessionStore
+
+        if daemon and not confirm_commands and not replace_assistant:
+            _ask_daemon(query, use_commands, session, stream)
+            return
+
+        assistant = _make_assistant(replace_assistant)
+
+        thread = None
+        if session is not None:
+            store = sessions or SessionStore()
+            key = store.key(assistant.name, session)
+            thread = assistant.session_thread(store.get(key))
+            store.set(key, thread.id)
+
+        if not stream:
+            print(assistant.ask(query, thread=thread, use_commands=use_commands, confirm_commands=confirm_commands))
+            return
+
+        # Progress goes to stderr, so that stdout holds only the response just as it does without --stream.
+        for event in assistant.ask_stream(
+            query, thread=thread, use_commands=use_commands, confirm_commands=confirm_commands
+        ):
+            match event.event:
+                case "status":
+                    typer.secho(f"Run {event.run.status.replace('_', ' ')}", dim=True, err=True)
+                case "tool_calls":
+                    names = ", ".join(call.function.name for call in event.data)
+                    typer.secho(f"Running {names}", dim=True, err=True)
+                case "text":
+                    print(event.data)
+
+    def _make_assistant(replace: bool = False) -> TyperAssistant:
+        from .registry import AssistantRegistry
+        from .typer import TyperAssistant
+
+        kwargs = {}
+        if client is not None:
+            kwargs["client"] = client
+        elif client_factory is not None:
+            kwargs["client"] = client_factory()
+        if use_registry:
+            kwargs["registry"] = AssistantRegistry()
+        return TyperAssistant(app=app, replace=replace, **kwargs)
+
+    def _ask_daemon(query: str, use_commands: bool, session: Optional[str], stream: bool):
+        from rich import print as rich_print
+        from rich.panel import Panel
+
+        from .daemon import AssistantDaemon, app_sources, caller_environment, daemon_events, socket_path
+
+        name = app.info.name if isinstance(app.info.name, str) else sys.argv[0]
+        path = socket_path(name, app_sources(app))
+        assistant_daemon = AssistantDaemon(_make_assistant, path, daemon_idle_timeout, sessions)
+        request = {"query": query, "use_commands": use_commands, "session": session, **caller_environment()}
+        for message in daemon_events(assistant_daemon, request):
+            match message["event"]:
+                case "status" if stream:
+                    typer.secho(f"Run {message['status'].replace('_', ' ')}", dim=True, err=True)
+                case "tool_calls" if stream:
+                    typer.secho(f"Running {', '.join(message['names'])}", dim=True, err=True)
+                case "tool_outputs":
+                    # The commands ran in the daemon, so show their output here as they would be shown in-process.
+                    for output in message["outputs"]:
+                        rich_print(
+                            Panel(output["output"], border_style="dim", title=output["title"], title_align="left")
+                        )
+                case "text":
+                    print(message["text"])
+                case "error":
+                    typer.secho(message["error"], fg="red", err=True)
+                    raise typer.Exit(1)
+
+    app.command(command_name, context_settings={"obj": {"omit_from_assistant": True}})(_ask_command)
@@ -0,0 +1,41 @@
+import hashlib
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Optional
+
+from .store import JSONStore, default_store_dir
+
+
+@dataclass
+class AssistantRegistry:
+    """A local record of remote assistant IDs, so that an assistant can be found without listing every assistant.
+
+    Entries are keyed by the assistant's name and the API key and organization used to reach it. The key is hashed, so
+    API keys are never written to disk.
+    """
+
+    path: Path = field(default_factory=lambda: default_store_dir() / "assistants.json")
+
+    def __post_init__(self):
+        self.store = JSONStore(self.path)
+
+    @staticmethod
+    def key(name: str, client: Any) -> str:
+        """Returns the registry key for the assistant called name, as seen by client (an OpenAI or AsyncOpenAI)."""
+        parts = [name, getattr(client, "api_key", None), getattr(client, "organization", None)]
+        return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        return self.store.load().get(key)
+
+    def set(self, key: str, assistant_id: str):
+        data = self.store.load()
+        if data.get(key) != assistant_id:
+            data[key] = assistant_id
+            self.store.save(data)
+
+    def forget(self, key: str):
+        data = self.store.load()
+        if data.pop(key, None) is not None:
+            self.store.save(data)
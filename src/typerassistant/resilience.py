@@ -0,0 +1,260 @@
+"""Retries, backoff and circuit breaking for the OpenAI API requests an assistant makes.
+
+A rate limit or server error in the middle of a run would otherwise throw away a run that may have taken minutes.
+Every request an assistant makes goes through its Resilience, which retries transient failures with jittered
+exponential backoff (waiting as long as the API's Retry-After header asks), and trips a circuit breaker shared by every
+assistant in the process when the API keeps failing, so that a fleet of concurrent asks backs off together instead of
+hammering a degraded API.
+
+The openai client retries by itself too, which would multiply the attempts of each request. The clients assistants make
+for themselves (see the clients module) leave retrying to this layer, and clients given to an assistant should be made
+with max_retries=0 as well.
+"""
+import asyncio
+import random
+import threading
+import time
+from collections import Counter
+from collections.abc import Awaitable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Callable, Optional, TypeVar
+
+import openai
+
+from .polling import Deadline
+from .ratelimit import TokenBucket
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of making a request while the circuit breaker is open."""
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """How to retry a failed request.
+
+    A request is tried up to `attempts` times. Retries wait `initial` seconds, growing by `factor` on each retry up to
+    `maximum`, each randomly shortened by up to `jitter` (a fraction of the delay). If the API sends a Retry-After
+    header, that is waited instead, up to `maximum_retry_after` seconds.
+    """
+
+    attempts: int = 4
+    initial: float = 0.5
+    factor: float = 2.0
+    maximum: float = 20.0
+    jitter: float = 0.5
+    maximum_retry_after: float = 60.0
+
+    def delays(self) -> Iterator[float]:
+        """Yields the delay before each retry, in seconds, ignoring Retry-After."""
+        delay = self.initial
+        for _ in range(self.attempts - 1):
+            yield delay - random.uniform(0, self.jitter * delay)
+            delay = min(delay * self.factor, self.maximum)
+
+    def retry_after(self, error: Exception) -> Optional[float]:
+        """Returns how long the API asked us to wait before retrying, if it said."""
+        response = getattr(error, "response", None)
+        if response is None:
+            return None
+        headers = response.headers
+        try:
+            if "retry-after-ms" in headers:
+                seconds = float(headers["retry-after-ms"]) / 1000
+            elif "retry-after" in headers:
+                seconds = float(headers["retry-after"])
+            else:
+                return None
+        except ValueError:
+            # Retry-After may also be an HTTP date, which isn't worth parsing for the delays involved.
+            return None
+        return min(max(seconds, 0.0), self.maximum_retry_after)
+
+
+def retryable(error: Exception) -> bool:
+    """Returns True if error is transient: a rate limit, a server error, or a failure to connect."""
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return False
+
+
+class CircuitBreaker:
+    """Stops requests for `cooldown` seconds after `threshold` transient failures in a row.
+
+    While open, requests fail immediately with CircuitOpenError. Once the cooldown has passed, a single trial request is
+    let through: if it succeeds the breaker closes, otherwise it opens again.
+    """
+
+    def __init__(self, threshold: int = 5, cooldown: float = 30.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Returns True if a request may be made now."""
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.trial or time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            self.trial = True
+            return True
+
+    def succeeded(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def abandoned(self):
+        """Records that a request ended without an outcome, eg. because it was interrupted, so as not to hold the trial."""
+        with self.lock:
+            self.trial = False
+
+    def failed(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self.trial = False
+
+    @property
+    def open(self) -> bool:
+        with self.lock:
+            return self.opened_at is not None
+
+
+# The circuit breaker shared by every assistant that isn't given its own, so that they all back off together.
+shared_breaker = CircuitBreaker()
+
+# The limit on the rate of requests made in the current context, if any. See limit_requests().
+_request_limit: ContextVar[Optional[TokenBucket]] = ContextVar("request_limit", default=None)
+
+
+@contextmanager
+def limit_requests(bucket: Optional[TokenBucket]) -> Iterator[None]:
+    """Takes a token from bucket for every request (including retries) made in this context, until it exits."""
+    token = _request_limit.set(bucket)
+    try:
+        yield
+    finally:
+        _request_limit.reset(token)
+
+
+@dataclass
+class Resilience:
+    """The request layer of an assistant: retries each request according to `retry`, guarded by `breaker`.
+
+    Counts of requests, retries, failures and requests refused by the breaker are kept in `stats`, both in total and
+    per endpoint, eg. stats["retries"] and stats["runs.retrieve.retries"].
+    """
+
+    retry: RetryPolicy = field(default_factory=RetryPolicy)
+    breaker: Optional[CircuitBreaker] = field(default_factory=lambda: shared_breaker)
+    stats: Counter[str] = field(default_factory=Counter, init=False)
+    # One Resilience is shared by the threads of ask_many, which count their requests concurrently.
+    _stats_lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False, compare=False)
+
+    def call(self, endpoint: str, request: Callable[..., T], *args, deadline: Optional[Deadline] = None, **kwargs) -> T:
+        """Makes a request, named endpoint for the stats, retrying it if it fails transiently.
+
+        If a deadline is given, the request isn't retried once the wait before retrying would reach it.
+        """
+        delays = self.retry.delays()
+        while True:
+            self._check(endpoint)
+            if (bucket := _request_limit.get()) is not None:
+                bucket.acquire()
+            try:
+                result = request(*args, **kwargs)
+            except Exception as e:
+                delay = self._failed(endpoint, e, delays, deadline)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            except BaseException:
+                self._abandoned()
+                raise
+            self._succeeded()
+            return result
+
+    async def acall(
+        self,
+        endpoint: str,
+        request: Callable[..., Awaitable[T]],
+        *args,
+        deadline: Optional[Deadline] = None,
+        **kwargs,
+    ) -> T:
+        """Like call(), for a coroutine function."""
+        delays = self.retry.delays()
+        while True:
+            self._check(endpoint)
+            if (bucket := _request_limit.get()) is not None:
+                await bucket.acquire_async()
+            try:
+                result = await request(*args, **kwargs)
+            except Exception as e:
+                delay = self._failed(endpoint, e, delays, deadline)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # eg. KeyboardInterrupt, or the task being cancelled
+                self._abandoned()
+                raise
+            self._succeeded()
+            return result
+
+    def _count(self, endpoint: str, event: str):
+        with self._stats_lock:
+            self.stats[event] += 1
+            self.stats[f"{endpoint}.{event}"] += 1
+
+    def _check(self, endpoint: str):
+        if self.breaker is not None and not self.breaker.allow():
+            self._count(endpoint, "short_circuits")
+            raise CircuitOpenError(f"Not calling {endpoint}: the OpenAI API has been failing, so requests are paused")
+        self._count(endpoint, "requests")
+
+    def _succeeded(self):
+        if self.breaker is not None:
+            self.breaker.succeeded()
+
+    def _abandoned(self):
+        if self.breaker is not None:
+            self.breaker.abandoned()
+
+    def _failed(
+        self, endpoint: str, error: Exception, delays: Iterator[float], deadline: Optional[Deadline]
+    ) -> Optional[float]:
+        """Records a failed request, returning how long to wait before retrying it, or None if it shouldn't be."""
+        if not retryable(error):
+            # The API is working; it just didn't like this request.
+            self._succeeded()
+            return None
+        if self.breaker is not None:
+            self.breaker.failed()
+        self._count(endpoint, "failures")
+        delay = next(delays, None)
+        if delay is None or (self.breaker is not None and self.breaker.open):
+            return None
+        retry_after = self.retry.retry_after(error)
+        if retry_after is not None:
+            delay = retry_after
+        remaining = deadline.remaining() if deadline is not None else None
+        if remaining is not None and delay >= remaining:
+            return None
+        self._count(endpoint, "retries")
+        return delay
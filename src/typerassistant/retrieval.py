@@ -0,0 +1,81 @@
+"""Offline retrieval of the tools most relevant to a query, so that large CLIs needn't send every tool on every run.
+
+ToolIndex is a BM25 index over each function's name, description and parameters. It runs locally, with no network
+access or extra dependencies.
+"""
+import heapq
+import math
+import re
+from collections import Counter
+from collections.abc import Iterable
+
+from .spec import FunctionSpec
+
+# BM25's term frequency saturation and document length normalization parameters, at their usual values.
+K1 = 1.2
+B = 0.75
+
+# How many times a function's name counts towards its term frequencies, relative to its help text.
+NAME_WEIGHT = 3
+
+
+class ToolIndex:
+    """A BM25 index of FunctionSpecs, for finding the functions most relevant to a query."""
+
+    def __init__(self, functions: Iterable[FunctionSpec]):
+        self.functions = list(functions)
+        self.postings: dict[str, list[tuple[int, int]]] = {}
+        self.lengths: list[int] = []
+        for doc, function in enumerate(self.functions):
+            terms = Counter(_document_terms(function))
+            self.lengths.append(sum(terms.values()))
+            for term, count in terms.items():
+                self.postings.setdefault(term, []).append((doc, count))
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+
+    def search(self, query: str, k: int) -> list[FunctionSpec]:
+        """Returns the k functions which best match query, best first.
+
+        Ties (including functions which don't match at all) keep the order the functions were indexed in, so that k
+        functions are always returned if there are that many.
+        """
+        if k >= len(self.functions):
+            return self.functions
+        scores = self.scores(query)
+        best = heapq.nsmallest(k, range(len(self.functions)), key=lambda doc: (-scores.get(doc, 0.0), doc))
+        return [self.functions[doc] for doc in best]
+
+    def scores(self, query: str) -> dict[int, float]:
+        """Returns the BM25 score of each function (by index) which matches any term of query."""
+        scores: dict[int, float] = {}
+        total = len(self.functions)
+        for term in set(_terms(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc, count in postings:
+                norm = K1 * (1 - B + B * self.lengths[doc] / self.average_length)
+                scores[doc] = scores.get(doc, 0.0) + idf * count * (K1 + 1) / (count + norm)
+        return scores
+
+
+def _document_terms(function: FunctionSpec) -> list[str]:
+    terms = _terms(function.name) * NAME_WEIGHT + _terms(function.description or "")
+    for param in function.parameters:
+        terms += _terms(param.name) + _terms(param.description or "")
+    return terms
+
+
+def _terms(text: str) -> list[str]:
+    # Splits on anything but letters and digits, including the "." and "_" in function names.
+    return [_stem(word) for word in re.findall(r"[a-z0-9]+", text.lower())]
+
+
+def _stem(word: str) -> str:
+    """A very light stemmer, which only folds plurals, so that eg. "cats" matches "cat"."""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us")):
+        return word[:-1]
+    return word
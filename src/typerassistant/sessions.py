@@ -0,0 +1,54 @@
+import getpass
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from .store import JSONStore, default_store_dir
+
+
+@dataclass
+class SessionStore:
+    """A local record of named conversations, mapping each session to the OpenAI thread it continues.
+
+    Sessions expire `ttl` seconds after they were last used (None never expires), and only the `max_sessions` most
+    recently used sessions are kept.
+    """
+
+    path: Path = field(default_factory=lambda: default_store_dir() / "sessions.json")
+    ttl: Optional[float] = 7 * 24 * 60 * 60
+    max_sessions: int = 100
+
+    def __post_init__(self):
+        self.store = JSONStore(self.path)
+
+    @staticmethod
+    def key(app_name: str, session: str, user: Optional[str] = None) -> str:
+        """Returns the key for a session of app_name, for user (by default the current user)."""
+        return f"{user or getpass.getuser()}:{app_name}:{session}"
+
+    def get(self, key: str) -> Optional[str]:
+        """Returns the thread ID of the session, if it exists and hasn't expired."""
+        entry = self.store.load().get(key)
+        if entry is None or self._expired(entry):
+            return None
+        return entry["thread_id"]
+
+    def set(self, key: str, thread_id: str):
+        """Records the thread ID of a session, marking it as just used."""
+        data = self.store.load()
+        data[key] = {"thread_id": thread_id, "used": time.time()}
+        live = sorted(
+            ((k, entry) for k, entry in data.items() if not self._expired(entry)),
+            key=lambda item: item[1]["used"],
+        )
+        # Not live[-self.max_sessions :], which keeps every session when max_sessions is 0
+        self.store.save(dict(live[max(len(live) - self.max_sessions, 0) :]))
+
+    def forget(self, key: str):
+        data = self.store.load()
+        if data.pop(key, None) is not None:
+            self.store.save(data)
+
+    def _expired(self, entry: dict) -> bool:
+        return self.ttl is not None and time.time() - entry["used"] > self.ttl
@@ -1,11 +1,18 @@
-from dataclasses import dataclass
-from typing import Any, Callable, Optional
+import re
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Callable, Optional
 
 from openai.types.beta.assistant_create_params import ToolAssistantToolsFunction
 from openai.types.shared_params import FunctionDefinition, FunctionParameters
 
+from .capture import OutputLimit
 
-@dataclass
+if TYPE_CHECKING:
+    from .retrieval import ToolIndex
+
+
+@dataclass(slots=True)
 class ParameterSpec:
     name: str
     description: str
@@ -21,14 +28,27 @@ class ParameterSpec:
         }
 
 
-@dataclass
+@dataclass(slots=True)
 class FunctionSpec:
     name: str
     description: str
     parameters: list[ParameterSpec]
     action: Callable[..., Any]
+    # Overrides the assistant's budget for this function's captured output
+    output_limit: Optional[OutputLimit] = None
+    # Whether the function is pure, so that its output can be reused within a thread, and for how many seconds (None
+    # means for as long as the thread is in use)
+    cacheable: bool = False
+    cache_ttl: Optional[float] = None
+    # tool() is memoized, so a FunctionSpec should not be modified once built.
+    _tool: Optional[ToolAssistantToolsFunction] = field(default=None, init=False, repr=False, compare=False)
 
     def tool(self) -> ToolAssistantToolsFunction:
+        if self._tool is None:
+            self._tool = self._build_tool()
+        return self._tool
+
+    def _build_tool(self) -> ToolAssistantToolsFunction:
         return ToolAssistantToolsFunction(
             type="function",
             function=FunctionDefinition(
@@ -56,6 +76,87 @@ class FunctionSpec:
         return parameters
 
 
+class SuffixIndex:
+    """Finds names by their trailing segments, eg. "list" or "cats.list" for "example_3.py.cats.list".
+
+    Names are split in to segments on "." and "/", and the reversed segments are stored in a trie. Each trie node lists
+    every name that ends with the path to it, so a lookup costs one step per segment of the query no matter how many
+    names are indexed.
+    """
+
+    def __init__(self, names: Iterable[str]):
+        self.root = _SuffixNode()
+        for name in names:
+            node = self.root
+            for segment in reversed(_segments(name)):
+                node = node.children.setdefault(segment, _SuffixNode())
+                node.names.append(name)
+
+    def find(self, suffix: str) -> list[str]:
+        """Returns every name ending in the segments of suffix."""
+        node = self.root
+        for segment in reversed(_segments(suffix)):
+            next_node = node.children.get(segment)
+            if next_node is None:
+                return []
+            node = next_node
+        return node.names
+
+
+class _SuffixNode:
+    __slots__ = ("children", "names")
+
+    def __init__(self):
+        self.children: dict[str, _SuffixNode] = {}
+        self.names: list[str] = []
+
+
+def _segments(name: str) -> list[str]:
+    return re.split(r"[./]", name)
+
+
+class FunctionCatalogue:
+    """The FunctionSpecs of an assistant, indexed by name, along with their prebuilt tool definitions."""
+
+    def __init__(self, functions: list[FunctionSpec]):
+        self.functions = functions
+        self.by_name = {func.name: func for func in functions}
+        self.suffixes = SuffixIndex(self.by_name)
+        self.tools = [func.tool() for func in functions]
+        self._index: Optional[ToolIndex] = None
+
+    def search(self, query: str, k: int) -> list[FunctionSpec]:
+        """Returns the k functions most relevant to query. See retrieval.ToolIndex."""
+        if self._index is None:
+            # The index is only needed by assistants with a tool_limit, so it is built on first use.
+            from .retrieval import ToolIndex
+
+            self._index = ToolIndex(self.functions)
+        return self._index.search(query, k)
+
+    def resolve(self, name: str) -> FunctionSpec:
+        """Returns the function called name, or else the only function whose name ends with name.
+
+        Sometimes the LLM thinks typer arg0 is a file and thus insists on pulling it out of the function name, so this
+        also accepts trailing parts of function names. A ValueError is raised if no function, or more than one
+        function, matches.
+        """
+        if name in self.by_name:
+            return self.by_name[name]
+        matches = self.suffixes.find(name)
+        if len(matches) == 1:
+            return self.by_name[matches[0]]
+        if not matches:
+            raise ValueError(f"Unknown function {name}")
+        raise ValueError(f"Ambiguous function {name}, could be any of: {', '.join(matches)}")
+
+    def __iter__(self) -> Iterator[FunctionSpec]:
+        return iter(self.functions)
+
+    def __len__(self) -> int:
+        return len(self.functions)
+
+
 @dataclass
 class FunctionCall:
     call_id: str
@@ -0,0 +1,38 @@
+"""Small JSON files for state that typerassistant keeps on disk between invocations."""
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any
+
+import typer
+
+
+def default_store_dir() -> Path:
+    """Returns the directory typerassistant keeps its local state in, eg. ~/.config/typerassistant on linux."""
+    return Path(typer.get_app_dir("typerassistant"))
+
+
+class JSONStore:
+    """A JSON object persisted to a single file.
+
+    Writes replace the file atomically, so readers never see a partial file. Concurrent writers can lose each other's
+    updates, which is acceptable for the caches kept here.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def load(self) -> dict[str, Any]:
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def save(self, data: dict[str, Any]):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", dir=self.path.parent, prefix=self.path.name, delete=False) as f:
+            json.dump(data, f)
+        os.replace(f.name, self.path)
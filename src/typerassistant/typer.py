@@ -1,16 +1,31 @@
 from __future__ import annotations
 
 import sys
+from collections.abc import Hashable
 from dataclasses import KW_ONLY, dataclass, field
-from typing import Callable, Iterable, Optional, Type
+from typing import Any, Iterable, Iterator, Optional, Type
+from weakref import WeakKeyDictionary
 
 import typer
 from openai import OpenAI
-from typer.main import get_command_from_info
+from typer.main import get_command_from_info, get_command_name
+from typer.models import CommandInfo, TyperInfo
 
 from .assistant import Assistant, AssistantT
+from .capture import OutputLimit
+from .clients import shared_client
+from .register import register_assistant
 from .spec import FunctionSpec, ParameterSpec
 
+__all__ = (
+    "TyperAssistant",
+    "register_assistant",
+    "typerfunc",
+    "iter_typerfunc",
+    "cached_typerfunc",
+    "app_fingerprint",
+)
+
 
 @dataclass
 class TyperAssistant(Assistant):
@@ -38,7 +53,7 @@ class TyperAssistant(Assistant):
     @classmethod
     def from_id_with_app(cls, assistant_id: str, app: typer.Typer, client: Optional[OpenAI] = None) -> TyperAssistant:
         if client is None:
-            client = OpenAI()
+            client = shared_client()
         assistant = client.beta.assistants.retrieve(assistant_id)
         return TyperAssistant(
             app=app, client=client, instructions=assistant.instructions or cls.instructions, _assistant=assistant
@@ -47,42 +62,32 @@ class TyperAssistant(Assistant):
     def functions(self) -> Iterable[FunctionSpec]:
         """Generate FunctionSpecs from the Typer app."""
         yield from super().functions()  # currently a non-op but may be useful to others
-        for func in typerfunc(self.app):
-            yield func
+        yield from cached_typerfunc(self.app)
 
+    def catalogue_version(self) -> Hashable:
+        return app_fingerprint(self.app)
 
-def register_assistant(
-    app: typer.Typer,
-    command_name: str = "ask",
-    client: Optional[OpenAI] = None,
-    client_factory: Optional[Callable[[], OpenAI]] = None,
-) -> None:
-    """Create a command for the typer application that queries an automatically generated assistant."""
-    if client is not None and client_factory is not None:
-        raise ValueError("Cannot specify both client and client_factory")
 
-    if client_factory is not None:
-        client = client_factory()
-    elif client is None:
-        client = OpenAI()
+def typerfunc(app: typer.Typer, command_prefix: Optional[str] = None) -> list[FunctionSpec]:
+    """Returns a list of FunctionSpecs describing the CLI of app.
 
-    def _ask_command(
-        query: str, use_commands: bool = True, confirm_commands: bool = False, replace_assistant: bool = False
-    ):
-        """Ask an assistant for help, optionally using other commands from this application."""
-        assistant = TyperAssistant(app=app, replace=replace_assistant)
-        print(assistant.ask(query, use_commands=use_commands, confirm_commands=confirm_commands))
+    Commands in groups have the group names appended to command_prefix (by default the app's name) in their names.
 
-    app.command(command_name, context_settings={"obj": {"omit_from_assistant": True}})(_ask_command)
+    Omits commands with context_settings['omit_from_assistant'] set to True. See iter_typerfunc().
+    """
+    return list(iter_typerfunc(app, command_prefix))
 
 
-def typerfunc(app: typer.Typer, command_prefix: Optional[str] = None) -> list[FunctionSpec]:
-    """Returns a list of FunctionSpecs describing the CLI of app.
+def iter_typerfunc(
+    app: typer.Typer, command_prefix: Optional[str] = None, only: Optional[str] = None
+) -> Iterator[FunctionSpec]:
+    """Yields FunctionSpecs describing the CLI of app, in the same order as typerfunc(), building each only as needed.
 
-    This function recurses on command groups, with a command_prefix appended to the beginning of each command name in
-    that group.
+    If `only` is given, just the commands whose names are `only` or start with `only` and a "." are yielded, eg.
+    only="app.cats" for the commands of the cats group. Groups outside of `only` are skipped without building any of
+    their commands.
 
-    Omits commands with context_settings['omit_from_assistant'] set to True.
+    Groups are walked with an explicit stack rather than by recursion, so arbitrarily deep CLIs are fine.
     """
     if command_prefix is None:
         if isinstance(app.info.name, str):
@@ -90,54 +95,145 @@ def typerfunc(app: typer.Typer, command_prefix: Optional[str] = None) -> list[Fu
         else:
             command_prefix = sys.argv[0]
 
-    functions: list[FunctionSpec] = []
+    stack = [(app, command_prefix)]
+    while stack:
+        group_app, prefix = stack.pop()
+        for command_info in group_app.registered_commands or []:
+            spec = _command_spec(group_app, command_info, prefix, only)
+            if spec is not None:
+                yield spec
+
+        # Push groups in reverse so that they are visited in the order they were added.
+        for group in reversed(group_app.registered_groups):
+            # As with the command name, convert all dashes to underscores.
+            assert group.typer_instance is not None
+            assert group.name is not None
+            group_prefix = sys.intern(prefix + "." + group.name.replace("-", "_"))
+            if only is None or _within(group_prefix, only) or _within(only, group_prefix):
+                stack.append((group.typer_instance, group_prefix))
+
+
+def _within(name: str, prefix: str) -> bool:
+    """Returns True if name is prefix, or is inside it (eg. "app.cats.list" is within "app.cats")."""
+    return name == prefix or name.startswith(prefix + ".")
+
+
+def _command_spec(
+    app: typer.Typer, command_info: CommandInfo, command_prefix: str, only: Optional[str]
+) -> Optional[FunctionSpec]:
+    """Returns the FunctionSpec of a command, or None if it is omitted from the assistant or outside of `only`."""
+    settings = assistant_settings(command_info)
+    # omit_from_assistant was once read from the top level of context_settings, so that is still honoured.
+    if settings.get("omit_from_assistant", False) or (command_info.context_settings or {}).get("omit_from_assistant"):
+        return None
+
+    assert command_info.callback is not None
+    # Typer names commands the same way, but working it out here means commands outside of `only` are never built.
+    # It's documented here: https://typer.tiangolo.com/tutorial/commands/name/
+    #     "Note that any underscores in the function name will be replaced with dashes."
+    # Therefore, convert all dashes back to underscores. *shrug*
+    name = command_info.name or get_command_name(command_info.callback.__name__)
+    fullname = f"{command_prefix}.{name.replace('-', '_')}"
+    if only is not None and not _within(fullname, only):
+        return None
+
+    command = get_command_from_info(
+        command_info=command_info,
+        pretty_exceptions_short=app.pretty_exceptions_short,
+        rich_markup_mode=app.rich_markup_mode,
+    )
+
+    # Extract callback signature for parameters. Names and help text repeat a lot across the commands of large CLIs,
+    # so they are interned to share one copy of each.
+    params = []
+    for param in command.params:
+        descr = getattr(param, "help", "None")
+        assert param.name is not None
+
+        param_spec = ParameterSpec(
+            name=sys.intern(param.name),
+            description=_intern(descr),
+            default=_intern(str(param.default)) if param.default is not None else None,
+            required=param.required,
+        )
+
+        params.append(param_spec)
 
-    for command_info in app.registered_commands or []:
-        if command_info.context_settings and command_info.context_settings.get("omit_from_assistant", False):
-            continue
+    return FunctionSpec(
+        name=sys.intern(fullname),
+        description=_intern(getattr(command, "help", "None")),
+        parameters=params,
+        action=command_info.callback,
+        output_limit=output_limit(settings),
+        cacheable=settings.get("cacheable", False),
+        cache_ttl=settings.get("cache_ttl"),
+    )
 
-        command = get_command_from_info(
-            command_info=command_info,
-            pretty_exceptions_short=app.pretty_exceptions_short,
-            rich_markup_mode=app.rich_markup_mode,
-        )
-        assert command.name is not None
-        # I'm not sure where it happens, but it's documented here: https://typer.tiangolo.com/tutorial/commands/name/
-        #     "Note that any underscores in the function name will be replaced with dashes."
-        # Therefore, convert all dashes back to underscores. *shrug*
-        fullname = f"{command_prefix}.{command.name.replace('-', '_')}"
-
-        # Extract callback signature for parameters.
-        params = []
-        for param in command.params:
-            descr = getattr(param, "help", "None")
-            assert param.name is not None
-
-            param_spec = ParameterSpec(
-                name=param.name,
-                description=descr,
-                default=str(param.default) if param.default is not None else None,
-                required=param.required,
-            )
-
-            params.append(param_spec)
-
-        assert command_info.callback is not None
-        spec = FunctionSpec(
-            name=fullname,
-            description=getattr(command, "help", "None"),
-            parameters=params,
-            action=command_info.callback,
-        )
-        functions.append(spec)
-
-    # Iterate over registered groups, recursing on each
-    for group in app.registered_groups:
-        # As with the command name, convert all dashes to underscores.
-        assert group.typer_instance is not None
-        assert group.name is not None
-        functions.extend(
-            typerfunc(group.typer_instance, command_prefix=command_prefix + "." + group.name.replace("-", "_"))
-        )
 
-    return functions
+def _intern(text: Any) -> Any:
+    # str() as sys.intern only accepts exact strs, not subclasses
+    return sys.intern(str(text)) if isinstance(text, str) else text
+
+
+def assistant_settings(command_info: CommandInfo) -> dict[str, Any]:
+    """Returns the typerassistant settings of a command, from its context_settings' obj.
+
+    For example, @app.command(context_settings={"obj": {"omit_from_assistant": True}}) hides a command from the
+    assistant. Settings are kept in obj because click rejects unknown context_settings. The supported settings are:
+      * omit_from_assistant: if True, the assistant can't call this command.
+      * max_output_bytes, max_output_lines: the output budget for this command, see OutputLimit.
+      * cacheable: if True, the command is pure, so its output is reused when it is called again with the same
+        arguments in the same thread. See BaseAssistant.run_function_calls().
+      * cache_ttl: how many seconds a cacheable command's output may be reused for. By default, it is reused for as
+        long as the thread is in use.
+    """
+    context_settings = command_info.context_settings or {}
+    obj = context_settings.get("obj")
+    return obj if isinstance(obj, dict) else {}
+
+
+def output_limit(settings: dict[str, Any]) -> Optional[OutputLimit]:
+    """Returns the OutputLimit set for a command by its assistant_settings, if any.
+
+    A budget that isn't set keeps its OutputLimit default, so that setting only max_output_bytes doesn't lift the limit
+    on lines (or the other way around). Set it to None to lift it.
+    """
+    if "max_output_bytes" not in settings and "max_output_lines" not in settings:
+        return None
+    default = OutputLimit()
+    return OutputLimit(
+        max_bytes=settings.get("max_output_bytes", default.max_bytes),
+        max_lines=settings.get("max_output_lines", default.max_lines),
+    )
+
+
+# Memoized typerfunc results, keyed by app. Each entry is stored with the app_fingerprint it was built from.
+_typerfunc_cache: WeakKeyDictionary[typer.Typer, tuple[Hashable, list[FunctionSpec]]] = WeakKeyDictionary()
+
+
+def cached_typerfunc(app: typer.Typer) -> list[FunctionSpec]:
+    """Like typerfunc(app), but only rebuilt when commands or groups are added to (or removed from) the app."""
+    fingerprint = app_fingerprint(app)
+    cached = _typerfunc_cache.get(app)
+    if cached is None or cached[0] != fingerprint:
+        cached = (fingerprint, typerfunc(app))
+        _typerfunc_cache[app] = cached
+    return cached[1]
+
+
+def app_fingerprint(app: typer.Typer) -> Hashable:
+    """Returns a value that changes whenever the commands or groups registered anywhere in app change.
+
+    This is much cheaper than typerfunc(), as it only looks at the registration lists and builds no click commands.
+    Like iter_typerfunc(), it walks the groups with an explicit stack, and the fingerprint is flat, so that neither
+    building nor comparing it recurses on very deeply nested apps.
+    """
+    fingerprint: list[Hashable] = [app.info.name, sys.argv[0]]
+    stack: list[tuple[Optional[TyperInfo], typer.Typer]] = [(None, app)]
+    while stack:
+        group, typer_app = stack.pop()
+        groups = [info for info in typer_app.registered_groups if info.typer_instance]
+        # The number of groups keeps the shape of the tree in the flattened fingerprint.
+        fingerprint.append((group, len(groups), tuple(typer_app.registered_commands)))
+        stack.extend((info, info.typer_instance) for info in reversed(groups))
+    return tuple(fingerprint)
@@ -0,0 +1,235 @@
+"""Running function calls in a pool of pre-forked worker processes.
+
+Running commands in the assistant's own process means a hanging command blocks the run, a crashing one (or one calling
+sys.exit) takes down the caller, and output written by subprocesses or C code isn't captured. A WorkerPool runs each
+call in a separate, forked process instead, capturing everything written to its stdout file descriptor.
+"""
+import codecs
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import tempfile
+import threading
+import traceback
+from collections.abc import Iterable
+from multiprocessing import reduction
+from multiprocessing.connection import Connection
+from typing import Any, BinaryIO, Optional
+
+from .capture import BoundedBuffer, OutputLimit
+from .spec import FunctionCall, FunctionSpec
+
+
+class WorkerPool:
+    """A pool of `size` worker processes, forked from this one so that the app and its imports are already loaded.
+
+    Calls taking longer than `timeout` seconds are killed, along with their worker. Each worker is replaced after
+    `max_calls` calls to bound memory growth in long-running commands. Workers only know the functions they were
+    forked with, so the pool should be made after the app's commands are all registered.
+
+    Forking a process with more than one thread can deadlock the child, on locks which other threads held at the time,
+    so this process is forked only once, when the pool is made, and the pool should be made before starting threads.
+    That first fork is a spawner process, which forks each worker (including the replacements for workers which are
+    retired while calls run in other threads) from its own single thread.
+
+    Failures inside a worker (exceptions, sys.exit, crashes and timeouts) are reported in the call's output rather
+    than raised, so that the assistant can see what went wrong.
+    """
+
+    def __init__(
+        self, functions: Iterable[FunctionSpec], size: int = 2, timeout: Optional[float] = 60, max_calls: int = 100
+    ):
+        self.functions = {func.name: func for func in functions}
+        self.timeout = timeout
+        self.max_calls = max_calls
+        self.spawner = _Spawner(self.functions)
+        self.idle: queue.SimpleQueue[_Worker] = queue.SimpleQueue()
+        self.workers: set[_Worker] = set()
+        for _ in range(size):
+            self.idle.put(self._spawn())
+
+    def run(self, call: FunctionCall, limit: Optional[OutputLimit] = None) -> str:
+        """Runs the call in the next free worker, returning its output, bounded by limit."""
+        if call.function.name not in self.functions:
+            return f"[{call.function.name} is not available: it was registered after the worker pool was made]"
+        worker = self.idle.get()
+        try:
+            return worker.run(call, limit, self.timeout)
+        finally:
+            if not worker.alive or worker.calls >= self.max_calls:
+                self._retire(worker)
+                worker = self._spawn()
+            self.idle.put(worker)
+
+    def close(self):
+        """Stops all of the workers, and the spawner."""
+        for worker in list(self.workers):
+            self._retire(worker)
+        self.spawner.stop()
+
+    def __enter__(self) -> "WorkerPool":
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def _spawn(self) -> "_Worker":
+        worker = _Worker(self.spawner)
+        self.workers.add(worker)
+        return worker
+
+    def _retire(self, worker: "_Worker"):
+        worker.stop()
+        self.workers.discard(worker)
+
+
+class _Spawner:
+    """A process forked with the pool's functions, which forks workers on request and reports how they exited."""
+
+    def __init__(self, functions: dict[str, FunctionSpec]):
+        context = multiprocessing.get_context("fork")
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_spawn_workers, args=(child_conn, functions), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.lock = threading.Lock()
+
+    def spawn(self) -> tuple[int, Connection]:
+        """Forks a worker, returning its pid and a connection to it."""
+        with self.lock:
+            self.conn.send(("spawn",))
+            pid = self.conn.recv()
+            fd = reduction.recv_handle(self.conn)
+        return pid, Connection(fd)
+
+    def wait(self, pid: int) -> int:
+        """Waits for the worker with pid to exit, returning its exit code (negated signal number if it was killed)."""
+        with self.lock:
+            self.conn.send(("wait", pid))
+            return self.conn.recv()
+
+    def stop(self):
+        with self.lock:
+            if self.process.is_alive():
+                try:
+                    self.conn.send(None)
+                except OSError:
+                    pass
+                self.process.join(timeout=1)
+                if self.process.is_alive():
+                    self.process.kill()
+                    self.process.join()
+            self.conn.close()
+
+
+class _Worker:
+    def __init__(self, spawner: _Spawner):
+        self.spawner = spawner
+        self.pid, self.conn = spawner.spawn()
+        self.alive = True
+        self.exitcode: Optional[int] = None
+        self.calls = 0
+
+    def run(self, call: FunctionCall, limit: Optional[OutputLimit], timeout: Optional[float]) -> str:
+        self.calls += 1
+        self.conn.send((call.function.name, call.parameters, limit))
+        if not self.conn.poll(timeout):
+            self._kill()
+            return f"[{call.function.name} timed out after {timeout} seconds]"
+        try:
+            return self.conn.recv()
+        except EOFError:
+            self._reap()
+            return f"[{call.function.name} crashed with exit code {self.exitcode}]"
+
+    def stop(self):
+        if self.alive:
+            try:
+                self.conn.send(None)
+            except OSError:
+                pass
+            # The worker's end of the connection closes when it exits
+            if self.conn.poll(1):
+                self._reap()
+            else:
+                self._kill()
+        self.conn.close()
+
+    def _kill(self):
+        os.kill(self.pid, signal.SIGKILL)
+        self._reap()
+
+    def _reap(self):
+        self.alive = False
+        self.exitcode = self.spawner.wait(self.pid)
+
+
+def _spawn_workers(conn: Connection, functions: dict[str, FunctionSpec]):
+    """The main loop of the spawner process: forks a worker for each spawn request sent over conn."""
+    while (request := conn.recv()) is not None:
+        match request:
+            case ("spawn",):
+                worker_conn, child_conn = multiprocessing.Pipe()
+                pid = os.fork()
+                if pid == 0:
+                    conn.close()
+                    worker_conn.close()
+                    try:
+                        _serve(child_conn, functions)
+                    except EOFError:
+                        # The pool's process exited without stopping its workers
+                        pass
+                    finally:
+                        os._exit(0)
+                conn.send(pid)
+                reduction.send_handle(conn, worker_conn.fileno(), os.getppid())
+                worker_conn.close()
+                child_conn.close()
+            case ("wait", pid):
+                _, status = os.waitpid(pid, 0)
+                conn.send(os.waitstatus_to_exitcode(status))
+
+
+def _serve(conn: Connection, functions: dict[str, FunctionSpec]):
+    """The main loop of a worker process: runs each call sent over conn and sends back its output."""
+    # Point python's stdout at file descriptor 1, whatever it was replaced with in the parent, so that print() and
+    # writes from C code or subprocesses are captured alike.
+    sys.stdout = open(1, "w", closefd=False)
+    while (request := conn.recv()) is not None:
+        name, parameters, limit = request
+        conn.send(_run(functions[name], parameters, limit))
+
+
+def _run(function: FunctionSpec, parameters: dict[str, Any], limit: Optional[OutputLimit]) -> str:
+    with tempfile.TemporaryFile() as capture:
+        sys.stdout.flush()
+        saved = os.dup(1)
+        os.dup2(capture.fileno(), 1)
+        status = None
+        try:
+            function.action(**parameters)
+        except SystemExit as e:
+            status = f"[{function.name} exited with status {e.code}]"
+        except Exception:
+            status = f"[{function.name} failed]\n{traceback.format_exc()}"
+        finally:
+            sys.stdout.flush()
+            os.dup2(saved, 1)
+            os.close(saved)
+        capture.seek(0)
+        output = _read(capture, limit).rstrip()
+    return "\n".join(part for part in (output, status) if part)
+
+
+def _read(capture: BinaryIO, limit: Optional[OutputLimit]) -> str:
+    """Reads the captured output, keeping only what fits in limit."""
+    if limit is None:
+        return capture.read().decode(errors="replace")
+    buf = BoundedBuffer(limit)
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    while chunk := capture.read(64 * 1024):
+        buf.write(decoder.decode(chunk))
+    buf.write(decoder.decode(b"", final=True))
+    return buf.getvalue()
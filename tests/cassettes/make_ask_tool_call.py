@@ -0,0 +1,133 @@
+"""Makes ask_tool_call.json, a cassette of an ask in which the assistant calls synthetic.command_0 once.
+
+The cassette is recorded with RecordingTransport, but against a scripted stand-in for the Assistants API rather than
+the real (paid) one, so that it can be remade at any time:
+
+    python tests/cassettes/make_ask_tool_call.py
+
+The stand-in answers instantly, so the recorded timings are replaced with synthetic ones: 0.2 seconds for each GET and
+0.4 seconds for each POST, roughly what the real API takes.
+"""
+import json
+import sys
+from pathlib import Path
+
+import httpx
+from openai import OpenAI
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from fakes import make_app  # noqa: E402
+from typerassistant.cassette import Cassette, RecordingTransport  # noqa: E402
+from typerassistant.polling import PollingStrategy  # noqa: E402
+from typerassistant.typer import TyperAssistant  # noqa: E402
+
+CASSETTE = Path(__file__).parent / "ask_tool_call.json"
+QUERY = "Do something to the moon three times"
+
+CREATED = 1704067200
+ASSISTANT = "asst_abc123"
+THREAD = "thread_abc123"
+RUN = "run_abc123"
+CALL = "call_abc123"
+EMPTY_PAGE = {"object": "list", "data": [], "first_id": None, "last_id": None, "has_more": False}
+
+
+def run(status: str, **fields) -> dict:
+    return {
+        "id": RUN,
+        "object": "thread.run",
+        "created_at": CREATED + 1,
+        "assistant_id": ASSISTANT,
+        "thread_id": THREAD,
+        "status": status,
+        "started_at": CREATED + 1 if status != "queued" else None,
+        "expires_at": CREATED + 601,
+        "cancelled_at": None,
+        "failed_at": None,
+        "completed_at": CREATED + 4 if status == "completed" else None,
+        "last_error": None,
+        "model": "gpt-4-1106-preview",
+        "instructions": "The agent is a helpful assistant.",
+        "tools": [],
+        "file_ids": [],
+        "metadata": {},
+        "required_action": None,
+        **fields,
+    }
+
+
+def message(message_id: str, role: str, text: str, created: int, run_id=None) -> dict:
+    return {
+        "id": message_id,
+        "object": "thread.message",
+        "created_at": created,
+        "thread_id": THREAD,
+        "role": role,
+        "content": [{"type": "text", "text": {"value": text, "annotations": []}}],
+        "file_ids": [],
+        "assistant_id": ASSISTANT if role == "assistant" else None,
+        "run_id": run_id,
+        "metadata": {},
+    }
+
+
+class ScriptedAPI:
+    """Answers the requests of one ask: the run is queued, in progress, requires one tool call, and then completes."""
+
+    def __init__(self):
+        self.retrieves = 0
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        path, method = request.url.path, request.method
+        body = json.loads(request.content) if request.content else None
+        thread = f"/v1/threads/{THREAD}"
+        run_path = f"{thread}/runs/{RUN}"
+        if (method, path) == ("GET", "/v1/assistants"):
+            return httpx.Response(200, json=EMPTY_PAGE)
+        if (method, path) == ("POST", "/v1/assistants"):
+            fields = {"id": ASSISTANT, "object": "assistant", "created_at": CREATED, "description": None}
+            return httpx.Response(200, json={**fields, "file_ids": [], **body})
+        if (method, path) == ("POST", "/v1/threads"):
+            return httpx.Response(200, json={"id": THREAD, "object": "thread", "created_at": CREATED, "metadata": {}})
+        if (method, path) == ("POST", f"{thread}/messages"):
+            return httpx.Response(200, json=message("msg_query", "user", body["content"], CREATED + 1))
+        if (method, path) == ("POST", f"{thread}/runs"):
+            return httpx.Response(200, json=run("queued"))
+        if (method, path) == ("GET", run_path):
+            self.retrieves += 1
+            return httpx.Response(200, json=self.retrieved())
+        if (method, path) == ("POST", f"{run_path}/submit_tool_outputs"):
+            return httpx.Response(200, json=run("in_progress"))
+        if (method, path) == ("GET", f"{thread}/messages"):
+            if request.url.params.get("after") == "msg_reply":
+                return httpx.Response(200, json=EMPTY_PAGE)
+            reply = message("msg_reply", "assistant", "I did something to the moon 3 times.", CREATED + 4, RUN)
+            page = {"object": "list", "data": [reply], "first_id": "msg_reply", "last_id": "msg_reply"}
+            return httpx.Response(200, json={**page, "has_more": False})
+        raise AssertionError(f"Unexpected request {method} {path}")
+
+    def retrieved(self) -> dict:
+        if self.retrieves == 1:
+            return run("in_progress")
+        if self.retrieves == 2:
+            arguments = json.dumps({"target": "the moon", "count": 3})
+            call = {"id": CALL, "type": "function", "function": {"name": "synthetic.command_0", "arguments": arguments}}
+            action = {"type": "submit_tool_outputs", "submit_tool_outputs": {"tool_calls": [call]}}
+            return run("requires_action", required_action=action)
+        return run("completed")
+
+
+def main():
+    cassette = Cassette(CASSETTE)
+    transport = RecordingTransport(cassette, transport=httpx.MockTransport(ScriptedAPI()))
+    client = OpenAI(api_key="unused", http_client=httpx.Client(transport=transport), max_retries=0)
+    assistant = TyperAssistant(app=make_app(2), client=client, polling=PollingStrategy(initial=0, jitter=0))
+    print(assistant.ask(QUERY, confirm_commands=False))
+    for interaction in cassette.interactions:
+        interaction["elapsed"] = 0.2 if interaction["request"]["method"] == "GET" else 0.4
+    cassette.save()
+
+
+if __name__ == "__main__":
+    main()
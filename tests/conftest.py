@@ -1,7 +1,14 @@
+import json
 import os
 import sys
+import time
+from pathlib import Path
 
 import pytest
+import typer
+from typerassistant.assistant import RemoteAssistant
+
+BENCHMARK_BASELINES = Path(__file__).parent / "benchmarks.json"
 
 
 def pytest_addoption(parser):
@@ -11,19 +18,83 @@ def pytest_addoption(parser):
         default=False,
         help="run integration tests against env[OPENAI_API_KEY]. Costs money and mutates remote state.",
     )
+    parser.addoption(
+        "--benchmark",
+        action="store_true",
+        default=False,
+        help=f"run benchmarks, failing any that are much slower than their baseline in {BENCHMARK_BASELINES.name}",
+    )
+    parser.addoption(
+        "--benchmark-save",
+        action="store_true",
+        default=False,
+        help=f"run benchmarks and save their timings as the new baselines in {BENCHMARK_BASELINES.name}",
+    )
+    parser.addoption(
+        "--benchmark-tolerance",
+        type=float,
+        default=2.0,
+        help="how many times slower than its baseline a benchmark may be before it fails (default 2.0)",
+    )
 
 
 def pytest_configure(config):
     config.addinivalue_line("markers", "openai: mark test as integration test (COSTS MONEY)")
+    config.addinivalue_line("markers", "benchmark: mark test as a benchmark, compared against a saved baseline")
+    config.benchmark_results = {}
 
 
 def pytest_collection_modifyitems(config, items):
-    if config.getoption("--openai"):
-        return
     skip_openai = pytest.mark.skip(reason="need --openai option to run - COSTS MONEY")
+    skip_benchmark = pytest.mark.skip(reason="need --benchmark or --benchmark-save option to run")
+    run_benchmarks = config.getoption("--benchmark") or config.getoption("--benchmark-save")
     for item in items:
-        if "openai" in item.keywords:
+        if "openai" in item.keywords and not config.getoption("--openai"):
             item.add_marker(skip_openai)
+        if "benchmark" in item.keywords and not run_benchmarks:
+            item.add_marker(skip_benchmark)
+
+
+@pytest.fixture
+def bench(pytestconfig):
+    """Times a function, returning the best of several runs, in seconds.
+
+    Unless --benchmark-save is given, the timing is compared to the saved baseline of the same name, and the test fails
+    if it is more than --benchmark-tolerance times slower.
+    """
+    baselines = json.loads(BENCHMARK_BASELINES.read_text()) if BENCHMARK_BASELINES.exists() else {}
+
+    def bench(name: str, func, repeat: int = 5) -> float:
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+        pytestconfig.benchmark_results[name] = best
+
+        if not pytestconfig.getoption("--benchmark-save") and name in baselines:
+            # A millisecond of slack keeps the fastest benchmarks from failing on timer noise
+            limit = baselines[name] * pytestconfig.getoption("--benchmark-tolerance") + 0.001
+            assert best <= limit, f"{name} took {best:.6f}s, baseline is {baselines[name]:.6f}s"
+        return best
+
+    return bench
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    results = config.benchmark_results
+    if not results:
+        return
+    baselines = json.loads(BENCHMARK_BASELINES.read_text()) if BENCHMARK_BASELINES.exists() else {}
+    terminalreporter.section("benchmarks")
+    for name, seconds in sorted(results.items()):
+        baseline = f"(baseline {baselines[name] * 1000:.3f}ms)" if name in baselines else "(no baseline)"
+        terminalreporter.write_line(f"{name:<40} {seconds * 1000:>10.3f}ms {baseline}")
+    if config.getoption("--benchmark-save"):
+        saved = {**baselines, **{name: round(seconds, 6) for name, seconds in results.items()}}
+        BENCHMARK_BASELINES.write_text(json.dumps(saved, indent=2, sort_keys=True) + "\n")
+        terminalreporter.write_line(f"Saved baselines to {BENCHMARK_BASELINES}")
 
 
 @pytest.fixture(scope="session", autouse=True)
@@ -43,3 +114,25 @@ def unset_openai_env(pytestconfig):
     # Extra protection against accidentally running integration tests
     if "OPENAI_API_KEY" in os.environ:
         del os.environ["OPENAI_API_KEY"]
+
+
+@pytest.fixture
+def mock_remote_assistant(mocker):
+    remote = mocker.MagicMock(spec=RemoteAssistant)
+    remote.id = "test assistant id"
+    remote.name = "test assistant name"
+    remote.instructions = "test instructions"
+    remote.metadata = {}
+    return remote
+
+
+@pytest.fixture
+def typer_app():
+    """An example Typer app."""
+    app = typer.Typer(name="test typer app")
+
+    @app.command()
+    def say_hello(name: str):
+        print(f"Hello, {name}")
+
+    return app
@@ -0,0 +1,327 @@
+"""In-process stand-ins for OpenAI, and synthetic Typer apps, for testing and benchmarking without the network."""
+
+import itertools
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Any, Optional
+
+import typer
+from openai.types.beta.threads import RequiredActionFunctionToolCall
+
+
+class FakeOpenAI:
+    """A scripted, in-memory imitation of the parts of openai.OpenAI's assistant API that typerassistant uses.
+
+    Every run follows the same script: it is queued, then in progress, then asks for each round of `tool_calls` in
+    turn (a list of rounds, each a list of (function name, arguments) pairs), and finally completes with `reply`. Each
+    status lasts `run_duration` seconds of wall time, and every API call takes `latency` seconds.
+
+    The number of calls to each endpoint is counted in `calls`, eg. calls["runs.retrieve"].
+    """
+
+    def __init__(
+        self,
+        tool_calls: Optional[list[list[tuple[str, dict[str, Any]]]]] = None,
+        reply: str = "Done",
+        latency: float = 0.0,
+        run_duration: float = 0.0,
+        assistants: int = 0,
+    ):
+        self.tool_calls = tool_calls or []
+        self.reply = reply
+        self.latency = latency
+        self.run_duration = run_duration
+        self.calls: Counter[str] = Counter()
+        self.ids = itertools.count()
+        self.assistants = {}
+        for _ in range(assistants):
+            self._assistant(name=f"other assistant {next(self.ids)}")
+        self.threads: dict[str, list[SimpleNamespace]] = {}
+        self.runs: dict[str, dict[str, Any]] = {}
+
+        api = SimpleNamespace
+        self.beta = api(
+            assistants=api(
+                list=self._endpoint("assistants.list", self._list_assistants),
+                create=self._endpoint("assistants.create", self._assistant),
+                retrieve=self._endpoint("assistants.retrieve", lambda assistant_id: self.assistants[assistant_id]),
+                update=self._endpoint("assistants.update", self._update_assistant),
+                delete=self._endpoint("assistants.delete", lambda assistant_id: self.assistants.pop(assistant_id)),
+            ),
+            threads=api(
+                create=self._endpoint("threads.create", self._thread),
+                retrieve=self._endpoint("threads.retrieve", lambda thread_id: api(id=thread_id)),
+                messages=api(
+                    create=self._endpoint("messages.create", self._message),
+                    list=self._endpoint("messages.list", self._list_messages),
+                ),
+                runs=api(
+                    create=self._endpoint("runs.create", self._run),
+                    retrieve=self._endpoint("runs.retrieve", self._retrieve_run),
+                    submit_tool_outputs=self._endpoint("runs.submit_tool_outputs", self._submit_tool_outputs),
+                    cancel=self._endpoint("runs.cancel", self._cancel_run),
+                ),
+            ),
+        )
+
+    def _endpoint(self, name: str, func):
+        def endpoint(*args, **kwargs):
+            self.calls[name] += 1
+            if self.latency:
+                time.sleep(self.latency)
+            return func(*args, **kwargs)
+
+        return endpoint
+
+    def _id(self, prefix: str) -> str:
+        return f"{prefix}_{next(self.ids)}"
+
+    def _assistant(self, name: str, metadata: Optional[dict] = None, **definition) -> SimpleNamespace:
+        assistant = SimpleNamespace(id=self._id("asst"), name=name, metadata=metadata or {}, **definition)
+        self.assistants[assistant.id] = assistant
+        return assistant
+
+    def _list_assistants(self, **_) -> list[SimpleNamespace]:
+        return list(self.assistants.values())
+
+    def _update_assistant(self, assistant_id: str, **definition) -> SimpleNamespace:
+        vars(self.assistants[assistant_id]).update(definition)
+        return self.assistants[assistant_id]
+
+    def _thread(self) -> SimpleNamespace:
+        thread = SimpleNamespace(id=self._id("thread"))
+        self.threads[thread.id] = []
+        return thread
+
+    def _message(self, thread_id: str, role: str, content: str, run_id: Optional[str] = None) -> SimpleNamespace:
+        text = SimpleNamespace(value=content, annotations=[])
+        message = SimpleNamespace(
+            id=self._id("msg"),
+            role=role,
+            run_id=run_id,
+            created_at=time.time(),
+            content=[SimpleNamespace(type="text", text=text)],
+        )
+        self.threads[thread_id].append(message)
+        return message
+
+    def _list_messages(
+        self,
+        thread_id: str,
+        order: str = "desc",
+        limit: Optional[int] = None,
+        after: Optional[str] = None,
+        before: Optional[str] = None,
+    ) -> "_CursorPage":
+        messages = list(self.threads[thread_id])
+        if order == "desc":
+            messages.reverse()
+        ids = [message.id for message in messages]
+        if after is not None:
+            messages = messages[ids.index(after) + 1 :]
+        if before is not None:
+            messages = messages[: ids.index(before)]
+        # Like the API, limit is the size of each page, and iterating the page fetches the rest.
+        size = limit or 20
+
+        def next_page(last: str) -> "_CursorPage":
+            fetch = FakeOpenAI._endpoint(self, "messages.list", self._list_messages)
+            return fetch(thread_id=thread_id, order=order, limit=limit, after=last, before=before)
+
+        return _CursorPage(messages[:size], len(messages) > size, next_page)
+
+    def _run(self, thread_id: str, assistant_id: str, **_) -> SimpleNamespace:
+        run_id = self._id("run")
+        steps: list[Any] = ["queued", "in_progress"]
+        for calls in self.tool_calls:
+            steps += [calls, "in_progress"]
+        steps.append("completed")
+        self.runs[run_id] = {"thread_id": thread_id, "steps": steps, "since": time.monotonic(), "cancelled": False}
+        return self._run_status(run_id)
+
+    def _run_status(self, run_id: str) -> SimpleNamespace:
+        state = self.runs[run_id]
+        step = state["steps"][0]
+        required_action = None
+        if state["cancelled"]:
+            status = "cancelled"
+        elif isinstance(step, list):
+            status = "requires_action"
+            calls = [
+                RequiredActionFunctionToolCall(
+                    id=f"call_{run_id}_{len(state['steps'])}_{i}",
+                    type="function",
+                    function={"name": name, "arguments": json.dumps(arguments)},
+                )
+                for i, (name, arguments) in enumerate(step)
+            ]
+            required_action = SimpleNamespace(submit_tool_outputs=SimpleNamespace(tool_calls=calls))
+        else:
+            status = step
+        return SimpleNamespace(
+            id=run_id, thread_id=state["thread_id"], status=status, required_action=required_action, last_error=None
+        )
+
+    def _advance(self, run_id: str):
+        state = self.runs[run_id]
+        state["steps"].pop(0)
+        state["since"] = time.monotonic()
+        if state["steps"][0] == "completed":
+            self._message(state["thread_id"], "assistant", self.reply, run_id=run_id)
+
+    def _retrieve_run(self, thread_id: str, run_id: str) -> SimpleNamespace:
+        state = self.runs[run_id]
+        working = state["steps"][0] in ("queued", "in_progress") and not state["cancelled"]
+        if working and time.monotonic() - state["since"] >= self.run_duration:
+            self._advance(run_id)
+        return self._run_status(run_id)
+
+    def _submit_tool_outputs(self, thread_id: str, run_id: str, tool_outputs: list) -> SimpleNamespace:
+        assert self._run_status(run_id).status == "requires_action"
+        self._advance(run_id)
+        return self._run_status(run_id)
+
+    def _cancel_run(self, thread_id: str, run_id: str) -> SimpleNamespace:
+        self.runs[run_id]["cancelled"] = True
+        return self._run_status(run_id)
+
+
+class AsyncFakeOpenAI(FakeOpenAI):
+    """FakeOpenAI, but imitating openai.AsyncOpenAI: endpoints are coroutines, and lists are async iterables."""
+
+    def _endpoint(self, name: str, func):
+        endpoint = super()._endpoint(name, func)
+        if name.endswith(".list"):
+            return lambda *args, **kwargs: AsyncPage(endpoint(*args, **kwargs))
+
+        async def async_endpoint(*args, **kwargs):
+            return endpoint(*args, **kwargs)
+
+        return async_endpoint
+
+
+class _CursorPage:
+    """Imitates openai's SyncCursorPage: `data` is this page, and iterating it yields every item of every page."""
+
+    def __init__(self, data: list, has_more: bool, next_page):
+        self.data = data
+        self.has_more = has_more
+        self.next_page = next_page
+
+    def __iter__(self):
+        page = self
+        while True:
+            yield from page.data
+            if not page.has_more or not page.data:
+                return
+            page = page.next_page(page.data[-1].id)
+
+
+class AsyncPage:
+    """Stands in for openai's AsyncPaginator, which is awaited for its first page and iterated with `async for`."""
+
+    def __init__(self, items: list):
+        self.items = items
+
+    def __await__(self):
+        # Like the openai paginator, awaiting the page fetches it
+        async def page():
+            return self
+
+        return page().__await__()
+
+    async def __aiter__(self):
+        for item in self.items:
+            yield item
+
+
+class LocalAPIServer:
+    """A local HTTP server answering assistants.retrieve, for measuring the cost of connections to the API.
+
+    Each new connection sleeps for `handshake` seconds before being served, standing in for the TCP and TLS handshakes
+    of a real connection. The number of connections made is counted in `connections`. Use it as a context manager;
+    `base_url` is the URL to give the OpenAI client.
+    """
+
+    def __init__(self, handshake: float = 0.0):
+        self.handshake = handshake
+        self.connections = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep connections alive
+            # Send each response in one write, to avoid delayed ACKs between the headers and body
+            wbufsize = 64 * 1024
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                server.connections += 1
+                time.sleep(server.handshake)
+
+            def do_GET(self):
+                assistant_id = self.path.rsplit("/", 1)[-1]
+                body = json.dumps(
+                    {
+                        "id": assistant_id,
+                        "object": "assistant",
+                        "created_at": 0,
+                        "name": "local",
+                        "description": None,
+                        "model": "gpt-4-1106-preview",
+                        "instructions": "",
+                        "tools": [],
+                        "file_ids": [],
+                        "metadata": {},
+                    }
+                ).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *_):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+
+    def __enter__(self) -> "LocalAPIServer":
+        threading.Thread(target=self.httpd.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True).start()
+        return self
+
+    def __exit__(self, *_):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def make_app(commands: int, group_size: int = 50, name: str = "synthetic") -> typer.Typer:
+    """Returns a Typer app with the given number of commands, nested in groups of group_size commands.
+
+    Groups are nested two levels deep: the app has groups of groups of commands, plus a few top-level commands.
+    """
+    app = typer.Typer(name=name)
+
+    def command(target: str, count: int = 1, verbose: bool = False):
+        """Does something to target."""
+        print(f"{target} {count} {verbose}")
+
+    top_level = min(commands, 5)
+    for i in range(top_level):
+        app.command(f"command-{i}")(command)
+
+    groups = [typer.Typer() for _ in range(-(-(commands - top_level) // group_size))]
+    for i in range(commands - top_level):
+        groups[i // group_size].command(f"command-{i}", help=f"Command {i} of the synthetic app.")(command)
+    supergroups = [typer.Typer() for _ in range(-(-len(groups) // 10))]
+    for i, group in enumerate(groups):
+        supergroups[i // 10].add_typer(group, name=f"group-{i}")
+    for i, supergroup in enumerate(supergroups):
+        app.add_typer(supergroup, name=f"section-{i}")
+    return app
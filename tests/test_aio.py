@@ -0,0 +1,94 @@
+"""Tests of the asyncio assistants."""
+
+import asyncio
+import time
+
+import openai
+import pytest
+from fakes import AsyncFakeOpenAI, AsyncPage
+from typerassistant.aio import AsyncAssistant, AsyncTyperAssistant
+from typerassistant.assistant import Thread
+from typerassistant.polling import PollingStrategy
+
+
+@pytest.fixture
+def mock_async_client(mocker):
+    """An AsyncOpenAI client whose runs take `run_duration` seconds of wall time to complete."""
+    client = mocker.MagicMock(spec=openai.AsyncOpenAI)
+    client.beta = mocker.MagicMock()
+    client.run_duration = 0.05
+
+    async def create_thread():
+        thread = mocker.MagicMock(spec=Thread)
+        thread.id = f"thread {time.monotonic()}"
+        return thread
+
+    created = {}
+
+    async def create_run(thread_id, **_):
+        created[thread_id] = time.monotonic()
+        return mocker.MagicMock(id=thread_id, status="queued")
+
+    async def retrieve_run(thread_id, run_id):
+        done = time.monotonic() - created[run_id] >= client.run_duration
+        return mocker.MagicMock(id=run_id, status="completed" if done else "in_progress")
+
+    def list_messages(thread_id, **_):
+        message = mocker.MagicMock(role="assistant", run_id=thread_id)
+        message.content = [mocker.MagicMock(type="text")]
+        message.content[0].text.value = f"reply on {thread_id}"
+        message.content[0].text.annotations = []
+        return AsyncPage([message])
+
+    client.beta.threads.create = mocker.AsyncMock(side_effect=create_thread)
+    client.beta.threads.messages.create = mocker.AsyncMock()
+    client.beta.threads.messages.list = list_messages
+    client.beta.threads.runs.create = mocker.AsyncMock(side_effect=create_run)
+    client.beta.threads.runs.retrieve = mocker.AsyncMock(side_effect=retrieve_run)
+    return client
+
+
+def test_ask(mock_async_client, mock_remote_assistant):
+    assistant = AsyncAssistant(name="test", client=mock_async_client, _assistant=mock_remote_assistant)
+    reply = asyncio.run(assistant.ask("hello", confirm_commands=False))
+    assert reply.startswith("reply on thread")
+
+
+def test_many_asks_share_one_loop(mock_async_client, mock_remote_assistant):
+    """Hundreds of concurrent asks should take about as long as one, not one after another."""
+    assistant = AsyncAssistant(
+        name="test",
+        client=mock_async_client,
+        polling=PollingStrategy(initial=0.01, maximum=0.05),
+        _assistant=mock_remote_assistant,
+    )
+
+    async def ask_all():
+        return await asyncio.gather(*(assistant.ask(f"query {i}", confirm_commands=False) for i in range(200)))
+
+    start = time.monotonic()
+    replies = asyncio.run(ask_all())
+    elapsed = time.monotonic() - start
+    assert len(replies) == 200
+    assert elapsed < 200 * mock_async_client.run_duration / 10
+
+
+def test_typer_functions_match_sync(typer_app, mock_async_client):
+    from typerassistant.typer import TyperAssistant
+
+    async_assistant = AsyncTyperAssistant(app=typer_app, client=mock_async_client)
+    sync_assistant = TyperAssistant(app=typer_app, client=openai.OpenAI(api_key="unused"))
+    assert async_assistant.name == sync_assistant.name
+    assert [f.tool() for f in async_assistant.functions()] == [f.tool() for f in sync_assistant.functions()]
+
+
+def test_cancelled_task_cancels_run():
+    client = AsyncFakeOpenAI(run_duration=60)
+    assistant = AsyncAssistant(name="test", client=client, polling=PollingStrategy(initial=0.01, jitter=0))
+
+    async def ask_and_give_up():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(assistant.ask("hello", confirm_commands=False), 0.1)
+
+    asyncio.run(ask_and_give_up())
+    assert client.calls["runs.cancel"] == 1
@@ -1,19 +1,25 @@
 """Tests of assistant code."""
 
+import json
+import sys
+import threading
+import time
+
+import httpx
 import openai
 import pytest
 import typer
-from typerassistant.assistant import Assistant, RemoteAssistant, Thread
-from typerassistant.typer import TyperAssistant
-
-
-@pytest.fixture
-def mock_remote_assistant(mocker):
-    remote = mocker.MagicMock(spec=RemoteAssistant)
-    remote.id = "test assistant id"
-    remote.name = "test assistant name"
-    remote.instructions = "test instructions"
-    return remote
+import typerassistant.typer
+from fakes import FakeOpenAI, make_app
+from typer.testing import CliRunner
+from typerassistant import register_assistant
+from typerassistant.assistant import Assistant, RequiredActionFunctionToolCall, Thread
+from typerassistant.capture import OutputLimit
+from typerassistant.polling import PollingStrategy
+from typerassistant.registry import AssistantRegistry
+from typerassistant.spec import FunctionCall
+from typerassistant.typer import TyperAssistant, app_fingerprint, cached_typerfunc, iter_typerfunc, typerfunc
+from typerassistant.workers import WorkerPool
 
 
 @pytest.fixture
@@ -39,18 +45,6 @@ def assistant_class(request):
     return cls
 
 
-@pytest.fixture
-def typer_app():
-    """An example Typer app."""
-    app = typer.Typer(name="test typer app")
-
-    @app.command()
-    def say_hello(name: str):
-        print(f"Hello, {name}")
-
-    return app
-
-
 @pytest.fixture
 def assistant(assistant_class, typer_app, mock_client, mock_remote_assistant):
     """Return an assistant instance."""
@@ -78,3 +72,558 @@ def test_load_from_id(saved_assistant, typer_app, mock_client):
         loaded = saved_assistant.__class__.from_id(saved_assistant.assistant.id, client=mock_client)
     assert loaded.assistant.id == saved_assistant.assistant.id
     assert loaded.name == saved_assistant.name
+
+
+@pytest.fixture
+def timed_run(mocker, mock_client):
+    """Simulates a remote run that completes a fixed time after it is created.
+
+    Returns a function which sets the run duration, in seconds."""
+    created = {}
+
+    def make_run(status):
+        run = mocker.MagicMock()
+        run.id = "test run id"
+        run.status = status
+        return run
+
+    def create(**_):
+        created["at"] = time.monotonic()
+        return make_run("queued")
+
+    def retrieve(**_):
+        done = time.monotonic() - created["at"] >= created["duration"]
+        return make_run("completed" if done else "in_progress")
+
+    mock_client.beta.threads.runs.create.side_effect = create
+    mock_client.beta.threads.runs.retrieve.side_effect = retrieve
+
+    def set_duration(duration: float):
+        created["duration"] = duration
+
+    return set_duration
+
+
+def test_polling_backs_off_to_maximum():
+    strategy = PollingStrategy(initial=0.1, factor=2, maximum=0.5, jitter=0)
+    intervals = strategy.intervals()
+    assert [next(intervals) for _ in range(5)] == [0.1, 0.2, 0.4, 0.5, 0.5]
+
+
+def test_polling_jitter_only_shortens():
+    strategy = PollingStrategy(initial=1, factor=1, maximum=1, jitter=0.5)
+    intervals = strategy.intervals()
+    assert all(0.5 <= next(intervals) <= 1 for _ in range(100))
+
+
+def test_run_thread_times_out(assistant, mock_thread, timed_run):
+    timed_run(60)
+    assistant.polling = PollingStrategy(initial=0.01, jitter=0)
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        assistant.run_thread(mock_thread, use_commands=True, confirm_commands=False, timeout=0.1)
+    assert time.monotonic() - start < 1
+
+
+def test_adaptive_polling_saves_latency(assistant, mock_thread, timed_run):
+    """A short run should cost about its own duration, not a full fixed polling interval."""
+    # Both strategies are scaled down 10x from the real defaults to keep the test fast.
+    run_duration = 0.04
+    timed_run(run_duration)
+
+    def measure(strategy: PollingStrategy) -> float:
+        assistant.polling = strategy
+        start = time.monotonic()
+        assistant.run_thread(mock_thread, use_commands=True, confirm_commands=False)
+        return time.monotonic() - start
+
+    fixed = measure(PollingStrategy(initial=0.3, factor=1, maximum=0.3, jitter=0))
+    adaptive = measure(PollingStrategy(initial=0.025, factor=1.6, maximum=0.3))
+    assert fixed >= 0.3
+    assert adaptive < fixed / 2
+
+
+@pytest.fixture
+def slow_app():
+    """A Typer app whose commands take a while and print a lot.
+
+    If app.barrier is set, each command waits at it before printing, so the commands only finish if they run at once.
+    """
+    app = typer.Typer(name="slow")
+    app.barrier = None
+
+    @app.command()
+    def fetch(item: str):
+        if app.barrier is not None:
+            app.barrier.wait(timeout=5)
+        for i in range(5):
+            time.sleep(0.02)
+            print(f"{item} {i}")
+
+    return app
+
+
+def fetch_calls(n: int) -> list[RequiredActionFunctionToolCall]:
+    return [
+        RequiredActionFunctionToolCall(
+            id=f"call {i}",
+            type="function",
+            function={"name": "slow.fetch", "arguments": json.dumps({"item": f"item{i}"})},
+        )
+        for i in range(n)
+    ]
+
+
+def test_tool_calls_run_concurrently(slow_app, mock_client):
+    # All five commands have to be running at the same time to get past the barrier.
+    slow_app.barrier = threading.Barrier(5)
+    assistant = TyperAssistant(app=slow_app, client=mock_client, tool_workers=5)
+    results = assistant.tool_calls(fetch_calls(5), confirm_commands=False)
+
+    assert not slow_app.barrier.broken
+    # Results come back in call order, and each call's output is its own.
+    assert [result["tool_call_id"] for result in results] == [f"call {i}" for i in range(5)]
+    for i, result in enumerate(results):
+        assert result["output"].splitlines() == [f"item{i} {j}" for j in range(5)]
+
+
+def test_tool_calls_are_sequential_by_default(slow_app, mock_client):
+    assistant = TyperAssistant(app=slow_app, client=mock_client)
+    start = time.monotonic()
+    results = assistant.tool_calls(fetch_calls(3), confirm_commands=False)
+    assert time.monotonic() - start >= 0.3
+    assert results[2]["output"].splitlines() == [f"item2 {j}" for j in range(5)]
+
+
+def test_catalogue_is_cached_until_app_changes(typer_app, mock_client, mocker):
+    built = mocker.spy(typerassistant.typer, "typerfunc")
+
+    assistant = TyperAssistant(app=typer_app, client=mock_client)
+    first = assistant.catalogue()
+    assert assistant.catalogue() is first
+    assert TyperAssistant(app=typer_app, client=mock_client).catalogue().functions == first.functions
+    assert built.call_count == 1
+
+    @typer_app.command()
+    def say_goodbye(name: str):
+        print(f"Goodbye, {name}")
+
+    subgroup = typer.Typer()
+    typer_app.add_typer(subgroup, name="sub")
+    assert "test typer app.say_goodbye" in assistant.catalogue().by_name
+    assert built.call_count == 2
+
+    @subgroup.command()
+    def nested():
+        pass
+
+    assert "test typer app.sub.nested" in assistant.catalogue().by_name
+    assert built.call_count == 3
+
+
+def test_make_assistant_uses_catalogue_tools(typer_app, mock_client):
+    mock_client.beta.assistants.list.return_value = []
+    assistant = TyperAssistant(app=typer_app, client=mock_client)
+    assistant.make_assistant(replace=False)
+    tools = mock_client.beta.assistants.create.call_args.kwargs["tools"]
+    assert tools is assistant.catalogue().tools
+    assert tools[0]["function"]["name"] == "test typer app.say_hello"
+
+
+@pytest.fixture
+def registry(tmp_path):
+    return AssistantRegistry(path=tmp_path / "assistants.json")
+
+
+def test_registry_skips_listing(registry, mock_client, mock_remote_assistant):
+    mock_client.beta.assistants.list.return_value = [mock_remote_assistant]
+    mock_client.beta.assistants.retrieve.return_value = mock_remote_assistant
+
+    first = Assistant(name=mock_remote_assistant.name, client=mock_client, registry=registry)
+    mock_remote_assistant.metadata = first.definition()["metadata"]
+    assert first.assistant is mock_remote_assistant
+    assert mock_client.beta.assistants.list.call_count == 1
+
+    second = Assistant(name=mock_remote_assistant.name, client=mock_client, registry=registry)
+    assert second.assistant is mock_remote_assistant
+    assert mock_client.beta.assistants.list.call_count == 1
+    mock_client.beta.assistants.retrieve.assert_called_once_with(mock_remote_assistant.id)
+
+
+def test_registry_falls_back_when_stale(registry, mock_client, mock_remote_assistant):
+    registry.set(registry.key(mock_remote_assistant.name, mock_client), "deleted assistant id")
+    response = httpx.Response(404, request=httpx.Request("GET", "https://api.openai.com/v1/assistants"))
+    mock_client.beta.assistants.retrieve.side_effect = openai.NotFoundError("gone", response=response, body=None)
+    mock_client.beta.assistants.list.return_value = [mock_remote_assistant]
+
+    assistant = Assistant(name=mock_remote_assistant.name, client=mock_client, registry=registry)
+    mock_remote_assistant.metadata = assistant.definition()["metadata"]
+    assert assistant.assistant is mock_remote_assistant
+    assert registry.get(registry.key(mock_remote_assistant.name, mock_client)) == mock_remote_assistant.id
+
+
+def test_registry_keys_by_api_key():
+    assert AssistantRegistry.key("name", openai.OpenAI(api_key="a")) != AssistantRegistry.key(
+        "name", openai.OpenAI(api_key="b")
+    )
+
+
+def test_unchanged_assistant_is_reused(typer_app, mock_client, mock_remote_assistant):
+    assistant = TyperAssistant(app=typer_app, client=mock_client)
+    mock_remote_assistant.name = assistant.name
+    mock_remote_assistant.metadata = assistant.definition()["metadata"]
+    mock_client.beta.assistants.list.return_value = [mock_remote_assistant]
+
+    assert assistant.make_assistant(replace=False) is mock_remote_assistant
+    mock_client.beta.assistants.update.assert_not_called()
+    mock_client.beta.assistants.create.assert_not_called()
+    mock_client.beta.assistants.delete.assert_not_called()
+
+
+def test_drifted_assistant_is_updated(typer_app, mock_client, mock_remote_assistant):
+    assistant = TyperAssistant(app=typer_app, client=mock_client)
+    mock_remote_assistant.name = assistant.name
+    mock_remote_assistant.metadata = {"owner": "someone", **assistant.definition()["metadata"]}
+    mock_client.beta.assistants.list.return_value = [mock_remote_assistant]
+
+    @typer_app.command()
+    def say_goodbye(name: str):
+        print(f"Goodbye, {name}")
+
+    updated = assistant.make_assistant(replace=False)
+    assert updated is mock_client.beta.assistants.update.return_value
+    kwargs = mock_client.beta.assistants.update.call_args.kwargs
+    assert [tool["function"]["name"] for tool in kwargs["tools"]] == [
+        "test typer app.say_hello",
+        "test typer app.say_goodbye",
+    ]
+    assert kwargs["metadata"]["owner"] == "someone"
+    assert kwargs["metadata"] != mock_remote_assistant.metadata
+    mock_client.beta.assistants.create.assert_not_called()
+    mock_client.beta.assistants.delete.assert_not_called()
+
+
+def test_definition_hash_covers_instructions_and_model(mock_client):
+    base = Assistant(name="test", client=mock_client).definition()["metadata"]
+    assert Assistant(name="test", client=mock_client, instructions="other").definition()["metadata"] != base
+    assert Assistant(name="test", client=mock_client, model="other").definition()["metadata"] != base
+    assert Assistant(name="renamed", client=mock_client).definition()["metadata"] == base
+
+
+def test_session_thread(assistant, mock_client, mock_thread):
+    assert assistant.session_thread("test thread id") is mock_thread
+    assert assistant.session_thread(None) is mock_client.beta.threads.create.return_value
+
+    response = httpx.Response(404, request=httpx.Request("GET", "https://api.openai.com/v1/threads"))
+    mock_client.beta.threads.retrieve.side_effect = openai.NotFoundError("gone", response=response, body=None)
+    assert assistant.session_thread("deleted thread id") is mock_client.beta.threads.create.return_value
+
+
+def test_ask_many(assistant, mocker):
+    def ask(query, **_):
+        time.sleep(float(query))
+        if query == "0.05":
+            raise RuntimeError("run failed")
+        return f"answer {query}"
+
+    mocker.patch.object(assistant, "ask", side_effect=ask)
+    results = list(assistant.ask_many(["0.2", "0.1", "0.05", "0.1"], concurrency=4))
+
+    # Results arrive in completion order, which shows the asks ran at once, and failures don't stop the batch
+    assert [result.query for result in results] == ["0.05", "0.1", "0.1", "0.2"]
+    assert isinstance(results[0].error, RuntimeError)
+    assert results[0].response is None
+    assert {result.index: result.response for result in results[1:]} == {
+        0: "answer 0.2",
+        1: "answer 0.1",
+        3: "answer 0.1",
+    }
+
+
+def test_ask_many_rate_limit():
+    client = FakeOpenAI()
+    assistant = TyperAssistant(app=make_app(2), client=client, polling=PollingStrategy(initial=0, jitter=0))
+    assistant.get_assistant()
+    client.calls.clear()
+    start = time.monotonic()
+    results = list(assistant.ask_many(["query"] * 2, concurrency=2, requests_per_minute=60 * 50))
+    # Every request is paced, not just the start of each ask: one may be made immediately, and the rest 20ms apart.
+    requests = sum(client.calls.values())
+    assert requests >= 10
+    assert time.monotonic() - start >= (requests - 1) * 0.02
+    assert all(result.response == "Done" for result in results)
+
+
+def test_abandoned_ask_many_cancels_runs(mocker):
+    client = FakeOpenAI(run_duration=10)
+    assistant = TyperAssistant(app=make_app(2), client=client, polling=PollingStrategy(initial=0.01, jitter=0))
+    ask = assistant.ask
+    mocker.patch.object(
+        assistant, "ask", side_effect=lambda query, **kwargs: query if query == "quick" else ask(query, **kwargs)
+    )
+    results = assistant.ask_many(["slow", "quick"], concurrency=2)
+    assert next(results).response == "quick"
+    results.close()
+
+    deadline = time.monotonic() + 2
+    while client.calls["runs.cancel"] < 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert client.calls["runs.cancel"] == 1
+
+
+@pytest.fixture
+def scripted_client(mocker, mock_client, mock_thread, mock_remote_assistant):
+    """A client whose runs call say_hello once and then reply "Done"."""
+    mock_client.beta.threads.create.return_value = mock_thread
+    mock_client.beta.assistants.list.return_value = [mock_remote_assistant]
+
+    def run(status, **kwargs):
+        return mocker.MagicMock(id="test run id", status=status, **kwargs)
+
+    required_action = mocker.MagicMock()
+    required_action.submit_tool_outputs.tool_calls = [
+        RequiredActionFunctionToolCall(
+            id="call 0",
+            type="function",
+            function={"name": "test typer app.say_hello", "arguments": json.dumps({"name": "Alice"})},
+        )
+    ]
+    mock_client.beta.threads.runs.create.return_value = run("queued")
+    mock_client.beta.threads.runs.retrieve.side_effect = [
+        run("in_progress"),
+        run("requires_action", required_action=required_action),
+        run("completed"),
+    ]
+    mock_client.beta.threads.runs.submit_tool_outputs.return_value = run("queued")
+
+    message = mocker.MagicMock(role="assistant", run_id="test run id")
+    message.content = [mocker.MagicMock(type="text")]
+    message.content[0].text.value = "Done"
+    message.content[0].text.annotations = []
+    mock_client.beta.threads.messages.list.return_value = [message]
+    return mock_client
+
+
+def test_ask_stream(typer_app, scripted_client, mock_remote_assistant):
+    assistant = TyperAssistant(
+        app=typer_app, client=scripted_client, polling=PollingStrategy(initial=0.001), _assistant=mock_remote_assistant
+    )
+    events = list(assistant.ask_stream("Say hello to Alice", confirm_commands=False))
+    assert [(event.event, event.run.status) for event in events] == [
+        ("status", "queued"),
+        ("status", "in_progress"),
+        ("status", "requires_action"),
+        ("tool_calls", "requires_action"),
+        ("tool_outputs", "requires_action"),
+        ("status", "queued"),
+        ("status", "completed"),
+        ("text", "completed"),
+    ]
+    assert events[4].data == [{"tool_call_id": "call 0", "output": "Hello, Alice"}]
+    assert events[-1].data == "Done"
+
+
+def test_ask_command_stream(typer_app, scripted_client, mock_remote_assistant):
+    mock_remote_assistant.name = "test typer app"
+    register_assistant(typer_app, client=scripted_client, use_registry=False)
+    result = CliRunner().invoke(typer_app, ["ask", "--stream", "Say hello to Alice"])
+    assert result.exit_code == 0, result.output
+    assert result.output.endswith("Done\n")
+    assert "Running test typer app.say_hello" in result.output
+    assert "Run completed" in result.output
+
+
+def test_tool_calls_in_worker_pool(slow_app, mock_client):
+    assistant = TyperAssistant(app=slow_app, client=mock_client)
+    with WorkerPool(assistant.catalogue(), size=2) as assistant.worker_pool:
+        results = assistant.tool_calls(fetch_calls(2), confirm_commands=False)
+    assert results[1]["output"].splitlines() == [f"item1 {j}" for j in range(5)]
+
+
+def test_assistant_settings(typer_app):
+    register_assistant(typer_app)
+
+    @typer_app.command(context_settings={"obj": {"max_output_lines": 2}})
+    def count(n: int):
+        for i in range(int(n)):
+            print(i)
+
+    @typer_app.command(context_settings={"obj": {"max_output_bytes": 100, "max_output_lines": None}})
+    def dump():
+        pass
+
+    @typer_app.command(context_settings={"omit_from_assistant": True})
+    def hidden():
+        pass
+
+    functions = {func.name: func for func in typerfunc(typer_app)}
+    assert "test typer app.ask" not in functions
+    assert "test typer app.hidden" not in functions
+    # Budgets that aren't set keep their defaults
+    assert functions["test typer app.count"].output_limit == OutputLimit(max_lines=2)
+    assert functions["test typer app.count"].output_limit.max_bytes == OutputLimit().max_bytes
+    assert functions["test typer app.dump"].output_limit == OutputLimit(max_bytes=100, max_lines=None)
+    assert functions["test typer app.say_hello"].output_limit is None
+
+
+def test_tool_output_is_bounded(typer_app, mock_client):
+    @typer_app.command(context_settings={"obj": {"max_output_lines": 2}})
+    def count(n: int):
+        for i in range(int(n)):
+            print(i)
+
+    assistant = TyperAssistant(app=typer_app, client=mock_client)
+    calls = [
+        RequiredActionFunctionToolCall(
+            id="call 0", type="function", function={"name": "count", "arguments": json.dumps({"n": "1000"})}
+        )
+    ]
+    assert assistant.tool_calls(calls, confirm_commands=False)[0]["output"] == (
+        "0\n[... 998 lines (3884 bytes) omitted ...]\n999"
+    )
+    with WorkerPool(assistant.catalogue(), size=1) as assistant.worker_pool:
+        assert assistant.tool_calls(calls, confirm_commands=False)[0]["output"] == (
+            "0\n[... 998 lines (3884 bytes) omitted ...]\n999"
+        )
+
+
+def test_reply_skips_thread_history(typer_app, mocker):
+    client = FakeOpenAI(reply="Newest")
+    assistant = TyperAssistant(app=typer_app, client=client, polling=PollingStrategy(initial=0, jitter=0))
+    thread = client.beta.threads.create()
+    for i in range(50):
+        client.beta.threads.messages.create(thread_id=thread.id, role="user", content=f"old query {i}")
+        client._message(thread.id, "assistant", f"old reply {i}", run_id=f"old run {i}")
+    listed = mocker.spy(client.beta.threads.messages, "list")
+    assert assistant.ask("Hello?", thread=thread, use_commands=False) == "Newest"
+    assert listed.spy_return.data[-1].content[0].text.value == "Newest"
+    assert len(listed.spy_return.data) == 1
+    assert client.calls["messages.list"] == 1
+
+
+def test_messages_cursor(typer_app):
+    client = FakeOpenAI()
+    assistant = TyperAssistant(app=typer_app, client=client)
+    thread = client.beta.threads.create()
+    ids = [client.beta.threads.messages.create(thread_id=thread.id, role="user", content=str(i)).id for i in range(5)]
+    assert [m.id for m in assistant.messages(thread)] == ids[::-1]
+    # limit is the page size: every message is still yielded, a page at a time
+    client.calls.clear()
+    assert [m.id for m in assistant.messages(thread, order="asc", after=ids[1], limit=2)] == ids[2:]
+    assert client.calls["messages.list"] == 2
+    assert [m.id for m in assistant.messages(thread, before=ids[2])] == ids[4:2:-1]
+
+
+@pytest.fixture
+def counting_app():
+    app = typer.Typer(name="counting")
+    app.counts = {"lookup": 0, "touch": 0}
+
+    @app.command(context_settings={"obj": {"cacheable": True}})
+    def lookup(key: str):
+        app.counts["lookup"] += 1
+        print(f"value of {key}")
+
+    @app.command()
+    def touch(key: str):
+        app.counts["touch"] += 1
+        print(f"touched {key}")
+
+    return app
+
+
+def test_cacheable_commands_are_memoized_per_thread(counting_app, capsys):
+    rounds = [[("counting.lookup", {"key": "a"}), ("counting.touch", {"key": "a"})]] * 3
+    client = FakeOpenAI(tool_calls=rounds + [[("counting.lookup", {"key": "b"})]])
+    assistant = TyperAssistant(app=counting_app, client=client, polling=PollingStrategy(initial=0, jitter=0))
+    thread = assistant.thread()
+    assistant.ask("Look things up", thread=thread, confirm_commands=False)
+    assert counting_app.counts == {"lookup": 2, "touch": 3}
+    assistant.ask("Look things up again", thread=thread, confirm_commands=False)
+    assert counting_app.counts == {"lookup": 2, "touch": 6}
+    assistant.ask("Look things up in a new thread", confirm_commands=False)
+    assert counting_app.counts == {"lookup": 4, "touch": 9}
+
+
+def test_identical_cacheable_calls_in_a_batch_run_once(counting_app, capsys):
+    functions = {func.name: func for func in typerfunc(counting_app)}
+    batch = [("counting.lookup", "a")] * 3 + [("counting.touch", "a")] * 2
+    calls = [
+        FunctionCall(call_id=f"call_{i}", function=functions[name], parameters={"key": key})
+        for i, (name, key) in enumerate(batch)
+    ]
+    assistant = TyperAssistant(app=counting_app, client=FakeOpenAI(), tool_workers=4)
+    outputs = assistant.run_function_calls(calls)
+    assert counting_app.counts == {"lookup": 1, "touch": 2}
+    assert [output["tool_call_id"] for output in outputs] == [call.call_id for call in calls]
+    assert [output["output"] for output in outputs] == ["value of a"] * 3 + ["touched a"] * 2
+
+
+def test_cacheable_command_ttl(counting_app, capsys):
+    counting_app.registered_commands[0].context_settings["obj"]["cache_ttl"] = 0
+    client = FakeOpenAI(tool_calls=[[("counting.lookup", {"key": "a"})]] * 2)
+    assistant = TyperAssistant(app=counting_app, client=client, polling=PollingStrategy(initial=0, jitter=0))
+    assistant.ask("Look things up", confirm_commands=False)
+    assert counting_app.counts["lookup"] == 2
+
+
+def test_iter_typerfunc_only(mocker):
+    app = make_app(120, group_size=10)
+    everything = typerfunc(app)
+    assert [func.name for func in iter_typerfunc(app)] == [func.name for func in everything]
+
+    built = mocker.spy(typerassistant.typer, "get_command_from_info")
+    group = [func.name for func in iter_typerfunc(app, only="synthetic.section_0.group_3")]
+    assert group == [func.name for func in everything if func.name.startswith("synthetic.section_0.group_3.")]
+    assert built.call_count == len(group) == 10
+    assert [func.name for func in iter_typerfunc(app, only="synthetic.command_2")] == ["synthetic.command_2"]
+
+
+def test_iter_typerfunc_deep_nesting():
+    app = leaf = typer.Typer(name="deep")
+    for _ in range(sys.getrecursionlimit() + 100):
+        child = typer.Typer()
+        leaf.add_typer(child, name="level")
+        leaf = child
+    leaf.command()(lambda: None)
+    (spec,) = iter_typerfunc(app)
+    assert spec.name.count(".level") == sys.getrecursionlimit() + 100
+    assert not hasattr(spec, "__dict__")
+    # TyperAssistant builds its functions through cached_typerfunc, which fingerprints the app first
+    assert app_fingerprint(app) == app_fingerprint(app)
+    assert cached_typerfunc(app) == [spec]
+
+
+def test_timed_out_run_is_cancelled(typer_app):
+    client = FakeOpenAI(run_duration=60)
+    assistant = TyperAssistant(app=typer_app, client=client, polling=PollingStrategy(initial=0.01, jitter=0))
+    thread = assistant.thread()
+    with pytest.raises(TimeoutError):
+        assistant.ask("Hello?", thread=thread, timeout=0.1)
+    assert client.calls["runs.cancel"] == 1
+    assert [run["cancelled"] for run in client.runs.values()] == [True]
+
+
+def test_interrupted_run_is_cancelled(mocker):
+    app = typer.Typer(name="interrupted")
+
+    @app.command()
+    def interrupt():
+        raise KeyboardInterrupt
+
+    client = FakeOpenAI(tool_calls=[[("interrupted.interrupt", {})]])
+    assistant = TyperAssistant(app=app, client=client, polling=PollingStrategy(initial=0, jitter=0))
+    with pytest.raises(KeyboardInterrupt):
+        assistant.ask("Interrupt", confirm_commands=False)
+    assert client.calls["runs.cancel"] == 1
+
+
+def test_abandoned_stream_cancels_run(typer_app):
+    client = FakeOpenAI()
+    assistant = TyperAssistant(app=typer_app, client=client, polling=PollingStrategy(initial=0, jitter=0))
+    events = assistant.ask_stream("Hello?")
+    next(events)
+    events.close()
+    assert client.calls["runs.cancel"] == 1
+    assistant.ask("Hello?")
+    assert client.calls["runs.cancel"] == 1
@@ -0,0 +1,95 @@
+"""Benchmarks of typerassistant's own overhead, using synthetic apps and a fake OpenAI client.
+
+These are skipped by default. Run them with `pytest --benchmark` to compare against the saved baselines in
+benchmarks.json, or `pytest --benchmark-save` to record new baselines (do this on the machine you'll compare on).
+"""
+import pytest
+from fakes import FakeOpenAI, LocalAPIServer, make_app
+from openai import OpenAI
+from typerassistant.clients import ClientSettings, configure_clients, shared_client
+from typerassistant.polling import PollingStrategy
+from typerassistant.typer import TyperAssistant, cached_typerfunc, typerfunc
+
+pytestmark = pytest.mark.benchmark
+
+SIZES = [10, 500, 5000]
+
+# The fake client never makes the assistant wait, so neither should polling.
+NO_WAIT = PollingStrategy(initial=0, maximum=0, jitter=0)
+
+
+@pytest.fixture(scope="module", params=SIZES)
+def app(request):
+    return make_app(request.param)
+
+
+def size(app) -> int:
+    return len(cached_typerfunc(app))
+
+
+def test_typerfunc(bench, app):
+    bench(f"typerfunc[{size(app)}]", lambda: typerfunc(app))
+
+
+def test_cached_typerfunc(bench, app):
+    cached_typerfunc(app)
+    bench(f"cached_typerfunc[{size(app)}]", lambda: cached_typerfunc(app))
+
+
+def test_make_assistant(bench, app):
+    client = FakeOpenAI(assistants=200)
+    TyperAssistant(app=app, client=client).make_assistant(replace=False)
+    bench(f"make_assistant[{size(app)}]", lambda: TyperAssistant(app=app, client=client).make_assistant(replace=False))
+
+
+def test_tool_calls(bench, app, capsys):
+    functions = cached_typerfunc(app)
+    # Call the last few commands by their short names, the hardest case for name resolution.
+    calls = [(func.name.split(".", 1)[1], {"target": "x", "count": "2"}) for func in functions[-5:] if "." in func.name]
+    client = FakeOpenAI(tool_calls=[calls])
+    assistant = TyperAssistant(app=app, client=client, polling=NO_WAIT)
+    required = client.beta.threads.runs.retrieve
+    thread = client.beta.threads.create()
+    run = client.beta.threads.runs.create(thread_id=thread.id, assistant_id=None)
+    required(thread_id=thread.id, run_id=run.id)
+    tool_calls = required(thread_id=thread.id, run_id=run.id).required_action.submit_tool_outputs.tool_calls
+
+    bench(f"tool_calls[{size(app)}]", lambda: assistant.tool_calls(tool_calls, confirm_commands=False))
+    capsys.readouterr()
+
+
+def test_ask(bench, app, capsys):
+    calls = [(cached_typerfunc(app)[0].name, {"target": "x"})]
+    client = FakeOpenAI(tool_calls=[calls], assistants=200)
+
+    def ask():
+        assistant = TyperAssistant(app=app, client=client, polling=NO_WAIT)
+        assert assistant.ask("Do something", confirm_commands=False) == "Done"
+
+    bench(f"ask[{size(app)}]", ask)
+    capsys.readouterr()
+
+
+@pytest.fixture
+def api_server(monkeypatch):
+    # 5ms per connection is a modest stand-in for the TCP and TLS handshakes with the real API.
+    with LocalAPIServer(handshake=0.005) as server:
+        monkeypatch.setenv("OPENAI_API_KEY", "test key")
+        monkeypatch.setenv("OPENAI_BASE_URL", server.base_url)
+        configure_clients(ClientSettings())
+        yield server
+    configure_clients(ClientSettings())
+
+
+def test_back_to_back_requests(bench, api_server):
+    def new_clients():
+        for _ in range(10):
+            OpenAI().beta.assistants.retrieve("asst")
+
+    def shared():
+        for _ in range(10):
+            shared_client().beta.assistants.retrieve("asst")
+
+    new = bench("requests[new clients]", new_clients)
+    pooled = bench("requests[shared client]", shared)
+    assert pooled < new
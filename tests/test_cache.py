@@ -0,0 +1,97 @@
+"""Tests of the response caches."""
+
+import asyncio
+import time
+
+import pytest
+from fakes import AsyncFakeOpenAI, FakeOpenAI
+from typerassistant.aio import AsyncAssistant
+from typerassistant.assistant import Assistant
+from typerassistant.cache import DiskCache, MemoryCache, ResponseCache
+from typerassistant.polling import PollingStrategy
+
+NO_WAIT = PollingStrategy(initial=0, maximum=0, jitter=0)
+
+
+@pytest.fixture(params=["memory", "disk"])
+def cache(request, tmp_path):
+    if request.param == "memory":
+        return MemoryCache(max_entries=2)
+    return DiskCache(tmp_path / "responses.json", max_entries=2)
+
+
+def test_cache_evicts_least_recently_used(cache):
+    cache.set("a", "A")
+    cache.set("b", "B")
+    assert cache.get("a") == "A"
+    cache.set("c", "C")
+    assert cache.get("b") is None
+    assert cache.get("a") == "A"
+    assert cache.get("c") == "C"
+
+
+def test_cache_expires(cache, mocker):
+    cache.ttl = 60
+    cache.set("a", "A")
+    now = time.time()
+    mocker.patch("time.time", return_value=now + 61)
+    assert cache.get("a") is None
+
+
+def test_cache_with_max_entries_0_keeps_nothing(cache):
+    cache.max_entries = 0
+    cache.set("a", "A")
+    cache.set("b", "B")
+    assert cache.get("a") is None
+    assert cache.get("b") is None
+
+
+def test_disk_cache_persists(tmp_path):
+    DiskCache(tmp_path / "responses.json").set("a", "A")
+    assert DiskCache(tmp_path / "responses.json").get("a") == "A"
+
+
+def test_key_covers_instructions():
+    assert ResponseCache.key("asst", "gpt", "Be brief", "Hi") != ResponseCache.key("asst", "gpt", "Be verbose", "Hi")
+    assert ResponseCache.key("asst", "gpt", "Be brief", "Hi") == ResponseCache.key("asst", "gpt", "Be brief", "Hi")
+
+
+def test_response_cache_is_abstract():
+    class Incomplete(ResponseCache):
+        def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_command_free_asks_are_cached():
+    client = FakeOpenAI(reply="Macavity")
+    assistant = Assistant("test", client=client, polling=NO_WAIT, response_cache=MemoryCache())
+    for _ in range(3):
+        assert assistant.ask("Name a cat", instructions="Just a name", use_commands=False) == "Macavity"
+    assert client.calls["runs.create"] == 1
+    assistant.ask("Name a cat", instructions="A long name", use_commands=False)
+    assert client.calls["runs.create"] == 2
+
+
+def test_asks_with_commands_are_not_cached():
+    client = FakeOpenAI()
+    assistant = Assistant("test", client=client, polling=NO_WAIT, response_cache=MemoryCache())
+    assistant.ask("Name a cat", confirm_commands=False)
+    assistant.ask("Name a cat", confirm_commands=False)
+    thread = assistant.thread()
+    assistant.ask("Name a cat", thread=thread, use_commands=False)
+    assistant.ask("Name a cat", thread=thread, use_commands=False)
+    assert client.calls["runs.create"] == 4
+
+
+def test_async_command_free_asks_are_cached():
+    client = AsyncFakeOpenAI(reply="Macavity")
+    assistant = AsyncAssistant("test", client=client, polling=NO_WAIT, response_cache=MemoryCache())
+
+    async def ask_twice():
+        return [await assistant.ask("Name a cat", use_commands=False) for _ in range(2)]
+
+    assert asyncio.run(ask_twice()) == ["Macavity", "Macavity"]
+    assert client.calls["runs.create"] == 1
@@ -0,0 +1,90 @@
+"""Tests of per-thread stdout capture."""
+
+import sys
+import threading
+
+from typerassistant.capture import BoundedBuffer, OutputLimit, capture_stdout
+
+
+def test_capture_is_per_thread():
+    outputs = {}
+    barrier = threading.Barrier(4)
+
+    def work(n: int):
+        with capture_stdout() as buf:
+            barrier.wait()
+            for i in range(100):
+                print(n, i)
+        outputs[n] = buf.getvalue()
+
+    threads = [threading.Thread(target=work, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for n in range(4):
+        assert outputs[n] == "".join(f"{n} {i}\n" for i in range(100))
+
+
+def test_stdout_restored():
+    original = sys.stdout
+    with capture_stdout() as outer:
+        print("outer")
+        with capture_stdout() as inner:
+            print("inner")
+        print("outer again")
+    assert sys.stdout is original
+    assert outer.getvalue() == "outer\nouter again\n"
+    assert inner.getvalue() == "inner\n"
+
+
+def test_other_threads_are_not_captured(capsys):
+    with capture_stdout() as buf:
+        thread = threading.Thread(target=print, args=("elsewhere",))
+        thread.start()
+        thread.join()
+    assert buf.getvalue() == ""
+    assert capsys.readouterr().out == "elsewhere\n"
+
+
+def test_bounded_by_lines():
+    buf = BoundedBuffer(OutputLimit(max_bytes=None, max_lines=4))
+    for i in range(10):
+        buf.write(f"line {i}\n")
+    assert buf.getvalue() == "line 0\nline 1\n[... 6 lines (42 bytes) omitted ...]\nline 8\nline 9\n"
+
+
+def test_bounded_by_bytes():
+    buf = BoundedBuffer(OutputLimit(max_bytes=1000, max_lines=None))
+    for i in range(100_000):
+        print(f"line {i}", file=buf)
+    value = buf.getvalue()
+    assert value.startswith("line 0\nline 1\n")
+    assert value.endswith("line 99998\nline 99999\n")
+    assert "lines (" in value
+    assert len(value.encode()) < 1100
+
+
+def test_bounded_long_line():
+    buf = BoundedBuffer(OutputLimit(max_bytes=100, max_lines=None))
+    for _ in range(1000):
+        buf.write("x" * 1000)
+    buf.write("end")
+    value = buf.getvalue()
+    assert value.endswith("end")
+    assert len(value) < 200
+
+
+def test_under_budget_is_unchanged():
+    buf = BoundedBuffer(OutputLimit())
+    buf.write("partial ")
+    buf.write("line\nanother\n")
+    assert buf.getvalue() == "partial line\nanother\n"
+
+
+def test_capture_with_limit():
+    with capture_stdout(OutputLimit(max_bytes=None, max_lines=2)) as buf:
+        for i in range(5):
+            print(i)
+    assert buf.getvalue() == "0\n[... 3 lines (6 bytes) omitted ...]\n4\n"
@@ -0,0 +1,74 @@
+"""Tests of recording and replaying API requests with cassettes."""
+
+import asyncio
+import json
+from pathlib import Path
+
+import httpx
+import openai
+import pytest
+from fakes import LocalAPIServer, make_app
+from openai import OpenAI
+from typerassistant.aio import AsyncTyperAssistant
+from typerassistant.cassette import Cassette, ReplayTransport, async_replay_client, recording, replay_client
+from typerassistant.polling import PollingStrategy
+from typerassistant.typer import TyperAssistant
+
+# An ask in which the assistant calls synthetic.command_0 once before replying, made by make_ask_tool_call.py. Its
+# timings are synthetic.
+ASK_TOOL_CALL = Path(__file__).parent / "cassettes" / "ask_tool_call.json"
+QUERY = "Do something to the moon three times"
+REPLY = "I did something to the moon 3 times."
+
+
+def replay(path: Path, latency=0.0) -> tuple[OpenAI, ReplayTransport]:
+    transport = ReplayTransport(Cassette.load(path), latency)
+    return OpenAI(api_key="replay", http_client=httpx.Client(transport=transport)), transport
+
+
+def test_replay_ask(capsys):
+    client, transport = replay(ASK_TOOL_CALL)
+    assistant = TyperAssistant(app=make_app(2), client=client, polling=PollingStrategy(initial=0, jitter=0))
+    assert assistant.ask(QUERY, confirm_commands=False) == REPLY
+    assert "the moon 3 False" in capsys.readouterr().out
+    assert transport.unplayed() == []
+
+
+def test_replay_async_ask():
+    client = async_replay_client(ASK_TOOL_CALL)
+    assistant = AsyncTyperAssistant(app=make_app(2), client=client, polling=PollingStrategy(initial=0, jitter=0))
+    assert asyncio.run(assistant.ask(QUERY, confirm_commands=False)) == REPLY
+
+
+def test_replay_latency(mocker):
+    sleep = mocker.patch("typerassistant.cassette.time.sleep")
+    cassette = Cassette.load(ASK_TOOL_CALL)
+    client = replay_client(ASK_TOOL_CALL, latency=None)
+    client.beta.threads.create()
+    sleep.assert_called_once_with(cassette.interactions[0]["elapsed"])
+
+    sleep.reset_mock()
+    client = replay_client(ASK_TOOL_CALL, latency=0.05)
+    client.beta.threads.create()
+    sleep.assert_called_once_with(0.05)
+
+
+def test_exhausted_cassette():
+    client, _ = replay(ASK_TOOL_CALL)
+    client.beta.threads.create()
+    with pytest.raises(openai.BadRequestError, match="no response left for POST /v1/threads"):
+        client.beta.threads.create()
+
+
+def test_record_and_replay(tmp_path):
+    path = tmp_path / "cassette.json"
+    with LocalAPIServer() as server, recording(path, api_key="sk-secret", base_url=server.base_url) as client:
+        recorded = client.beta.assistants.retrieve("asst_1")
+
+    assert "sk-secret" not in path.read_text()
+    [interaction] = json.loads(path.read_text())["interactions"]
+    assert interaction["request"] == {"method": "GET", "path": "/v1/assistants/asst_1", "body": None}
+    assert interaction["response"]["headers"] == {"content-type": "application/json"}
+
+    client = replay_client(path, base_url="http://replay.invalid/v1")
+    assert client.beta.assistants.retrieve("asst_1") == recorded
@@ -0,0 +1,47 @@
+"""Tests of the shared OpenAI clients."""
+
+import os
+
+import pytest
+from fakes import LocalAPIServer
+from typerassistant import clients
+from typerassistant.assistant import Assistant
+from typerassistant.clients import ClientSettings, configure_clients, shared_client
+
+
+@pytest.fixture
+def server(monkeypatch):
+    with LocalAPIServer() as server:
+        monkeypatch.setenv("OPENAI_API_KEY", "test key")
+        monkeypatch.setenv("OPENAI_BASE_URL", server.base_url)
+        configure_clients(ClientSettings(max_retries=0))
+        yield server
+    configure_clients(ClientSettings())
+
+
+def test_assistants_share_a_client(server):
+    assert Assistant("a").client is Assistant("b").client is shared_client()
+
+
+def test_shared_client_keeps_connections_alive(server):
+    for i in range(5):
+        assert Assistant.from_id(f"asst_{i}").assistant.id == f"asst_{i}"
+    assert server.connections == 1
+
+
+def test_configure_clients_replaces_shared_client(server):
+    before = shared_client()
+    configure_clients(ClientSettings(max_connections=1, max_retries=0))
+    after = shared_client()
+    assert after is not before
+    assert after._client._transport._pool._max_connections == 1
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="There is no fork() on this platform")
+def test_fork_forgets_shared_client(server):
+    shared_client()
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0 if clients._client is None else 1)
+    assert os.waitpid(pid, 0)[1] == 0
+    assert clients._client is not None
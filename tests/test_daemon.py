@@ -0,0 +1,136 @@
+"""Tests of the local assistant daemon."""
+
+import os
+import threading
+import time
+
+import pytest
+import typer
+import typerassistant.daemon
+from fakes import FakeOpenAI, make_app
+from typer.testing import CliRunner
+from typerassistant import register_assistant
+from typerassistant.daemon import AssistantDaemon, app_sources, ask_daemon, daemon_events, socket_path
+from typerassistant.polling import PollingStrategy
+from typerassistant.typer import TyperAssistant
+
+NO_WAIT = PollingStrategy(initial=0, maximum=0, jitter=0)
+
+
+@pytest.fixture
+def app():
+    return make_app(2)
+
+
+@pytest.fixture
+def client():
+    return FakeOpenAI(tool_calls=[[("synthetic.command_0", {"target": "x"})]], reply="All done")
+
+
+@pytest.fixture
+def daemon(app, client, tmp_path):
+    return AssistantDaemon(
+        lambda: TyperAssistant(app=app, client=client, polling=NO_WAIT), tmp_path / "ask.sock", idle_timeout=1
+    )
+
+
+def test_events(daemon, capsys):
+    daemon.warm()
+    messages = list(daemon.events({"query": "Do something"}))
+    assert messages[0] == {"event": "status", "status": "queued"}
+    assert {"event": "tool_calls", "names": ["synthetic.command_0"]} in messages
+    assert {
+        "event": "tool_outputs",
+        "outputs": [{"title": "synthetic.command_0('target': 'x')", "output": "x 1 False"}],
+    } in messages
+    assert messages[-1] == {"event": "text", "text": "All done"}
+
+
+def test_events_report_errors(daemon):
+    daemon.warm()
+    daemon.assistant.client.tool_calls = [[("missing", {})]]
+    messages = list(daemon.events({"query": "Do something"}))
+    assert messages[-1] == {"event": "error", "error": "ValueError: Unknown function missing"}
+
+
+def test_daemon_serves_until_idle(daemon, mocker):
+    started = mocker.spy(typerassistant.daemon, "start_daemon")
+    for _ in range(2):
+        messages = list(daemon_events(daemon, {"query": "Do something"}))
+        assert messages[-1] == {"event": "text", "text": "All done"}
+    assert started.call_count == 1
+    assert daemon.path.exists()
+
+    deadline = time.monotonic() + 10
+    while daemon.path.exists() and time.monotonic() < deadline:
+        time.sleep(0.1)
+    assert not daemon.path.exists()
+
+
+def test_ask_command_uses_daemon(app, client, tmp_path, mocker):
+    mocker.patch.object(typerassistant.daemon, "socket_path", return_value=tmp_path / "ask.sock")
+    register_assistant(app, client=client, use_registry=False, daemon=True, daemon_idle_timeout=1)
+    result = CliRunner().invoke(app, ["ask", "Do something"])
+    assert result.exit_code == 0, result.output
+    assert "x 1 False" in result.output
+    assert result.output.endswith("All done\n")
+
+
+def test_commands_run_in_the_callers_environment(client, tmp_path, monkeypatch):
+    app = typer.Typer(name="env")
+
+    @app.command()
+    def where():
+        print(os.getcwd(), os.environ.get("ASK_TEST"))
+
+    client.tool_calls = [[("env.where", {})]]
+    daemon = AssistantDaemon(lambda: TyperAssistant(app=app, client=client, polling=NO_WAIT), tmp_path / "ask.sock")
+    daemon.warm()
+    cwd = os.getcwd()
+    monkeypatch.setenv("ASK_TEST", "daemon")
+    request = {"query": "Where?", "cwd": str(tmp_path), "env": {"ASK_TEST": "caller"}, "umask": 0o022}
+    [outputs] = [message for message in daemon.events(request) if message["event"] == "tool_outputs"]
+    assert outputs["outputs"][0]["output"] == f"{tmp_path} caller"
+    assert os.getcwd() == cwd
+    assert os.environ["ASK_TEST"] == "daemon"
+
+
+def test_socket_path_follows_app_sources(app, tmp_path):
+    assert [os.path.basename(source) for source in app_sources(app)] == ["fakes.py"]
+    source = tmp_path / "commands.py"
+    source.write_text("")
+    before = socket_path("app", [str(source)])
+    os.utime(source, ns=(0, 0))
+    assert socket_path("app", [str(source)]) != before
+
+
+def test_socket_path_follows_client_variables(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "first key")
+    first = socket_path("app")
+    monkeypatch.setenv("OPENAI_API_KEY", "second key")
+    assert socket_path("app") != first
+    assert "key" not in str(socket_path("app"))
+
+
+def test_racing_daemons_leave_one_socket(daemon, app, client):
+    daemon.warm()
+    ready = threading.Event()
+    serving = threading.Thread(target=daemon.serve, args=(ready.set,))
+    serving.start()
+    assert ready.wait(5)
+
+    # A daemon started while another is listening leaves the asks to it
+    loser = AssistantDaemon(lambda: TyperAssistant(app=app, client=client, polling=NO_WAIT), daemon.path)
+    loser.warm()
+    loser_ready = threading.Event()
+    loser.serve(loser_ready.set)
+    assert loser_ready.is_set()
+    messages = list(ask_daemon(daemon.path, {"query": "Do something"}))
+    assert messages[-1] == {"event": "text", "text": "All done"}
+
+    # A daemon doesn't remove a socket which has since been replaced
+    daemon.path.unlink()
+    daemon.path.write_text("")
+    serving.join(10)
+    assert not serving.is_alive()
+    assert daemon.path.exists()
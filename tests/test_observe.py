@@ -0,0 +1,144 @@
+"""Tests for timing spans and observers, using the fake OpenAI client."""
+
+import asyncio
+
+import pytest
+from fakes import AsyncFakeOpenAI, FakeOpenAI, make_app
+from typerassistant.aio import AsyncTyperAssistant
+from typerassistant.observe import CallbackObserver, Observer, OpenTelemetryObserver, SpanRecorder, span
+from typerassistant.polling import PollingStrategy
+from typerassistant.typer import TyperAssistant
+
+NO_WAIT = PollingStrategy(initial=0, maximum=0, jitter=0)
+
+
+@pytest.fixture
+def app():
+    return make_app(2)
+
+
+@pytest.fixture
+def client():
+    return FakeOpenAI(tool_calls=[[("command_0", {"target": "x"}), ("command_1", {"target": "y"})]], reply="Hi")
+
+
+def names(spans) -> list[str]:
+    return [s.name for s in spans]
+
+
+def test_span_nesting():
+    recorder = SpanRecorder()
+    with span(recorder, "outer") as outer:
+        with span(recorder, "inner", colour="blue") as inner:
+            pass
+    assert recorder.spans == [inner, outer]
+    assert inner.parent is outer and outer.parent is None
+    assert inner.attributes == {"colour": "blue"}
+    assert outer.duration >= inner.duration >= 0
+
+
+def test_span_records_errors():
+    seen = []
+    with pytest.raises(ValueError):
+        with span(CallbackObserver(seen.append), "failing"):
+            raise ValueError("nope")
+    assert isinstance(seen[0].error, ValueError)
+
+
+class FakeOtelSpan:
+    def __init__(self, name, context, attributes):
+        self.name, self.context, self.attributes = name, context, attributes
+        self.exceptions, self.status, self.ended = [], None, False
+
+    def record_exception(self, exception):
+        self.exceptions.append(exception)
+
+    def set_status(self, status):
+        self.status = status
+
+    def end(self):
+        self.ended = True
+
+
+class FakeTracer:
+    def __init__(self):
+        self.spans = []
+
+    def start_span(self, name, context=None, attributes=None):
+        self.spans.append(FakeOtelSpan(name, context, attributes))
+        return self.spans[-1]
+
+
+def test_opentelemetry_observer():
+    trace = pytest.importorskip("opentelemetry.trace")
+    tracer = FakeTracer()
+    observer = OpenTelemetryObserver(tracer)
+    with pytest.raises(ValueError):
+        with span(observer, "outer", count=2):
+            with span(observer, "inner", path=["a"]):
+                raise ValueError("nope")
+
+    outer, inner = tracer.spans
+    assert (outer.name, inner.name) == ("typerassistant.outer", "typerassistant.inner")
+    assert outer.attributes == {"count": 2}
+    assert inner.attributes == {"path": "['a']"}
+    assert outer.context is None
+    # The child is started in a context holding its parent
+    assert list(inner.context.values()) == [outer]
+    for otel_span in (outer, inner):
+        assert otel_span.ended
+        assert otel_span.status.status_code == trace.StatusCode.ERROR
+        assert [str(e) for e in otel_span.exceptions] == ["nope"]
+    assert observer.otel_spans == {}
+
+
+@pytest.mark.parametrize("tool_workers", [1, 2])
+def test_ask_spans(app, client, tool_workers, capsys):
+    recorder = SpanRecorder()
+    assistant = TyperAssistant(app=app, client=client, polling=NO_WAIT, observer=recorder, tool_workers=tool_workers)
+    assert assistant.ask("Hello?", confirm_commands=False) == "Hi"
+    capsys.readouterr()
+
+    by_name = {s.name: s for s in recorder.spans}
+    ask, run = by_name["ask"], by_name["run"]
+    assert recorder.spans[-1] is ask
+    for name in ["make_assistant", "thread.create", "message.create", "run", "messages.list"]:
+        assert by_name[name].parent is ask
+    for name in ["run.create", "run.status", "run.sleep", "run.retrieve", "tool_calls", "run.submit_tool_outputs"]:
+        assert by_name[name].parent is run
+    tool_calls = [s for s in recorder.spans if s.name == "tool_call"]
+    assert sorted(s.attributes["function"] for s in tool_calls) == ["synthetic.command_0", "synthetic.command_1"]
+    assert all(s.parent is by_name["tool_calls"] for s in tool_calls)
+
+    statuses = [s.attributes["status"] for s in recorder.spans if s.name == "run.status"]
+    assert statuses == ["queued", "in_progress", "requires_action", "in_progress", "completed"]
+    assert all(s.end is not None and s.error is None for s in recorder.spans)
+
+
+def test_failed_run_spans(app, capsys):
+    recorder = SpanRecorder()
+    client = FakeOpenAI(tool_calls=[[("missing", {})]])
+    assistant = TyperAssistant(app=app, client=client, polling=NO_WAIT, observer=recorder)
+    with pytest.raises(ValueError):
+        assistant.ask("Hello?", confirm_commands=False)
+    by_name = {s.name: s for s in recorder.spans}
+    assert isinstance(by_name["run"].error, ValueError)
+    assert isinstance(by_name["ask"].error, ValueError)
+
+
+def test_no_observer_makes_no_spans(app, client, mocker, capsys):
+    started = mocker.patch.object(Observer, "span_started")
+    TyperAssistant(app=app, client=client, polling=NO_WAIT).ask("Hello?", confirm_commands=False)
+    started.assert_not_called()
+
+
+def test_async_ask_spans(app, capsys):
+    recorder = SpanRecorder()
+    client = AsyncFakeOpenAI(tool_calls=[[("command_0", {"target": "x"})]], reply="Hi")
+    assistant = AsyncTyperAssistant(app=app, client=client, polling=NO_WAIT, observer=recorder)
+    assert asyncio.run(assistant.ask("Hello?", confirm_commands=False)) == "Hi"
+
+    by_name = {s.name: s for s in recorder.spans}
+    assert by_name["run"].parent is by_name["ask"]
+    assert by_name["tool_calls"].parent is by_name["run"]
+    assert by_name["tool_call"].parent is by_name["tool_calls"]
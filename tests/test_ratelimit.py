@@ -0,0 +1,44 @@
+"""Tests of the token bucket rate limiter."""
+
+import asyncio
+import time
+
+import pytest
+from typerassistant.ratelimit import TokenBucket
+
+
+def test_bucket_paces_acquisitions():
+    bucket = TokenBucket(rate=50, per=1)
+    start = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    # The first token is free, the other five are 20ms apart.
+    assert time.monotonic() - start >= 0.1
+
+
+def test_bucket_allows_bursts(mocker):
+    sleep = mocker.patch("typerassistant.ratelimit.time.sleep")
+    bucket = TokenBucket(rate=1, per=1, capacity=5)
+    for _ in range(5):
+        bucket.acquire()
+    sleep.assert_not_called()
+
+
+def test_bucket_paces_async_acquisitions():
+    bucket = TokenBucket(rate=50, per=1)
+
+    async def acquire():
+        await asyncio.gather(*(bucket.acquire_async() for _ in range(6)))
+
+    start = time.monotonic()
+    asyncio.run(acquire())
+    assert time.monotonic() - start >= 0.1
+
+
+def test_bucket_rejects_bad_rates():
+    with pytest.raises(ValueError):
+        TokenBucket(rate=0)
+    with pytest.raises(ValueError):
+        TokenBucket(rate=1, per=-1)
+    with pytest.raises(ValueError):
+        TokenBucket(rate=1, capacity=0.5)
@@ -0,0 +1,228 @@
+"""Tests of retrying failed requests, and of the circuit breaker."""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import httpx
+import openai
+import pytest
+from fakes import AsyncFakeOpenAI, FakeOpenAI, make_app
+from typerassistant.aio import AsyncTyperAssistant
+from typerassistant.polling import Deadline, PollingStrategy
+from typerassistant.resilience import CircuitBreaker, CircuitOpenError, Resilience, RetryPolicy, retryable
+from typerassistant.typer import TyperAssistant
+
+NO_WAIT = RetryPolicy(initial=0, jitter=0)
+
+
+def api_error(status: int, headers: Optional[dict[str, str]] = None) -> openai.APIStatusError:
+    response = httpx.Response(status, headers=headers, request=httpx.Request("GET", "https://api.openai.com/v1"))
+    match status:
+        case 429:
+            return openai.RateLimitError("Rate limited", response=response, body=None)
+        case 400:
+            return openai.BadRequestError("Bad request", response=response, body=None)
+        case _:
+            return openai.InternalServerError("Server error", response=response, body=None)
+
+
+def flaky(errors: list[Exception], result="ok"):
+    """Returns a request which raises each of errors in turn, then returns result."""
+    errors = list(errors)
+
+    def request(*args, **kwargs):
+        if errors:
+            raise errors.pop(0)
+        return result
+
+    return request
+
+
+def test_retryable():
+    assert retryable(api_error(429))
+    assert retryable(api_error(500))
+    assert retryable(openai.APIConnectionError(request=httpx.Request("GET", "https://api.openai.com/v1")))
+    assert not retryable(api_error(400))
+    assert not retryable(ValueError())
+
+
+def test_retries_transient_errors(mocker):
+    sleep = mocker.patch("typerassistant.resilience.time.sleep")
+    resilience = Resilience(retry=RetryPolicy(initial=1, factor=2, jitter=0), breaker=CircuitBreaker())
+    assert resilience.call("runs.retrieve", flaky([api_error(500), api_error(502)])) == "ok"
+    assert [call.args[0] for call in sleep.call_args_list] == [1, 2]
+    assert resilience.stats["requests"] == 3
+    assert resilience.stats["runs.retrieve.failures"] == 2
+    assert resilience.stats["runs.retrieve.retries"] == 2
+
+
+def test_waits_for_retry_after(mocker):
+    sleep = mocker.patch("typerassistant.resilience.time.sleep")
+    resilience = Resilience(retry=RetryPolicy(initial=1, jitter=0, maximum_retry_after=60), breaker=None)
+    errors = [api_error(429, {"retry-after": "7"}), api_error(429, {"retry-after-ms": "250"})]
+    errors.append(api_error(429, {"retry-after": "3600"}))
+    assert resilience.call("runs.create", flaky(errors)) == "ok"
+    assert [call.args[0] for call in sleep.call_args_list] == [7, 0.25, 60]
+
+
+def test_gives_up_after_attempts():
+    resilience = Resilience(retry=RetryPolicy(attempts=3, initial=0, jitter=0), breaker=None)
+    with pytest.raises(openai.InternalServerError):
+        resilience.call("threads.create", flaky([api_error(500)] * 3))
+    assert resilience.stats["requests"] == 3
+    assert resilience.stats["retries"] == 2
+
+
+def test_client_errors_are_not_retried():
+    breaker = CircuitBreaker(threshold=1)
+    resilience = Resilience(retry=NO_WAIT, breaker=breaker)
+    with pytest.raises(openai.BadRequestError):
+        resilience.call("runs.create", flaky([api_error(400)]))
+    assert resilience.stats["requests"] == 1
+    assert not breaker.open
+
+
+def test_circuit_breaker(mocker):
+    now = mocker.patch("typerassistant.resilience.time.monotonic", return_value=0.0)
+    breaker = CircuitBreaker(threshold=2, cooldown=30)
+    resilience = Resilience(retry=RetryPolicy(attempts=1), breaker=breaker)
+    for _ in range(2):
+        with pytest.raises(openai.InternalServerError):
+            resilience.call("runs.retrieve", flaky([api_error(503)]))
+    assert breaker.open
+
+    # While open, requests aren't made at all
+    request = mocker.Mock()
+    with pytest.raises(CircuitOpenError):
+        resilience.call("runs.retrieve", request)
+    request.assert_not_called()
+    assert resilience.stats["short_circuits"] == 1
+
+    # After the cooldown a single trial is allowed, and its failure opens the breaker again
+    now.return_value = 31.0
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.failed()
+    assert not breaker.allow()
+
+    # A successful trial closes it
+    now.return_value = 62.0
+    assert resilience.call("runs.retrieve", flaky([])) == "ok"
+    assert not breaker.open
+
+
+def test_interrupted_trial_is_released(mocker):
+    now = mocker.patch("typerassistant.resilience.time.monotonic", return_value=0.0)
+    breaker = CircuitBreaker(threshold=1, cooldown=30)
+    resilience = Resilience(retry=RetryPolicy(attempts=1), breaker=breaker)
+    with pytest.raises(openai.InternalServerError):
+        resilience.call("runs.retrieve", flaky([api_error(500)]))
+
+    now.return_value = 31.0
+    with pytest.raises(KeyboardInterrupt):
+        resilience.call("runs.retrieve", flaky([KeyboardInterrupt()]))
+    assert resilience.call("runs.retrieve", flaky([])) == "ok"
+    assert not breaker.open
+
+
+def test_cancelled_trial_is_released():
+    # asyncio keeps time with time.monotonic too, so rather than mocking it, the breaker has no cooldown.
+    breaker = CircuitBreaker(threshold=1, cooldown=0)
+    resilience = Resilience(retry=RetryPolicy(attempts=1), breaker=breaker)
+
+    async def hang():
+        await asyncio.sleep(10)
+
+    async def ok():
+        return "ok"
+
+    async def main():
+        with pytest.raises(openai.InternalServerError):
+            await resilience.acall("runs.retrieve", flaky([api_error(500)]))
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(resilience.acall("runs.retrieve", hang), 0.01)
+        return await resilience.acall("runs.retrieve", ok)
+
+    assert asyncio.run(main()) == "ok"
+    assert not breaker.open
+
+
+def test_retries_stop_at_deadline(mocker):
+    sleep = mocker.patch("typerassistant.resilience.time.sleep")
+    resilience = Resilience(retry=RetryPolicy(initial=1, jitter=0), breaker=None)
+    with pytest.raises(openai.RateLimitError):
+        resilience.call("runs.cancel", flaky([api_error(429, {"retry-after": "30"})]), deadline=Deadline(10))
+    sleep.assert_not_called()
+    assert resilience.call("runs.cancel", flaky([api_error(500)]), deadline=Deadline(10)) == "ok"
+    sleep.assert_called_once_with(1)
+
+
+def test_cancel_run_keeps_to_its_timeout(mocker):
+    client = FakeOpenAI()
+    client.beta.threads.runs.cancel = flaky([api_error(429, {"retry-after": "60"})] * 4)
+    assistant = TyperAssistant(app=make_app(2), client=client, resilience=Resilience(breaker=None))
+    run = mocker.Mock(id="run_1", status="in_progress")
+    start = time.monotonic()
+    assert assistant.cancel_run(mocker.Mock(id="thread_1"), run, timeout=1) is run
+    assert time.monotonic() - start < 1
+
+
+def test_default_clients_leave_retrying_to_assistants(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test key")
+    assert AsyncTyperAssistant(app=make_app(2)).client.max_retries == 0
+    assert TyperAssistant(app=make_app(2)).client.max_retries == 0
+
+
+def test_stats_count_concurrent_requests():
+    resilience = Resilience(retry=NO_WAIT, breaker=None)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda _: resilience.call("runs.retrieve", flaky([api_error(500)])), range(2000)))
+    assert resilience.stats["requests"] == resilience.stats["runs.retrieve.requests"] == 4000
+    assert resilience.stats["retries"] == 2000
+
+
+def test_breaker_stops_retries():
+    resilience = Resilience(retry=NO_WAIT, breaker=CircuitBreaker(threshold=2))
+    with pytest.raises(openai.InternalServerError):
+        resilience.call("runs.retrieve", flaky([api_error(500)] * 3))
+    assert resilience.stats["requests"] == 2
+
+
+def test_ask_survives_transient_errors():
+    client = FakeOpenAI(reply="Done")
+    retrieve = client.beta.threads.runs.retrieve
+    errors = [api_error(429), api_error(500)]
+
+    def flaky_retrieve(*args, **kwargs):
+        if errors:
+            raise errors.pop()
+        return retrieve(*args, **kwargs)
+
+    client.beta.threads.runs.retrieve = flaky_retrieve
+    resilience = Resilience(retry=NO_WAIT, breaker=CircuitBreaker())
+    assistant = TyperAssistant(
+        app=make_app(2), client=client, polling=PollingStrategy(initial=0, jitter=0), resilience=resilience
+    )
+    assert assistant.ask("Hello", use_commands=False) == "Done"
+    assert resilience.stats["runs.retrieve.retries"] == 2
+
+
+def test_async_ask_survives_transient_errors():
+    client = AsyncFakeOpenAI(reply="Done")
+    create = client.beta.threads.runs.create
+    errors = [api_error(500)]
+
+    async def flaky_create(*args, **kwargs):
+        if errors:
+            raise errors.pop()
+        return await create(*args, **kwargs)
+
+    client.beta.threads.runs.create = flaky_create
+    resilience = Resilience(retry=NO_WAIT, breaker=CircuitBreaker())
+    assistant = AsyncTyperAssistant(
+        app=make_app(2), client=client, polling=PollingStrategy(initial=0, jitter=0), resilience=resilience
+    )
+    assert asyncio.run(assistant.ask("Hello", use_commands=False)) == "Done"
+    assert resilience.stats["runs.create.retries"] == 1
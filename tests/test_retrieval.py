@@ -0,0 +1,73 @@
+"""Tests of offering each run only the tools most relevant to its query."""
+
+import pytest
+import typer
+from fakes import FakeOpenAI, make_app
+from typerassistant.polling import PollingStrategy
+from typerassistant.retrieval import ToolIndex
+from typerassistant.typer import TyperAssistant, typerfunc
+
+
+@pytest.fixture
+def app():
+    app = typer.Typer(name="ops")
+    cats = typer.Typer()
+    db = typer.Typer()
+
+    @cats.command("list")
+    def list_cats():
+        """List every Jellicle cat."""
+
+    @cats.command()
+    def ascend(cat: str = typer.Option(..., help="The cat to send to the Heaviside Layer")):
+        """Send a cat up, up, up past the Russell Hotel."""
+
+    @db.command()
+    def backup(path: str = typer.Option(..., help="Where to write the dump")):
+        """Back up the database to a file."""
+
+    @db.command()
+    def restore(path: str = typer.Option(..., help="The dump to restore from")):
+        """Restore the database from a backup file."""
+
+    app.add_typer(cats, name="cats")
+    app.add_typer(db, name="db")
+    return app
+
+
+def names(functions) -> list[str]:
+    return [func.name for func in functions]
+
+
+def test_search(app):
+    index = ToolIndex(typerfunc(app))
+    assert names(index.search("Which cats are there?", 1)) == ["ops.cats.list"]
+    assert names(index.search("Send Macavity to the Heaviside Layer", 1)) == ["ops.cats.ascend"]
+    assert set(names(index.search("dump the database", 2))) == {"ops.db.backup", "ops.db.restore"}
+    assert names(index.search("backup", 1)) == ["ops.db.backup"]
+
+
+def test_search_always_returns_k(app):
+    index = ToolIndex(typerfunc(app))
+    assert names(index.search("nothing relevant", 2)) == ["ops.cats.list", "ops.cats.ascend"]
+    assert len(index.search("cats", 10)) == 4
+
+
+def test_runs_are_offered_relevant_tools(app, mocker):
+    client = FakeOpenAI()
+    create = mocker.spy(client.beta.threads.runs, "create")
+    assistant = TyperAssistant(app=app, client=client, polling=PollingStrategy(initial=0, jitter=0), tool_limit=2)
+    assistant.ask("Restore the database from last night's dump", confirm_commands=False)
+    tools = create.call_args.kwargs["tools"]
+    assert [tool["function"]["name"] for tool in tools][0] == "ops.db.restore"
+    assert len(tools) == 2
+
+
+def test_small_apps_are_offered_every_tool(mocker):
+    client = FakeOpenAI()
+    create = mocker.spy(client.beta.threads.runs, "create")
+    assistant = TyperAssistant(
+        app=make_app(3), client=client, polling=PollingStrategy(initial=0, jitter=0), tool_limit=5
+    )
+    assistant.ask("Hello", confirm_commands=False)
+    assert "tools" not in create.call_args.kwargs
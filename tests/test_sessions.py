@@ -0,0 +1,49 @@
+"""Tests of the local session store."""
+
+import time
+
+import pytest
+from typerassistant.sessions import SessionStore
+
+
+@pytest.fixture
+def sessions(tmp_path):
+    return SessionStore(path=tmp_path / "sessions.json", ttl=60, max_sessions=3)
+
+
+def test_round_trip(sessions):
+    key = sessions.key("app", "work", user="alice")
+    assert sessions.get(key) is None
+    sessions.set(key, "thread 1")
+    assert sessions.get(key) == "thread 1"
+    assert sessions.get(sessions.key("app", "work", user="bob")) is None
+    assert sessions.get(sessions.key("other app", "work", user="alice")) is None
+
+
+def test_expiry(sessions, monkeypatch):
+    sessions.set("old", "thread 1")
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert sessions.get("old") is None
+    sessions.set("new", "thread 2")
+    assert "old" not in sessions.store.load()
+
+
+def test_max_sessions_evicts_least_recently_used(sessions, monkeypatch):
+    now = time.time()
+    for i in range(3):
+        monkeypatch.setattr(time, "time", lambda i=i: now + i)
+        sessions.set(f"session {i}", f"thread {i}")
+    monkeypatch.setattr(time, "time", lambda: now + 3)
+    sessions.set("session 0", "thread 0")  # session 0 is now the most recently used
+    monkeypatch.setattr(time, "time", lambda: now + 4)
+    sessions.set("session 3", "thread 3")
+
+    assert sessions.get("session 1") is None
+    assert [sessions.get(f"session {i}") for i in (0, 2, 3)] == ["thread 0", "thread 2", "thread 3"]
+
+
+def test_no_sessions_are_kept_with_max_sessions_0(tmp_path):
+    sessions = SessionStore(path=tmp_path / "sessions.json", max_sessions=0)
+    sessions.set("key", "thread 1")
+    assert sessions.get("key") is None
@@ -0,0 +1,71 @@
+"""Tests of function specs and the function catalogue."""
+
+import time
+
+import pytest
+from typerassistant.spec import FunctionCatalogue, FunctionSpec
+
+
+def make_catalogue(names: list[str]) -> FunctionCatalogue:
+    return FunctionCatalogue([FunctionSpec(name=name, description="", parameters=[], action=print) for name in names])
+
+
+@pytest.fixture
+def catalogue() -> FunctionCatalogue:
+    return make_catalogue(
+        [
+            "/home/user/example_3.py.cats.list",
+            "/home/user/example_3.py.cats.ascend",
+            "/home/user/example_3.py.dogs.list",
+            "/home/user/example_3.py.introduce",
+        ]
+    )
+
+
+@pytest.mark.parametrize(
+    "name,expected",
+    [
+        ("/home/user/example_3.py.cats.list", "/home/user/example_3.py.cats.list"),
+        ("example_3.py.cats.list", "/home/user/example_3.py.cats.list"),
+        ("cats.list", "/home/user/example_3.py.cats.list"),
+        ("ascend", "/home/user/example_3.py.cats.ascend"),
+        ("py.introduce", "/home/user/example_3.py.introduce"),
+    ],
+)
+def test_resolve(catalogue, name, expected):
+    assert catalogue.resolve(name).name == expected
+
+
+def test_resolve_unknown(catalogue):
+    with pytest.raises(ValueError, match="Unknown function"):
+        catalogue.resolve("birds.list")
+    # Suffixes only match whole segments
+    with pytest.raises(ValueError, match="Unknown function"):
+        catalogue.resolve("scend")
+
+
+def test_resolve_ambiguous(catalogue):
+    with pytest.raises(ValueError, match="Ambiguous function list") as excinfo:
+        catalogue.resolve("list")
+    assert "cats.list" in str(excinfo.value)
+    assert "dogs.list" in str(excinfo.value)
+
+
+@pytest.mark.parametrize("size", [1_000, 5_000])
+def test_resolve_scales(size):
+    """Suffix lookups should not slow down with catalogue size, unlike the linear endswith() scan they replace."""
+    names = [f"/usr/bin/app.group{i // 50}.command{i}" for i in range(size)]
+    catalogue = make_catalogue(names)
+    queries = [f"group{i // 50}.command{i}" for i in range(0, size, size // 100)]
+
+    start = time.perf_counter()
+    for query in queries:
+        catalogue.resolve(query)
+    indexed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for query in queries:
+        next(func for func in catalogue.functions if func.name.endswith(query))
+    linear = time.perf_counter() - start
+
+    assert indexed < linear / 5
@@ -0,0 +1,51 @@
+"""Startup cost of CLIs that register an assistant.
+
+Every command of an app using register_assistant pays for importing typerassistant, so these tests run a fresh
+interpreter with `python -X importtime` and check that nothing heavy is imported until the ask command runs.
+"""
+import subprocess
+import sys
+
+import pytest
+
+# Modules that must not be imported just to define or --help a CLI.
+HEAVY_MODULES = ("openai", "httpx", "typerassistant.assistant", "typerassistant.spec")
+
+APP = """
+import typer
+from typerassistant import register_assistant
+
+app = typer.Typer()
+register_assistant(app)
+
+@app.command()
+def hello():
+    print("hello")
+
+app({args!r})
+"""
+
+
+def import_times(args: list[str]) -> dict[str, int]:
+    """Runs the test app with args, returning the cumulative import time of each module, in microseconds."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", APP.format(args=args)],
+        capture_output=True,
+        text=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line.removeprefix("import time:").split("|")
+        times[module.strip()] = int(cumulative)
+    assert "typerassistant" in times, result.stderr
+    return times
+
+
+@pytest.mark.parametrize("args", [["hello"], ["--help"], ["ask", "--help"]])
+def test_no_heavy_imports(args):
+    times = import_times(args)
+    heavy = [module for module in HEAVY_MODULES if module in times]
+    assert not heavy, f"{' '.join(args)} imported {heavy}"
+    sys.stderr.write(f"typerassistant import time: {times['typerassistant'] / 1000:.1f}ms\n")
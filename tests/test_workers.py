@@ -0,0 +1,107 @@
+"""Tests of running function calls in worker processes."""
+
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from typerassistant.spec import FunctionCall, FunctionSpec
+from typerassistant.workers import WorkerPool
+
+
+def say(text: str):
+    print(text)
+
+
+def shell_echo(text: str):
+    subprocess.run(["echo", text], check=True)
+
+
+def raw_write(text: str):
+    os.write(1, text.encode())
+
+
+def pid():
+    print(os.getpid())
+
+
+def parent_pid():
+    print(os.getppid())
+
+
+def sleep(seconds: str):
+    time.sleep(float(seconds))
+    print("woke up")
+
+
+def exit_with(code: str):
+    print("exiting")
+    sys.exit(int(code))
+
+
+def crash():
+    os._exit(3)
+
+
+def fail():
+    raise ValueError("bad input")
+
+
+FUNCTIONS = [
+    FunctionSpec(name=func.__name__, description="", parameters=[], action=func)
+    for func in (say, shell_echo, raw_write, pid, parent_pid, sleep, exit_with, crash, fail)
+]
+
+
+def call(name: str, **parameters) -> FunctionCall:
+    function = next(func for func in FUNCTIONS if func.name == name)
+    return FunctionCall(call_id=f"call {name}", function=function, parameters=parameters)
+
+
+@pytest.fixture
+def pool():
+    with WorkerPool(FUNCTIONS, size=1, timeout=1, max_calls=3) as pool:
+        yield pool
+
+
+@pytest.mark.parametrize("name", ["say", "shell_echo", "raw_write"])
+def test_output_is_captured_at_the_fd_level(pool, name):
+    assert pool.run(call(name, text="hello")) == "hello"
+
+
+def test_workers_are_reused_then_recycled(pool):
+    pids = [pool.run(call("pid")) for _ in range(4)]
+    assert pids[0] == pids[1] == pids[2] != pids[3]
+    assert str(os.getpid()) not in pids
+
+
+def test_timeout_kills_worker(pool):
+    start = time.monotonic()
+    assert pool.run(call("sleep", seconds="10")) == "[sleep timed out after 1 seconds]"
+    assert time.monotonic() - start < 2
+    assert pool.run(call("say", text="still working")) == "still working"
+
+
+def test_failures_are_reported(pool):
+    assert pool.run(call("exit_with", code="2")) == "exiting\n[exit_with exited with status 2]"
+    assert pool.run(call("crash")) == "[crash crashed with exit code 3]"
+    output = pool.run(call("fail"))
+    assert output.startswith("[fail failed]")
+    assert "ValueError: bad input" in output
+    assert pool.run(call("say", text="still working")) == "still working"
+
+
+def test_replacements_are_forked_by_the_spawner(pool):
+    # Workers retired while calls run in threads are replaced without forking this (multithreaded) process
+    with ThreadPoolExecutor(max_workers=4) as threads:
+        parents = set(threads.map(lambda _: pool.run(call("parent_pid")), range(10)))
+    assert parents == {str(pool.spawner.process.pid)}
+
+
+def test_unknown_functions_are_reported(pool):
+    function = FunctionSpec(name="late", description="", parameters=[], action=say)
+    output = pool.run(FunctionCall(call_id="call late", function=function, parameters={"text": "hello"}))
+    assert output == "[late is not available: it was registered after the worker pool was made]"
+    assert pool.run(call("say", text="still working")) == "still working"